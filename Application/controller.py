@@ -3,8 +3,10 @@ from Application.processor import Processor
 from P1System.p1_interface import P1Interface
 from SMASystem.sma_interface import SMAInterface
 from ZWaveSystem.zwave_interface import ZWaveInterface
+from ZWaveSystem.routing_table import ZWaveRoutingTable
 from DataHolder.data_holder import DataHolder
 from WebServer.threaded_server import ThreadedServer
+from WebServer.async_server import AsyncServer
 from Scheduler.scheduler import Scheduler
 
 
@@ -26,8 +28,13 @@ class Controller:
         self.zwave_interface = ZWaveInterface()
         self.data_holder = DataHolder()
         self.processor = Processor(self.p1_interface, self.sma_interface, self.zwave_interface, self.data_holder)
-        self.zwave_interface.register(Settings().get_zwave_subscriptions(), post_sample_CB=self.processor.zwaveSampleAcquired)
-        self.webServer = ThreadedServer(self.processor)
+        self.zwave_interface.register(ZWaveRoutingTable.from_settings(),
+                                      post_samples_CB=self.processor.zwaveSamplesAcquired,
+                                      new_route_CB=self.processor.zwave_route_created)
         self.scheduler = Scheduler(self.processor)
+        if Settings().webserver_type() == 'asyncio':
+            self.webServer = AsyncServer(self.processor, self.scheduler)
+        else:
+            self.webServer = ThreadedServer(self.processor, self.scheduler)
         # NB in onderstaande regel blijft het proces eeuwig hangen, hierna geen acties meer doen dus
         self.p1_interface.start(post_sample_CB=self.processor.p1SampleAcquired)
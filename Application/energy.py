@@ -0,0 +1,69 @@
+import logging
+import time
+from datetime import datetime
+from typing import List, Dict, Optional
+from DataHolder.data_item import DataItem
+from DataHolder.energy_store import EnergyStore
+
+
+class EnergyIntegrator:
+    """
+    Integrates power signals to energy with the trapezoidal rule, sample by sample. The energy of an interval is
+    counted on the day of its end and the tariff at its start.
+    An interval longer than max_gap_seconds is a gap, handled by the gap rule:
+    - skip: the gap adds no energy
+    - hold: the power before the gap is held during the gap
+    - linear: the power is interpolated over the gap, as for any other interval
+    """
+
+    c_GAP_RULES = ('skip', 'hold', 'linear')
+    c_UNIT_FACTORS = {'W': 1e-3, 'kW': 1.0}  # to kW
+
+    def __init__(self, energy_store: EnergyStore, signals: List[str], max_gap_seconds: float, gap_rule: str,
+                 flush_seconds: float):
+        if gap_rule not in self.c_GAP_RULES:
+            raise ValueError(f"Energy gap rule {gap_rule} not in {self.c_GAP_RULES}")
+        self.energy_store = energy_store
+        self.signals = signals
+        self.max_gap_seconds = max_gap_seconds
+        self.gap_rule = gap_rule
+        self.flush_seconds = flush_seconds
+        self.prev_timestamp: Optional[float] = None
+        self.prev_tariff = 0
+        self.prev_power: Dict[str, float] = {}  # kW
+        self.num_gaps = 0
+        self.last_flush = time.monotonic()
+
+    def add(self, data_item: DataItem, tariff: Optional[int]):
+        timestamp = data_item.get_timestamp()
+        power = {}
+        for signal in self.signals:
+            if data_item.data_item_spec.datatype_from_name(signal) is not None:
+                if (value := data_item.get_value(signal)) is not None:
+                    unit = data_item.data_item_spec.get_unit(signal)
+                    power[signal] = value * self.c_UNIT_FACTORS.get(unit, 1.0)
+        if self.prev_timestamp is not None and timestamp > self.prev_timestamp:
+            dt = timestamp - self.prev_timestamp
+            day = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d")
+            gap = dt > self.max_gap_seconds
+            if gap:
+                self.num_gaps += 1
+                logging.debug(f"Energy integration: gap of {dt} s before {datetime.fromtimestamp(timestamp)}")
+            if not gap or self.gap_rule != 'skip':
+                for signal, prev_power in self.prev_power.items():
+                    if (gap and self.gap_rule == 'hold') or signal not in power:
+                        energy = prev_power * dt / 3600
+                    else:
+                        energy = (prev_power + power[signal]) / 2 * dt / 3600
+                    self.energy_store.add(day, self.prev_tariff, signal, energy, dt)
+        if self.prev_timestamp is None or timestamp > self.prev_timestamp:
+            self.prev_timestamp = timestamp
+            self.prev_power = power
+            if tariff is not None:
+                self.prev_tariff = tariff
+        if time.monotonic() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        self.energy_store.flush()
+        self.last_flush = time.monotonic()
@@ -0,0 +1,230 @@
+"""
+    Streaming operators deriving signals from stored signals, configured in the [PIPELINES] section of config.ini.
+
+    A pipeline takes one signal from a source --a data store, or p1_extra for the separately timestamped values of
+    the P1 telegram-- and runs it through named stages. Every stage applies an operator to the source or to an earlier
+    stage, so the stages form a DAG. Sinks write the output of a stage to a data store. Samples are processed one by
+    one as they arrive; every operator keeps a constant amount of state.
+"""
+
+from __future__ import annotations
+import logging
+import math
+from abc import ABCMeta, abstractmethod
+from typing import List, Dict, Tuple, Optional, Callable
+from Utils.settings import Settings
+from DataHolder.data_item import DataItem, DataItemSpec
+
+Sample = Tuple[float, float]  # timestamp, value
+
+
+class Operator(metaclass=ABCMeta):
+
+    @abstractmethod
+    def process(self, timestamp: float, value: float) -> List[Sample]:
+        """Returns the output samples caused by one input sample, possibly none"""
+        pass
+
+
+class DedupeByTimestamp(Operator):
+    """Passes a sample only when its timestamp is later than that of the last passed sample"""
+
+    def __init__(self):
+        self.last_timestamp: Optional[float] = None
+
+    def process(self, timestamp: float, value: float) -> List[Sample]:
+        if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+            return []
+        self.last_timestamp = timestamp
+        return [(timestamp, value)]
+
+
+class Diff(Operator):
+    """Difference with the previous sample, timestamped at the start or the end of the interval"""
+
+    def __init__(self, timestamp: str = 'end'):
+        assert timestamp in ('start', 'end')
+        self.at_start = timestamp == 'start'
+        self.prev: Optional[Sample] = None
+
+    def process(self, timestamp: float, value: float) -> List[Sample]:
+        prev, self.prev = self.prev, (timestamp, value)
+        if prev is None:
+            return []
+        return [(prev[0] if self.at_start else timestamp, value - prev[1])]
+
+
+class Rate(Operator):
+    """Difference with the previous sample divided by the time between the samples, per period in seconds"""
+
+    def __init__(self, per: float = 1.0):
+        self.per = per
+        self.prev: Optional[Sample] = None
+
+    def process(self, timestamp: float, value: float) -> List[Sample]:
+        prev, self.prev = self.prev, (timestamp, value)
+        if prev is None or timestamp <= prev[0]:
+            return []
+        return [(timestamp, (value - prev[1]) / (timestamp - prev[0]) * self.per)]
+
+
+class EWMA(Operator):
+    """
+    Exponentially weighted moving average. With a time constant tau in seconds the weight follows the time between
+    samples, otherwise the fixed weight alpha is used.
+    """
+
+    def __init__(self, alpha: float = None, tau: float = None):
+        assert (alpha is None) != (tau is None)
+        self.alpha = alpha
+        self.tau = tau
+        self.prev: Optional[Sample] = None
+
+    def process(self, timestamp: float, value: float) -> List[Sample]:
+        if self.prev is None:
+            self.prev = (timestamp, value)
+        else:
+            alpha = self.alpha if self.tau is None else 1.0 - math.exp(-max(timestamp - self.prev[0], 0.0) / self.tau)
+            self.prev = (timestamp, self.prev[1] + alpha * (value - self.prev[1]))
+        return [self.prev]
+
+
+class Clamp(Operator):
+
+    def __init__(self, min: float = None, max: float = None):
+        self.min = min
+        self.max = max
+
+    def process(self, timestamp: float, value: float) -> List[Sample]:
+        if self.min is not None and value < self.min:
+            value = self.min
+        if self.max is not None and value > self.max:
+            value = self.max
+        return [(timestamp, value)]
+
+
+class Resample(Operator):
+    """
+    Aggregates the samples in periods aligned to multiples of the period. A period is emitted, timestamped at its
+    start, when the first sample of a later period arrives. Periods without samples are not emitted.
+    """
+
+    def __init__(self, period: float, how: str = 'mean'):
+        assert how in ('mean', 'last', 'min', 'max', 'sum')
+        self.period = period
+        self.how = how
+        self.bucket: Optional[float] = None
+        self.count = 0
+        self.aggregate = 0.0
+
+    def process(self, timestamp: float, value: float) -> List[Sample]:
+        bucket = timestamp - timestamp % self.period
+        result = []
+        if self.bucket is not None and bucket != self.bucket:
+            result.append((self.bucket, self.aggregate / self.count if self.how == 'mean' else self.aggregate))
+            self.count = 0
+        if self.count == 0:
+            self.bucket = bucket
+            self.aggregate = 0.0 if self.how in ('mean', 'sum') else value
+        self.count += 1
+        if self.how in ('mean', 'sum'):
+            self.aggregate += value
+        elif self.how == 'last':
+            self.aggregate = value
+        elif self.how == 'min':
+            self.aggregate = min(self.aggregate, value)
+        else:
+            self.aggregate = max(self.aggregate, value)
+        return result
+
+
+c_OPERATORS: Dict[str, Callable[..., Operator]] = {
+    'dedupe_by_timestamp': DedupeByTimestamp,
+    'diff': Diff,
+    'rate': Rate,
+    'ewma': EWMA,
+    'clamp': Clamp,
+    'resample': Resample,
+}
+
+
+class Pipeline:
+
+    c_SOURCE = 'source'
+
+    def __init__(self, name: str, source: str, signal: str):
+        self.name = name
+        self.source = source
+        self.signal = signal
+        self.operators: Dict[str, Operator] = {}
+        self.children: Dict[str, List[str]] = {self.c_SOURCE: []}  # stage: stages taking its output
+        self.sinks: Dict[str, List[Callable[[float, float], None]]] = {}
+
+    def add_stage(self, name: str, operator: Operator, input_stage: str):
+        if input_stage not in self.children:
+            raise ValueError(f"Pipeline {self.name}: input {input_stage} of stage {name} is not defined before it")
+        if name in self.children:
+            raise ValueError(f"Pipeline {self.name}: stage {name} is defined twice")
+        self.operators[name] = operator
+        self.children[name] = []
+        self.children[input_stage].append(name)
+
+    def add_sink(self, stage: str, sink: Callable[[float, float], None]):
+        if stage not in self.children:
+            raise ValueError(f"Pipeline {self.name}: sink of undefined stage {stage}")
+        self.sinks.setdefault(stage, []).append(sink)
+
+    def push(self, timestamp: float, value: float, stage: str = c_SOURCE):
+        for sink in self.sinks.get(stage, []):
+            sink(timestamp, value)
+        for child in self.children[stage]:
+            for out_timestamp, out_value in self.operators[child].process(timestamp, value):
+                self.push(out_timestamp, out_value, child)
+
+
+class PipelineEngine:
+    """Holds the configured pipelines and feeds them the data items of their source"""
+
+    c_P1_EXTRA = 'p1_extra'
+
+    def __init__(self, data_holder):
+        self.data_holder = data_holder
+        self.pipelines: Dict[str, List[Pipeline]] = {}  # source: pipelines
+        for name in Settings().get_pipelines():
+            pipeline = self.create_pipeline(name)
+            self.pipelines.setdefault(pipeline.source, []).append(pipeline)
+
+    def create_pipeline(self, name: str) -> Pipeline:
+        source, signal = Settings().get_pipeline_source(name)
+        pipeline = Pipeline(name, source, signal)
+        for stage, operator, input_stage, params in Settings().get_pipeline_stages(name):
+            if operator not in c_OPERATORS:
+                raise ValueError(f"Pipeline {name}: unknown operator {operator}")
+            pipeline.add_stage(stage, c_OPERATORS[operator](**params), input_stage)
+        for stage, data_store, dest_signal, unit in Settings().get_pipeline_sinks(name):
+            pipeline.add_sink(stage, self.make_sink(data_store, dest_signal, unit))
+        logging.info(f"Pipeline {name}: {source}:{signal} -> {', '.join(pipeline.operators)}")
+        return pipeline
+
+    def make_sink(self, data_store_name: str, signal: str, unit: Optional[str]) -> Callable[[float, float], None]:
+        data_store = self.data_holder.data_store(data_store_name)
+        if data_store is None:
+            raise ValueError(f"Pipeline sink: data store {data_store_name} does not exist")
+        data_item_spec = DataItemSpec.from_names(data_store.signals)
+        data_item_spec.set_unit(signal, unit)
+
+        def sink(timestamp: float, value: float):
+            data_item = DataItem(data_item_spec, timestamp=timestamp)
+            data_item.set_value(signal, value)
+            self.data_holder.addMeasurement(data_store_name, data_item)
+
+        return sink
+
+    def source_signals(self, source: str) -> List[str]:
+        return [pipeline.signal for pipeline in self.pipelines.get(source, [])]
+
+    def feed(self, source: str, data_item: DataItem):
+        for pipeline in self.pipelines.get(source, []):
+            if data_item.data_item_spec.datatype_from_name(pipeline.signal) is not None:
+                if (value := data_item.get_value(pipeline.signal)) is not None:
+                    pipeline.push(data_item.get_timestamp(), value)
@@ -1,13 +1,22 @@
 import logging
+import math
+import time
 from datetime import datetime, timedelta
+from typing import List, Dict, Optional
 from Utils.settings import Settings
+from Utils.instrumentation import instrumentation
 from P1System.p1_interface import P1Interface
-from P1System.data_classes import P1Sample
-from SMASystem.sma_interface import SMAInterface, SMADataType
+from P1System.data_classes import P1Sample, P1DataType
+from SMASystem.sma_interface import SMAInterface, SMADataType, SMAStatus
 from ZWaveSystem.zwave_interface import ZWaveInterface
+from ZWaveSystem.data_classes import SampleZWave
+from ZWaveSystem.routing_table import ZWaveRoute
 from Application.Models.shift_info import ShiftInfo
+from Application.pipeline import PipelineEngine
+from Application.energy import EnergyIntegrator
 from DataHolder.data_holder import DataHolder
-from DataHolder.storage import DataItem
+from DataHolder.storage import DataItem, DataItemSpec
+from DataHolder.buffer_attrs import LifeSpan
 
 
 class Processor:
@@ -20,55 +29,149 @@ class Processor:
         self.sma_interface = sma_interface
         self.zwave_interface = zwave_interface
         self.data_holder = data_holder
+        self.pipelines = PipelineEngine(data_holder)
+        self.persisted_until: Dict[str, float] = {}  # data store: end of the last stored window
+        self.energy = EnergyIntegrator(data_holder.energy_store, Settings().get_energy_signals(),
+                                       Settings().get_energy_max_gap_seconds(), Settings().get_energy_gap_rule(),
+                                       Settings().get_energy_flush_seconds())
 
     def p1SampleAcquired(self):
         p1_sample = self.p1_interface.getSample()
-        if data_item := p1_sample.to_data_item(Settings().get_data_store_signals(Settings().get_P1_data_store())):
+        with instrumentation.stage('processor.to_data_item'):
+            data_item = p1_sample.to_data_item(Settings().get_data_store_signals(Settings().get_P1_data_store()))
+        if data_item:
+            instrumentation.count('processor.samples', source='p1')
             if self.sma_interface:
-                data_item.add_value(SMADataType.SOLAR.name, self.sma_interface.getCurrentPower(), SMAInterface.c_POWER_UNIT)
-            self.data_holder.addMeasurement(Settings().get_P1_data_store(), data_item)
-        self.filter_and_differentiate(p1_sample)
+                with instrumentation.stage('processor.sma'):
+                    sma_item, sma_status = self.sma_interface.getSample(
+                        data_item.get_timestamp(), self.data_holder.data_store(Settings().get_SMA_data_store()).signals)
+                solar = sma_item.get_value(SMADataType.SOLAR.name) if sma_item else None
+                data_item.add_value(SMADataType.SOLAR.name, solar, SMAInterface.c_POWER_UNIT)
+                if sma_status == SMAStatus.OK:
+                    with instrumentation.stage('processor.store_sma'):
+                        self.data_holder.addMeasurement(Settings().get_SMA_data_store(), sma_item)
+                    self.pipelines.feed(Settings().get_SMA_data_store(), sma_item)
+                else:
+                    logging.debug(f"SMA status {sma_status.name}, SOLAR from cache: {solar}")
+                instrumentation.count('processor.sma_samples', status=sma_status.name)
+            with instrumentation.stage('processor.store_p1'):
+                self.data_holder.addMeasurement(Settings().get_P1_data_store(), data_item)
+            instrumentation.freshness('p1', data_item.get_timestamp())
+            with instrumentation.stage('processor.pipelines'):
+                self.pipelines.feed(Settings().get_P1_data_store(), data_item)
+            with instrumentation.stage('processor.energy'):
+                self.energy.add(data_item, self.get_tariff(p1_sample))
+        else:
+            instrumentation.count('processor.invalid_samples', source='p1')
+        self.feed_p1_extra(p1_sample)
+        if p1_sample.telegram_end is not None:
+            instrumentation.observe('p1.end_to_end', time.perf_counter() - p1_sample.telegram_end)
 
-    def filter_and_differentiate(self, p1_sample: P1Sample):
-        if data_item := p1_sample.extra_signal_to_data_item(Settings().get_differential_source_signal()):
-            data_store = self.data_holder.data_store(Settings().get_filtered_data_store())
-            if data_store.data.last_time() != data_item.get_timestamp():
-                data_store.data.append(data_item)
-                self.data_holder.addMeasurement(Settings().get_filtered_data_store(), data_item)
-                if prev_item := data_store.data.get_data_item(data_store.data.last_index(offset=1)):
-                    delta = (data_item.get_value(Settings().get_differential_source_signal()) -
-                             prev_item.get_value(Settings().get_differential_source_signal()))
-                    data_item_spec = self.data_holder.data_store(
-                        Settings().get_differential_dest_data_store()).data.data_item_spec
-                    data_item_spec.set_unit(Settings().get_differential_dest_signal(),
-                                            Settings().get_differential_dest_unit())
-                    delta_data_item = DataItem(data_item_spec, timestamp=prev_item.get_timestamp())
-                    delta_data_item.set_value(Settings().get_differential_dest_signal(), delta)
-                    self.data_holder.addMeasurement(Settings().get_differential_dest_data_store(), delta_data_item)
+    @staticmethod
+    def get_tariff(p1_sample: P1Sample) -> Optional[int]:
+        try:
+            return int(p1_sample.getValue(P1DataType.TARIFF).value)
+        except (KeyError, AttributeError, TypeError, ValueError):
+            return None
+
+    def feed_p1_extra(self, p1_sample: P1Sample):
+        """Feeds the separately timestamped values of the telegram (the gas meter reading) to the pipelines"""
+        for signal in self.pipelines.source_signals(PipelineEngine.c_P1_EXTRA):
+            if data_item := p1_sample.extra_signal_to_data_item(signal):
+                self.pipelines.feed(PipelineEngine.c_P1_EXTRA, data_item)
 
     def transfer_derived_value(self, source: str, dest: str, interval: timedelta):
-        if (source_timerange := self.data_holder.get_timerange(source)) is not None:
-            start_timestamp = datetime.timestamp(datetime.fromtimestamp(source_timerange[1]) - interval)
-            end_timestamp = source_timerange[1]
-            if start_timestamp < source_timerange[0]:
-                start_timestamp = source_timerange[0]
+        """
+        Stores the averages of the source over the windows of length interval, aligned to the clock, that completed
+        since the last stored window. Windows missed during downtime or by a misfire of the job are caught up as far
+        back as the source buffer reaches; all windows are stored in one transaction.
+        """
+        if (source_timerange := self.data_holder.get_timerange(source)) is None:
+            return
+        window = interval.total_seconds()
+        end = source_timerange[1] - source_timerange[1] % window
+        if (start := self.persisted_until.get(dest)) is None:
+            if (last_time := self.data_holder.data_store(dest).data.last_time()) is not None:
+                start = math.ceil((last_time + 0.5 * window) / window) * window  # end of the last stored window
+            else:
+                start = end - window
+        start = max(start, math.ceil(source_timerange[0] / window) * window)
+        if start >= end:
+            return
+        logging.debug(f"Windows for persistent value calculation: {datetime.fromtimestamp(start)} > {datetime.fromtimestamp(end)}")
+        shift_info = ShiftInfo()
+        shift_info.set_sampling_time(self.p1_interface.get_sampling_period())
+        avg_signals = [signal for signal in self.data_holder.data_store(dest).signals if signal != "CUMULATIVE_GAS"]
+        data_items = self.data_holder.get_window_averages(source, start, end, window, avg_signals, shift_info)
+        if len(data_items) > 1:
+            logging.info(f"Persist {dest}: caught up {len(data_items)} windows from {datetime.fromtimestamp(start)}")
+        self.data_holder.addMeasurements(dest, data_items)
+        self.persisted_until[dest] = end
+
+    def backfill_sma_history(self, dest: str):
+        """
+        Fills the destination store with the 5-minute logger data of the inverter, starting at the last stored
+        timestamp. Data is retrieved in chunks, each chunk is stored in one transaction so an interrupted backfill
+        resumes at the last completed chunk.
+        """
+        data_store = self.data_holder.data_store(dest)
+        now = int(datetime.timestamp(datetime.now()))
+        prev_item = None
+        if (last_time := data_store.data.last_time()) is not None:
+            prev_item = data_store.data.get_data_item(data_store.data.last_index())
+            start = int(last_time)
+        else:
+            start = now - int(timedelta(days=Settings().sma_backfill_max_days()).total_seconds())
+        chunk = int(timedelta(hours=Settings().sma_backfill_chunk_hours()).total_seconds())
+        data_item_spec = DataItemSpec({SMADataType.SOLAR.name: SMAInterface.c_POWER_UNIT,
+                                       SMADataType.SOLAR_TOTAL.name: SMAInterface.c_ENERGY_UNIT})
+        num_items = 0
+        while start < now:
+            end = min(start + chunk, now)
+            if (records := self.sma_interface.getLoggerRecords(start, end)) is None:
+                logging.warning(f"SMA backfill interrupted at {datetime.fromtimestamp(start)}")
+                break
+            data_items = []
+            for timestamp, total in records:
+                if prev_item is not None:
+                    if timestamp <= prev_item.get_timestamp():
+                        continue
+                    energy = total - prev_item.get_value(SMADataType.SOLAR_TOTAL.name)
+                    power = 3600 * energy / (timestamp - prev_item.get_timestamp())
+                else:
+                    power = None
+                data_item = DataItem(data_item_spec, timestamp=timestamp)
+                data_item.set_value(SMADataType.SOLAR.name, power)
+                data_item.set_value(SMADataType.SOLAR_TOTAL.name, total)
+                data_items.append(data_item)
+                prev_item = data_item
+            self.data_holder.addMeasurements(dest, data_items)
+            num_items += len(data_items)
+            start = end
+        logging.info(f"SMA backfill: {num_items} items added to {dest}")
 
-            start_time = datetime.fromtimestamp(start_timestamp)
-            end_time = datetime.fromtimestamp(end_timestamp)
-            logging.debug(f"Time range for persistent value calculation: {start_time} > {end_time}")
-            shift_info = ShiftInfo()
-            shift_info.set_sampling_time(self.p1_interface.get_sampling_period())
-            avg_signals = [signal for signal in self.data_holder.data_store(dest).signals if signal != "CUMULATIVE_GAS"]
-            derived_data_item = self.data_holder.get_average(source, start_time, end_time, avg_signals, shift_info)  # dit is een data-item
-            logging.debug(f"Average: {derived_data_item}")
-            self.data_holder.addMeasurement(dest, derived_data_item)
+    def zwaveSamplesAcquired(self, samples: List[SampleZWave]):
+        """Called on the worker thread of the Z-Wave interface with samples in order of arrival"""
+        logging.debug(f"zwaveSamplesAcquired: {len(samples)} samples")
+        instrumentation.count('processor.samples', len(samples), source='zwave')
+        data_items: Dict[str, List[DataItem]] = {}
+        for sample in samples:
+            if data_item := sample.to_data_item(sample.get_data_types()):
+                data_items.setdefault(sample.data_store, []).append(data_item)
+        for data_store, items in data_items.items():
+            instrumentation.freshness('zwave', items[-1].get_timestamp())
+            self.data_holder.addMeasurements(data_store, items, no_zeros=True, min_time_spacing=Settings().get_min_storage_time_diff_seconds())
 
-    def zwaveSampleAcquired(self):
-        sample = self.zwave_interface.getSample()
-        logging.debug(f"zwaveSampleAcquired: {sample}")
-        if data_item := sample.to_data_item(sample.get_data_types()):
-            data_store = Settings().get_ZWave_data_store(sample.node_id, sample.get_data_types())
-            self.data_holder.addMeasurement(data_store, data_item, no_zeros=True, min_time_spacing=Settings().get_min_storage_time_diff_seconds())
+    def zwave_route_created(self, route: ZWaveRoute):
+        """Creates the data store of a Z-Wave value that has no configured route"""
+        if self.data_holder.data_store(route.data_store) is None:
+            lifespan = Settings().get_zwave_auto_store_lifespan()
+            self.data_holder.add_data_store(name=route.data_store,
+                                            persistency=Settings().get_zwave_auto_store_persistency(),
+                                            lifespan=lifespan, signals=[route.signal],
+                                            buf_len=Settings().get_zwave_auto_store_buflen() if lifespan == LifeSpan.Circular else 0,
+                                            db=Settings().get_zwave_auto_store_db())
+            logging.info(f"Data store {route.data_store} created for Z-Wave signal {route.signal}")
 
     def get_P1_start_time(self) -> datetime:
         return self.p1_interface.interpreter.start_time
@@ -0,0 +1,168 @@
+"""
+    Benchmark of the P1 ingest path with the SMA interface running against the local SMA simulator.
+
+    A replayed P1 telegram is offered at the meter's period. Telegrams that are superseded by a newer one before the
+    ingest path asks for them are counted as dropped, as happens with the serial port of the real meter.
+
+    Usage: python -m Benchmark.benchmark_sma --latency 0.2 --error-rate 0.1 --duration 60
+"""
+
+import argparse
+import logging
+import statistics
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+from Utils.settings import Settings
+from DataHolder.data_holder import DataHolder
+from DataHolder.data_store import DataStore
+from DataHolder.energy_store import EnergyStore
+from DataHolder.storage import CircularMemStorage
+from DataHolder.buffer_attrs import Persistency, LifeSpan
+from P1System.interpreter import Interpreter
+from P1System.p1_interface import P1Interface
+from P1System.serial_settings import SerialSettings
+from SMASystem.sma_interface import SMAInterface
+from SMASystem.simulator import SMASimulator, SimulatorSettings
+from Application.processor import Processor
+
+
+class TelegramReplayReader:
+    """Replacement of the SerialReader producing a fresh telegram every period"""
+
+    def __init__(self, period: float):
+        self.period = period
+        self.t0 = time.monotonic()
+        self.telegram_number = -1
+        self.num_dropped = 0
+        self.lines: List[bytes] = []
+        self.stopped = False
+
+    def getLine(self) -> Optional[bytes]:
+        if self.stopped:
+            return None
+        if not self.lines:
+            self.next_telegram()
+        return self.lines.pop(0)
+
+    def next_telegram(self):
+        number = int((time.monotonic() - self.t0) / self.period)
+        if number <= self.telegram_number:  # wait for the meter
+            time.sleep(self.t0 + (self.telegram_number + 1) * self.period - time.monotonic())
+            number = self.telegram_number + 1
+        self.num_dropped += number - self.telegram_number - 1 if self.telegram_number >= 0 else 0
+        self.telegram_number = number
+        self.lines = self.telegram(datetime.now())
+
+    @staticmethod
+    def telegram(now: datetime) -> List[bytes]:
+        stamp = now.strftime("%y%m%d%H%M%S").encode()
+        gas_stamp = now.replace(minute=0, second=0).strftime("%y%m%d%H%M%S").encode()
+        return [b"/" + Interpreter.startTelegram + b"\r\n",
+                b"0-0:1.0.0(" + stamp + b"S)\r\n",
+                b"1-0:1.8.1(012345.678*kWh)\r\n",
+                b"1-0:1.8.2(012345.678*kWh)\r\n",
+                b"1-0:2.8.1(001234.567*kWh)\r\n",
+                b"1-0:2.8.2(001234.567*kWh)\r\n",
+                b"0-0:96.14.0(0002)\r\n",
+                b"1-0:1.7.0(00.512*kW)\r\n",
+                b"1-0:2.7.0(00.000*kW)\r\n",
+                b"1-0:21.7.0(00.200*kW)\r\n",
+                b"1-0:41.7.0(00.150*kW)\r\n",
+                b"1-0:61.7.0(00.162*kW)\r\n",
+                b"1-0:22.7.0(00.000*kW)\r\n",
+                b"1-0:42.7.0(00.000*kW)\r\n",
+                b"1-0:62.7.0(00.000*kW)\r\n",
+                b"0-1:24.2.1(" + gas_stamp + b"S)(01234.567*m3)\r\n",
+                b"!1234\r\n"]
+
+
+class MemDataHolder(DataHolder):
+    """All configured data stores in memory, the database is left alone"""
+
+    def init_data_stores(self) -> List[DataStore]:
+        data_stores = []
+        for data_store_id in Settings().get_data_stores():
+            signals = Settings().get_data_store_signals(data_store_id)
+            data_store = DataStore(name=Settings().get_data_store_name(data_store_id),
+                                   persistency=Persistency.Volatile, lifespan=LifeSpan.Circular, signals=signals,
+                                   buf_len=24 * 3600)
+            data_store.data = CircularMemStorage(data_store.buf_len, signals)
+            data_stores.append(data_store)
+        return data_stores
+
+    @staticmethod
+    def init_energy_store() -> EnergyStore:
+        return EnergyStore(':memory:')
+
+
+class TimedSMAInterface(SMAInterface):
+    """Keeps the duration of every poll"""
+
+    def __init__(self, ports: List[int]):
+        super().__init__(inverters={f"inv{i}": ('127.0.0.1', port) for i, port in enumerate(ports)})
+        self.poll_times: List[float] = []
+
+    def getSample(self, timestamp: float = None, signals: List[str] = None):
+        start = time.perf_counter()
+        result = super().getSample(timestamp, signals)
+        self.poll_times.append(time.perf_counter() - start)
+        return result
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run(simulator_settings: SimulatorSettings, period: float, duration: float, num_inverters: int = 1):
+    simulators = [SMASimulator(simulator_settings) for _ in range(num_inverters)]
+    ports = [simulator.start() for simulator in simulators]
+    reader = TelegramReplayReader(period)
+    p1_interface = P1Interface(Settings().get_measurement_p1_signals(),
+                               interpreter=Interpreter(SerialSettings(), reader=reader))
+    sma_interface = TimedSMAInterface(ports)
+    time.sleep(0.5)  # authentication runs in the background
+    processor = Processor(p1_interface, sma_interface, None, MemDataHolder())
+    ingest = threading.Thread(name='ingest', target=p1_interface.start,
+                              kwargs={'post_sample_CB': processor.p1SampleAcquired}, daemon=True)
+    ingest.start()
+    time.sleep(duration)
+    p1_interface.stop()
+    reader.stopped = True
+    ingest.join(timeout=5)
+    for simulator in simulators:
+        simulator.stop()
+
+    polls = sma_interface.poll_times
+    num_telegrams = reader.telegram_number + 1
+    print(f"{num_inverters} inverter(s), "
+          f"latency {simulator_settings.latency_seconds} s (+{simulator_settings.latency_jitter_seconds} s), "
+          f"error rate {simulator_settings.error_rate}, session lifetime {simulator_settings.session_lifetime_seconds} s")
+    print(f"  telegrams offered:  {num_telegrams}")
+    print(f"  telegrams dropped:  {reader.num_dropped} ({100 * reader.num_dropped / max(num_telegrams, 1):.1f} %)")
+    print(f"  SMA polls:          {len(polls)}, "
+          f"requests on simulators {sum(simulator.num_requests for simulator in simulators)}")
+    print(f"  poll latency p50:   {1000 * percentile(polls, 50):.1f} ms")
+    print(f"  poll latency p99:   {1000 * percentile(polls, 99):.1f} ms")
+    if polls:
+        print(f"  poll latency mean:  {1000 * statistics.mean(polls):.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the ingest path against the SMA simulator")
+    parser.add_argument('--latency', type=float, default=0.02, help="fixed latency per request in seconds")
+    parser.add_argument('--jitter', type=float, default=0.01, help="random additional latency in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of failing requests")
+    parser.add_argument('--session-lifetime', type=float, default=300.0, help="session expiry in seconds")
+    parser.add_argument('--inverters', type=int, default=1, help="number of simulated inverters")
+    parser.add_argument('--period', type=float, default=1.0, help="telegram period of the meter in seconds")
+    parser.add_argument('--duration', type=float, default=30.0, help="duration of the benchmark in seconds")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.CRITICAL)
+    run(SimulatorSettings(latency_seconds=args.latency, latency_jitter_seconds=args.jitter,
+                          error_rate=args.error_rate, session_lifetime_seconds=args.session_lifetime),
+        period=args.period, duration=args.duration, num_inverters=args.inverters)
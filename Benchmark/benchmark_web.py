@@ -0,0 +1,135 @@
+"""
+    Load test of the web server, the threaded or the asyncio one, on an in-memory data holder.
+
+    Every client keeps a connection alive and requests /get_data for a random time range, downsampled, so the
+    responses are not served from the ETag cache. The number of threads and the resident memory of the process are
+    sampled while the clients run; the client threads are not counted.
+
+    Usage: python -m Benchmark.benchmark_web --server asyncio --clients 100 --duration 20
+"""
+
+import argparse
+import http.client
+import logging
+import random
+import socket
+import threading
+import time
+import types
+from typing import List
+from http.server import ThreadingHTTPServer
+import psutil
+from DataHolder.data_item import DataItem
+from WebServer.request_handler import RequestHandler
+from WebServer.threaded_server import MakeHandlerClass
+from WebServer.async_server import AsyncServer
+from Benchmark.benchmark_sma import MemDataHolder, percentile
+
+
+def fill(data_holder: MemDataHolder, data_store_name: str, num_items: int) -> float:
+    """Stores num_items items at 1 s spacing up to now, returns the time of the first"""
+    data_store = data_holder.data_store(data_store_name)
+    t0 = time.time() - num_items
+    items = []
+    for k in range(num_items):
+        item = DataItem(data_store.data.data_item_spec, timestamp=t0 + k)
+        for signal in data_store.signals:
+            item.set_value(signal, (k % 3600) * 0.001)
+        items.append(item)
+    data_holder.addMeasurements(data_store_name, items)
+    return t0
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(server: str, processor) -> int:
+    port = free_port()
+    if server == 'asyncio':
+        AsyncServer(processor, port=port)
+    else:
+        httpd = ThreadingHTTPServer(('127.0.0.1', port), MakeHandlerClass(RequestHandler(processor)))
+        threading.Thread(name='daemon_server', target=httpd.serve_forever, daemon=True).start()
+    return port
+
+
+class Client(threading.Thread):
+
+    def __init__(self, port: int, data_store_name: str, t0: float, span: float, deadline: float):
+        super().__init__(name='client', daemon=True)
+        self.port = port
+        self.data_store_name = data_store_name
+        self.t0 = t0
+        self.span = span
+        self.deadline = deadline
+        self.latencies: List[float] = []
+        self.num_errors = 0
+
+    def run(self):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        while time.monotonic() < self.deadline:
+            start_time = self.t0 + random.random() * self.span / 2
+            path = f"/get_data?data_store_name={self.data_store_name}&signals=CURRENT_USAGE" \
+                   f"&from={start_time:.0f}&to={start_time + self.span / 2:.0f}&max_points=500"
+            start = time.perf_counter()
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    self.num_errors += 1
+                    connection.close()
+                    time.sleep(0.1)
+                    continue
+            except (OSError, http.client.HTTPException):
+                self.num_errors += 1
+                connection.close()
+                time.sleep(0.1)
+                continue
+            self.latencies.append(time.perf_counter() - start)
+        connection.close()
+
+
+def server_threads() -> int:
+    return sum(1 for thread in threading.enumerate() if thread.name != 'client')
+
+
+def run(server: str, num_clients: int, duration: float, num_items: int):
+    data_holder = MemDataHolder()
+    data_store_name = data_holder.data_stores[0].name
+    t0 = fill(data_holder, data_store_name, num_items)
+    processor = types.SimpleNamespace(data_holder=data_holder, zwave_interface=None)  # the views used need no more
+    port = start_server(server, processor)
+    process = psutil.Process()
+    threads_before, rss_before = server_threads(), process.memory_info().rss
+    deadline = time.monotonic() + duration
+    clients = [Client(port, data_store_name, t0, num_items, deadline) for _ in range(num_clients)]
+    for client in clients:
+        client.start()
+    peak_threads, peak_rss = 0, 0
+    while any(client.is_alive() for client in clients):
+        peak_threads = max(peak_threads, server_threads() - threads_before)
+        peak_rss = max(peak_rss, process.memory_info().rss)
+        time.sleep(0.1)
+    latencies = [latency for client in clients for latency in client.latencies]
+    print(f"{server} server, {num_clients} clients, {duration:.0f} s, {num_items} items in {data_store_name}")
+    print(f"  requests:           {len(latencies)} ({len(latencies) / duration:.1f} /s), "
+          f"errors {sum(client.num_errors for client in clients)}")
+    print(f"  latency p50:        {1000 * percentile(latencies, 50):.1f} ms")
+    print(f"  latency p99:        {1000 * percentile(latencies, 99):.1f} ms")
+    print(f"  server threads:     {peak_threads} at the peak")
+    print(f"  resident memory:    {rss_before / 2 ** 20:.1f} MB before, {peak_rss / 2 ** 20:.1f} MB at the peak")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test of the web server")
+    parser.add_argument('--server', choices=('threaded', 'asyncio'), default='asyncio', help="web server")
+    parser.add_argument('--clients', type=int, default=50, help="number of concurrent clients")
+    parser.add_argument('--duration', type=float, default=20.0, help="duration of the load test in seconds")
+    parser.add_argument('--items', type=int, default=20000, help="number of items in the data store")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.CRITICAL)
+    run(args.server, num_clients=args.clients, duration=args.duration, num_items=args.items)
@@ -1,11 +1,14 @@
 from datetime import datetime, timedelta
-from typing import List
+import logging
+from typing import List, Dict, Optional, Callable
 from Utils.settings import Settings
+from Utils.instrumentation import instrumentation, labels
 from Application.Models.shift_info import ShiftInfo
 from DataHolder.storage import CircularMemStorage, CircularPersistentStorage, LinearPersistentStorage, DataItem
 from DataHolder.db_interface import DBInterface
 from DataHolder.buffer_attrs import Persistency, LifeSpan
 from DataHolder.data_store import DataStore
+from DataHolder.energy_store import EnergyStore
 from DataHolder.data_types import DataType
 
 
@@ -16,26 +19,84 @@ class DataHolder:
 
     def __init__(self):
         self.data_stores: List[DataStore] = self.init_data_stores()
+        self._data_store_index: Dict[str, DataStore] = {data_store.name: data_store for data_store in self.data_stores}
+        self.data_stores_version = 0  # increases when a data store is added
+        self.energy_store: EnergyStore = self.init_energy_store()
+        self.listeners: List[Callable[[str, List[DataItem]], None]] = []
+        instrumentation.register_gauge('storage.rows', self.row_counts)
 
     def addMeasurement(self, data_store_name: str, data_item: DataItem, no_zeros: bool = False, min_time_spacing=None):
         if no_zeros is True and data_item.is_zero() is True:
+            instrumentation.count('dataholder.items_filtered', store=data_store_name)
             return
         if (min_time_spacing is not None and
                 (datetime.fromtimestamp(data_item.timestamp) - datetime.fromtimestamp(
                     self.data_store(data_store_name).data.last_time())).total_seconds() < min_time_spacing):
+            instrumentation.count('dataholder.items_filtered', store=data_store_name)
             return
         self.data_store(data_store_name).data.add_data_item(data_item)
+        instrumentation.count('dataholder.items_stored', store=data_store_name)
+        self.notify(data_store_name, [data_item])
+
+    def addMeasurements(self, data_store_name: str, data_items: List[DataItem], no_zeros: bool = False,
+                        min_time_spacing=None):
+        num_items = len(data_items)
+        if no_zeros is True:
+            data_items = [data_item for data_item in data_items if data_item.is_zero() is False]
+        if min_time_spacing is not None:
+            spaced_items = []
+            last_time = self.data_store(data_store_name).data.last_time()
+            for data_item in data_items:
+                if last_time is None or data_item.timestamp - last_time >= min_time_spacing:
+                    spaced_items.append(data_item)
+                    last_time = data_item.timestamp
+            data_items = spaced_items
+        if len(data_items) < num_items:
+            instrumentation.count('dataholder.items_filtered', num_items - len(data_items), store=data_store_name)
+        if data_items:
+            self.data_store(data_store_name).data.add_data_items(data_items)
+            instrumentation.count('dataholder.items_stored', len(data_items), store=data_store_name)
+            self.notify(data_store_name, data_items)
+
+    def row_counts(self) -> Dict[str, float]:
+        return {labels(store=data_store.name): data_store.data.length() for data_store in list(self.data_stores)}
+
+    def add_listener(self, listener: Callable[[str, List[DataItem]], None]):
+        """The listener is called with the data store name and the items after items are stored"""
+        self.listeners.append(listener)
+
+    def notify(self, data_store_name: str, data_items: List[DataItem]):
+        for listener in self.listeners:
+            try:
+                listener(data_store_name, data_items)
+            except Exception as err:
+                logging.error(f"Listener of data store {data_store_name} failed: {err}")
 
     def get_average(self, data_store_name: str, from_time, to_time, selected_signals, shift_info: ShiftInfo):
         return self.data_store(data_store_name).data.average(from_time, to_time, selected_signals, shift_info)
 
+    def get_window_averages(self, data_store_name: str, start: float, end: float, window_seconds: float,
+                            selected_signals, shift_info: ShiftInfo) -> List[DataItem]:
+        return self.data_store(data_store_name).data.average_windows(start, end, window_seconds, selected_signals,
+                                                                     shift_info)
+
     def get_timerange(self, data_store_name: str):
         return self.data_store(data_store_name).data.timestamp_range()
 
-    def data_store(self, data_store_name: str) -> DataStore:
-        for data_store in self.data_stores:
-            if data_store.name == data_store_name:
-                return data_store
+    def data_store(self, data_store_name: str) -> Optional[DataStore]:
+        return self._data_store_index.get(data_store_name)
+
+    def add_data_store(self, name: str, persistency: Persistency, lifespan: LifeSpan, signals: List[str],
+                       buf_len: int = 0, db: str = None) -> DataStore:
+        data_store = self.create_data_store(name, persistency, lifespan, signals, buf_len, db)
+        self.data_stores.append(data_store)
+        self._data_store_index[name] = data_store
+        self.data_stores_version += 1
+        return data_store
+
+    @staticmethod
+    def init_energy_store() -> EnergyStore:
+        return EnergyStore(DBInterface.db_file_name())
 
     def init_data_stores(self) -> List[DataStore]:
         data_stores = []
@@ -47,20 +108,25 @@ class DataHolder:
             signals = Settings().get_data_store_signals(data_store_id)
             buf_len = Settings().get_data_store_buflen(data_store_id) if lifespan == LifeSpan.Circular else 0
             db = Settings().get_data_store_db(data_store_id) if persistency == Persistency.Persistent else None
-            data_store = DataStore(name=name, persistency=persistency, lifespan=lifespan, signals=signals,
-                                   buf_len=buf_len, db=db)
-            if persistency == Persistency.Persistent and lifespan == LifeSpan.Circular:
-                db_interface = DBInterface(name, signals)
-                data_store.data = CircularPersistentStorage(buf_len, signals, db_interface, table=name)
-            elif persistency == Persistency.Volatile and lifespan == LifeSpan.Circular:
-                data_store.data = CircularMemStorage(buf_len, signals)
-            elif persistency == Persistency.Persistent and lifespan == LifeSpan.Linear:
-                db_interface = DBInterface(name, signals)
-                data_store.data = LinearPersistentStorage(signals, db_interface, table=name)
-            else:
-                raise NotImplementedError
-            data_stores.append(data_store)
+            data_stores.append(self.create_data_store(name, persistency, lifespan, signals, buf_len, db))
         return data_stores
 
+    @staticmethod
+    def create_data_store(name: str, persistency: Persistency, lifespan: LifeSpan, signals: List[str],
+                          buf_len: int = 0, db: str = None) -> DataStore:
+        data_store = DataStore(name=name, persistency=persistency, lifespan=lifespan, signals=signals,
+                               buf_len=buf_len, db=db)
+        if persistency == Persistency.Persistent and lifespan == LifeSpan.Circular:
+            db_interface = DBInterface(name, signals)
+            data_store.data = CircularPersistentStorage(buf_len, signals, db_interface, table=name)
+        elif persistency == Persistency.Volatile and lifespan == LifeSpan.Circular:
+            data_store.data = CircularMemStorage(buf_len, signals)
+        elif persistency == Persistency.Persistent and lifespan == LifeSpan.Linear:
+            db_interface = DBInterface(name, signals)
+            data_store.data = LinearPersistentStorage(signals, db_interface, table=name)
+        else:
+            raise NotImplementedError
+        return data_store
+
     def get_data_stores(self) -> List[str]:
         return [data_store.name for data_store in self.data_stores]
@@ -112,7 +112,7 @@ class DataItem:
         data_item = cls(data_item_spec, timestamp=array[0])
         for i, element in enumerate(data_item_spec.get_elements()):
             unit, idx = data_item_spec.get_element(element)
-            if (value := array[i]) is not None:
+            if (value := array[i + 1]) is not None:
                 data_item.item_data[idx + 1] = value
         return data_item
 
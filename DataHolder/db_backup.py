@@ -0,0 +1,119 @@
+import glob
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import List
+from urllib.request import pathname2url
+
+
+class BackupError(Exception):
+    pass
+
+
+class DatabaseBackup:
+    """
+    Online backup of the database with the SQLite backup API. The database is copied from a snapshot, a read
+    transaction on the source, which the writers do not change in WAL mode. A bounded number of pages is copied per
+    step and the backup pauses between steps, giving way to the ingest path. The backup is written to a
+    temporary file, checked with an integrity check, stored with its sha256 checksum and verified against it.
+    The newest backups are kept, older ones are removed.
+    """
+
+    c_PREFIX = 'power-'
+
+    def __init__(self, db_file_name: str, backup_dir: str, keep: int, pages_per_step: int, step_pause_seconds: float):
+        self.db_file_name = db_file_name
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.pages_per_step = pages_per_step
+        self.step_pause_seconds = step_pause_seconds
+
+    def run(self) -> str:
+        os.makedirs(self.backup_dir, exist_ok=True)
+        name = os.path.join(self.backup_dir, f"{self.c_PREFIX}{datetime.now().strftime('%Y%m%d-%H%M%S')}.db")
+        temp_name = name + '.part'
+        start = time.perf_counter()
+        try:
+            total_pages = self.copy(temp_name)
+            duration = time.perf_counter() - start
+            self.check_integrity(temp_name)
+            os.replace(temp_name, name)
+            checksum = self.sha256(name)
+            with open(name + '.sha256', 'w') as f:
+                f.write(f"{checksum}  {os.path.basename(name)}\n")
+            self.verify(name)
+        except (BackupError, sqlite3.Error):
+            for file_name in (temp_name, name, name + '.sha256'):
+                if os.path.exists(file_name):
+                    os.remove(file_name)
+            raise
+        logging.info(f"Database backup {name}: {total_pages} pages in {duration:.1f} s "
+                     f"({total_pages / duration if duration > 0 else 0:.0f} pages/s)")
+        self.rotate()
+        return name
+
+    def copy(self, dest_name: str) -> int:
+        """
+        Copies the database in steps from a snapshot, returns the number of pages. In WAL mode the writers go on
+        while the snapshot is held, they are held up for the whole copy in the other journal modes.
+        """
+        total_pages = 0
+
+        def progress(status, remaining, total):
+            nonlocal total_pages
+            total_pages = total
+            time.sleep(self.step_pause_seconds)  # give way to the writers
+
+        source = sqlite3.connect(f"file:{pathname2url(self.db_file_name)}?mode=ro", uri=True)
+        dest = sqlite3.connect(dest_name)
+        try:
+            if (journal_mode := source.execute("PRAGMA journal_mode").fetchone()[0]) != 'wal':
+                logging.warning(f"Database in journal mode {journal_mode}, writes wait until the backup has ended")
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()  # starts the read transaction
+            source.backup(dest, pages=self.pages_per_step, progress=progress)
+            source.rollback()
+            dest.execute("PRAGMA journal_mode=DELETE")  # the copy of a WAL database is a single file all the same
+        finally:
+            dest.close()
+            source.close()
+        return total_pages
+
+    @staticmethod
+    def check_integrity(file_name: str):
+        con = sqlite3.connect(f"file:{pathname2url(file_name)}?mode=ro", uri=True)
+        try:
+            result = con.execute("PRAGMA integrity_check").fetchone()[0]
+        finally:
+            con.close()
+        if result != 'ok':
+            raise BackupError(f"Integrity check of {file_name} failed: {result}")
+
+    @staticmethod
+    def sha256(file_name: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_name, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def verify(self, file_name: str):
+        with open(file_name + '.sha256') as f:
+            expected = f.read().split()[0]
+        if self.sha256(file_name) != expected:
+            raise BackupError(f"Checksum of {file_name} does not match")
+
+    def backups(self) -> List[str]:
+        """Backups, oldest first"""
+        return sorted(glob.glob(os.path.join(self.backup_dir, f"{self.c_PREFIX}*.db")))
+
+    def rotate(self):
+        backups = self.backups()
+        for file_name in backups[:max(len(backups) - self.keep, 0)]:
+            logging.info(f"Removing database backup {file_name}")
+            for name in (file_name, file_name + '.sha256'):
+                if os.path.exists(name):
+                    os.remove(name)
@@ -1,28 +1,81 @@
 import os
 import sqlite3
+import threading
+from contextlib import contextmanager
 from typing import List, Dict
 from urllib.request import pathname2url
 import logging
 from Utils.settings import Settings
+from Utils.instrumentation import instrumentation
 from DataHolder.data_item import DataItemSpec
 
+_reader = threading.local()
+
+
+def reader_thread():
+    """
+    Makes the current thread a reader: its queries use read-only connections of its own instead of the connection of
+    the writer, so they run concurrently and see committed data only. Initializer of the threads of a read pool.
+    """
+    _reader.connections = {}  # database file name: connection
+
 
 class DBInterface:
 
     def __init__(self, table: str, signals: List[str]):
         db_file_name = self.db_file_name()
+        self.db_file = db_file_name
         try:
             dburi = 'file:{}?mode=rw'.format(pathname2url(db_file_name))
             self.con = sqlite3.connect(dburi, uri=True, check_same_thread=False)
             logging.info(f"Database {db_file_name} found")
         except sqlite3.OperationalError:  # does not exist
             self.con = self.createDB(db_file_name)
+        self.con.execute("PRAGMA journal_mode=WAL")  # the readers of the read pool do not block the commits
+        self.transaction_depth = 0  # writes are committed at the end of the outermost transaction
+        self.lock = threading.RLock()  # held by the writing thread, for the whole of a transaction
         if table not in self.get_table_names():
             self.createTable(table, signals)
         else:
             if self.check_columns(table=table, columns=['timestamp'] + [str(signal) for signal in signals]) is False:
                 logging.error("Existing database has different columns")
 
+    @contextmanager
+    def transaction(self):
+        """
+        Groups the single item writes within the context in one commit; the writes are rolled back if the context
+        raises. Writes of other threads wait until the transaction has ended.
+        """
+        with self.lock:
+            self.transaction_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self.transaction_depth -= 1
+                if self.transaction_depth == 0:
+                    self.con.rollback()
+                raise
+            self.transaction_depth -= 1
+            if self.transaction_depth == 0:
+                with instrumentation.stage('db.commit'):
+                    self.con.commit()
+
+    def commit(self):
+        with self.lock:
+            if self.transaction_depth == 0:
+                with instrumentation.stage('db.commit'):
+                    self.con.commit()
+
+    def read_con(self) -> sqlite3.Connection:
+        """The read-only connection of the current reader thread, see reader_thread, else the connection"""
+        connections = getattr(_reader, 'connections', None)
+        if connections is None:
+            return self.con
+        if (con := connections.get(self.db_file)) is None:
+            dburi = 'file:{}?mode=ro'.format(pathname2url(self.db_file))
+            con = connections[self.db_file] = sqlite3.connect(dburi, uri=True)
+        return con
+
     @staticmethod
     def createDB(db_file_name: str):
         logging.info("Creating database")
@@ -63,7 +116,7 @@ class DBInterface:
         return [item[1] for item in res]
 
     def get_count(self, table: str) -> int:
-        cur = self.con.cursor()
+        cur = self.read_con().cursor()
         try:
             cur.execute(f"SELECT COUNT(*) FROM {table}")
         except sqlite3.OperationalError:
@@ -72,7 +125,7 @@ class DBInterface:
         return res[0]
 
     def get_data_items(self, table: str, idx: int, elements: List[str]):
-        cur = self.con.cursor()
+        cur = self.read_con().cursor()
         cur.execute("SELECT timestamp" +
                     "".join([f", {element}" for element in elements]) +
                     f" FROM {table} WHERE rowid=?", (idx+1,))  # sqlite rowid starts at 1
@@ -82,20 +135,37 @@ class DBInterface:
         return res
 
     def insert_data_item(self, table: str, idx: int, data_item_spec: DataItemSpec, array: List[float]):
-        cur = self.con.cursor()
-        cur.execute(f"UPDATE {table} SET timestamp=? " +
-                    "".join([f", {element}=?" for element in data_item_spec.get_elements()]) +
-                    "WHERE rowid=?", array + [idx+1])
-        self.con.commit()
+        with self.lock:
+            cur = self.con.cursor()
+            cur.execute(f"UPDATE {table} SET timestamp=? " +
+                        "".join([f", {element}=?" for element in data_item_spec.get_elements()]) +
+                        "WHERE rowid=?", array + [idx+1])
+            self.commit()
 
     def append_data_item(self, table: str, data_item_spec: DataItemSpec, array: List[float]):
         cur = self.con.cursor()
         non_null_elements = [element for i, element in enumerate(data_item_spec.get_elements()) if array[i+1] is not None]
-        cur.execute(f"INSERT INTO {table} (timestamp" +
-                    "".join([f", {element}" for element in non_null_elements]) +
-                    ") VALUES (" + str(array[0]) +
-                    "".join([f", {item}" for item in array[1:] if item is not None]) + ")")
-        self.con.commit()
+        with self.lock:
+            cur.execute(f"INSERT INTO {table} (timestamp" +
+                        "".join([f", {element}" for element in non_null_elements]) +
+                        ") VALUES (" + str(array[0]) +
+                        "".join([f", {item}" for item in array[1:] if item is not None]) + ")")
+            self.commit()
+
+    def append_data_items(self, table: str, data_item_spec: DataItemSpec, arrays: List[List[float]]):
+        """Appends a number of rows in a single transaction"""
+        elements = data_item_spec.get_elements()
+        with self.lock, self.con:
+            self.con.executemany(f"INSERT INTO {table} (timestamp" +
+                                 "".join([f", {element}" for element in elements]) +
+                                 ") VALUES (?" + ", ?" * len(elements) + ")", arrays)
+
+    def get_rows(self, table: str, columns: List[str], first_idx: int, last_idx: int) -> List[tuple]:
+        """Values of the columns in rows first_idx up to and including last_idx, read in one query"""
+        cur = self.read_con().cursor()
+        cur.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE rowid BETWEEN ? AND ? ORDER BY rowid",
+                    (first_idx + 1, last_idx + 1))  # sqlite rowid starts at 1
+        return cur.fetchall()
 
     def get_all_data(self, table: str) -> Dict[str, List[float]]:
         cur = self.con.cursor()
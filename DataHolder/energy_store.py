@@ -0,0 +1,54 @@
+import sqlite3
+import threading
+from typing import Dict, Tuple, List
+
+
+class EnergyStore:
+    """
+    Running energy counters per day, tariff and signal in table energy_daily. Counters are accumulated in memory and
+    added to the table with an upsert, one transaction per flush; the energy of a day is a lookup of its rows.
+    """
+
+    c_TABLE = 'energy_daily'
+
+    def __init__(self, db_file_name: str):
+        self.con = sqlite3.connect(db_file_name, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.pending: Dict[Tuple[str, int, str], Tuple[float, float]] = {}  # (day, tariff, signal): (kWh, seconds)
+        with self.lock, self.con:
+            self.con.execute(f"CREATE TABLE IF NOT EXISTS {self.c_TABLE} (day text, tariff int, signal text, "
+                             "energy real, seconds real, PRIMARY KEY (day, tariff, signal))")
+
+    def add(self, day: str, tariff: int, signal: str, energy: float, seconds: float):
+        with self.lock:
+            prev_energy, prev_seconds = self.pending.get((day, tariff, signal), (0.0, 0.0))
+            self.pending[(day, tariff, signal)] = (prev_energy + energy, prev_seconds + seconds)
+
+    def flush(self):
+        with self.lock:
+            rows = [(day, tariff, signal, energy, seconds)
+                    for (day, tariff, signal), (energy, seconds) in self.pending.items()]
+            self.pending.clear()
+            if rows:
+                with self.con:
+                    self.con.executemany(
+                        f"INSERT INTO {self.c_TABLE} (day, tariff, signal, energy, seconds) VALUES (?, ?, ?, ?, ?) "
+                        "ON CONFLICT (day, tariff, signal) DO UPDATE SET "
+                        "energy = energy + excluded.energy, seconds = seconds + excluded.seconds", rows)
+
+    def get_day(self, day: str) -> Dict[str, Dict[str, float]]:
+        """Dict tariff: {signal: kWh} of the day (yyyy-mm-dd), including the counts not flushed yet"""
+        with self.lock:
+            rows: List[tuple] = self.con.execute(f"SELECT tariff, signal, energy FROM {self.c_TABLE} WHERE day=?",
+                                                 (day,)).fetchall()
+            rows += [(tariff, signal, energy) for (pending_day, tariff, signal), (energy, seconds)
+                     in self.pending.items() if pending_day == day]
+        res = {}
+        for tariff, signal, energy in rows:
+            counters = res.setdefault(str(tariff), {})
+            counters[signal] = counters.get(signal, 0.0) + energy
+        return res
+
+    def get_days(self) -> List[str]:
+        with self.lock:
+            return [row[0] for row in self.con.execute(f"SELECT DISTINCT day FROM {self.c_TABLE} ORDER BY day")]
@@ -2,19 +2,31 @@ from datetime import datetime, timedelta
 import logging
 from abc import ABCMeta, abstractmethod
 import math
-from typing import List, Dict, Optional
+import itertools
+from bisect import bisect_left
+from typing import List, Dict, Optional, Tuple, Iterator
 from Application.Models.shift_info import ShiftInfo
 from DataHolder.db_interface import DBInterface
+from Utils.instrumentation import instrumentation
 from DataHolder.data_types import DataType
 from DataHolder.data_item import DataItem, DataItemSpec
 
+c_TIMESTAMP = 'timestamp'
+
+_versions = itertools.count(1)  # shared by all storages, next() is atomic
+
 
 class Storage(metaclass=ABCMeta):
     """
     Abstract Base Class for a buffer holding timed data. Data elements are stored in class DataItem.
+    The version increases with every write, after the data is written.
     """
     def __init__(self, elems: List[str]):
         self.data_item_spec = DataItemSpec({elem: None for elem in elems})
+        self.version = 0
+
+    def written(self):
+        self.version = next(_versions)
 
     @abstractmethod
     def min_time_index(self) -> int:
@@ -36,10 +48,18 @@ class Storage(metaclass=ABCMeta):
     def add_data_item(self, data_item: DataItem):
         pass
 
+    def add_data_items(self, data_items: List[DataItem]):
+        for data_item in data_items:
+            self.add_data_item(data_item)
+
     @abstractmethod
     def append(self, data_item: DataItem):
         pass
 
+    def extend(self, data_items: List[DataItem]):
+        for data_item in data_items:
+            self.append(data_item)
+
     @abstractmethod
     def insert(self, data_item: DataItem, idx: int):
         pass
@@ -65,6 +85,84 @@ class Storage(metaclass=ABCMeta):
         except AttributeError:
             return None
 
+    def bisect_time(self, timestamp: float, right: bool = False) -> int:
+        """
+        Position, in order of time with 0 the oldest item, where an item with the timestamp would be inserted: before
+        the items with an equal timestamp, or after them if right
+        """
+        length = self.length()
+        min_time_index = self.min_time_index()
+        lo, hi = 0, length
+        while lo < hi:
+            mid = (lo + hi) // 2
+            item_time = self.get_data_item((min_time_index + mid) % length).get_timestamp()
+            if item_time < timestamp or (right and item_time == timestamp):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def indexes_between(self, from_time: Optional[float], to_time: Optional[float]) -> Optional[Tuple[int, int]]:
+        """(from_index, to_index) of the items with from_time <= timestamp <= to_time, None if there are none"""
+        if self.length() == 0:
+            return None
+        return self.indexes_from(0 if from_time is None else self.bisect_time(from_time), to_time)
+
+    def indexes_after(self, timestamp: float, count: Optional[int],
+                      to_time: Optional[float]) -> Optional[Tuple[int, int]]:
+        """
+        (from_index, to_index) of the items after the first count items with the timestamp, or after all of them if
+        count is None, up to to_time; None if there are none
+        """
+        if self.length() == 0:
+            return None
+        after = self.bisect_time(timestamp, right=True)
+        return self.indexes_from(after if count is None else min(self.bisect_time(timestamp) + count, after), to_time)
+
+    def indexes_from(self, first: int, to_time: Optional[float]) -> Optional[Tuple[int, int]]:
+        """(from_index, to_index) of the items from position first in order of time up to to_time"""
+        length = self.length()
+        last = length - 1 if to_time is None else self.bisect_time(to_time, right=True) - 1
+        if first > last:
+            return None
+        min_time_index = self.min_time_index()
+        return (min_time_index + first) % length, (min_time_index + last) % length
+
+    def cursor(self, index: int) -> Tuple[float, int]:
+        """Timestamp of the item at index and the number of items with this timestamp up to and including it"""
+        timestamp = self.get_data_item(index).get_timestamp()
+        position = (index - self.min_time_index()) % self.length()
+        return timestamp, position - self.bisect_time(timestamp) + 1
+
+    def retains(self, timestamp: float, inclusive: bool = False) -> bool:
+        """Whether all items stored after timestamp, or also those at timestamp if inclusive, are still held"""
+        return True
+
+    def index_ranges(self, from_index=None, to_index=None) -> List[Tuple[int, int]]:
+        """Ranges (first, last) of consecutive indexes, in order of time"""
+        ranges = []
+        for idx in self.timedIndexes(from_index, to_index):
+            if ranges and idx == ranges[-1][1] + 1:
+                ranges[-1] = (ranges[-1][0], idx)
+            else:
+                ranges.append((idx, idx))
+        return ranges
+
+    def iter_rows(self, names: List[str], from_index=None, to_index=None,
+                  block_size: int = 4096) -> Iterator[Dict[str, list]]:
+        """
+        Values of the signals, or the timestamps for name 'timestamp', in order of time in blocks of block_size; the
+        values of a block are read from the same items
+        """
+        for first, last in self.index_ranges(from_index, to_index):
+            for start in range(first, last + 1, block_size):
+                yield self.read_rows(names, start, min(start + block_size, last + 1) - 1)
+
+    def read_rows(self, names: List[str], first: int, last: int) -> Dict[str, list]:
+        items = [self.get_data_item(idx) for idx in range(first, last + 1)]
+        return {name: [item.get_timestamp() if name == c_TIMESTAMP else item.get_value(name) for item in items]
+                for name in names}
+
     def serialize(self, signals: List[DataType] = None) -> Dict:
         result = {"timestamp": [self.get_data_item(idx).get_timestamp() for idx in self.timedIndexes()]}
         if signals is None:
@@ -105,6 +203,45 @@ class Storage(metaclass=ABCMeta):
         logging.debug(f"averaging count: {len(indexes)}")
         return sample
 
+    def average_windows(self, start: float, end: float, window_seconds: float, selected_signals: List[DataType],
+                        shift_info: ShiftInfo) -> List[DataItem]:
+        """
+        Averages over the consecutive windows of window_seconds from start up to end, computed in one pass over the
+        buffer. Each item is timestamped at the middle of its window; windows without samples are left out.
+        """
+        if self.length() == 0:
+            return []
+        int_part = int(math.floor(shift_info.shift_in_samples()))
+        float_part = shift_info.shift_in_samples() - int_part
+        margin = abs(shift_info.shift_in_seconds) + 2 * shift_info.sampling_time  # samples needed for the shift
+        first_index = self.index_from_time(datetime.fromtimestamp(start - margin))
+        items = [self.get_data_item(idx) for idx in self.timedIndexes(first_index)]
+        timestamps = [item.get_timestamp() for item in items]
+        columns = {}
+        for signal in selected_signals:
+            assert signal in self.data_item_spec.get_elements()
+            column = [item.get_value(signal) for item in items]
+            if signal == shift_info.signal_to_shift:
+                column = [(1 - float_part) * column[i + int_part] + float_part * column[i + int_part + 1]
+                          if 0 <= i + int_part < len(column) - 1 and column[i + int_part] is not None and
+                          column[i + int_part + 1] is not None else None for i in range(len(column))]
+            columns[signal] = column
+        data_item_spec = DataItemSpec({signal: self.data_item_spec.get_unit(signal) for signal in selected_signals})
+        result = []
+        window_start = start
+        lo = bisect_left(timestamps, window_start)
+        while window_start + window_seconds <= end:
+            hi = bisect_left(timestamps, window_start + window_seconds, lo)
+            if hi > lo:
+                sample = DataItem(data_item_spec, timestamp=window_start + 0.5 * window_seconds)
+                for signal, column in columns.items():
+                    values = [value for value in column[lo:hi] if value is not None]
+                    sample.set_value(signal, sum(values) / len(values) if values else 0.0)
+                result.append(sample)
+            lo = hi
+            window_start += window_seconds
+        return result
+
     def dump(self) -> List[str]:
         result = [f"Dump of circular buffer",
                   f"Number of items: {self.length()}",
@@ -151,6 +288,12 @@ class CircularStorage(Storage, metaclass=ABCMeta):
             self.insert(data_item, self.head)
         self.head = (self.head + 1) % self.num_elems
 
+    def retains(self, timestamp: float, inclusive: bool = False) -> bool:  # override, the oldest items are overwritten
+        if self.length() < self.num_elems:
+            return True
+        oldest = self.get_data_item(self.min_time_index()).get_timestamp()
+        return oldest < timestamp if inclusive else oldest <= timestamp
+
     def timedIndexes(self, from_index=None, to_index=None):
         """Geeft de indices op tijdsvolgorde terug door middel van een generator"""
         if from_index is None:
@@ -167,6 +310,17 @@ class CircularStorage(Storage, metaclass=ABCMeta):
                 for idx in range(to_index + 1):
                     yield idx
 
+    def index_ranges(self, from_index=None, to_index=None) -> List[Tuple[int, int]]:
+        if from_index is None:
+            from_index = self.min_time_index()
+        if to_index is None:
+            to_index = self.last_index()
+        if from_index is None or to_index is None:
+            return []
+        if from_index <= to_index:
+            return [(from_index, to_index)]
+        return [(from_index, self.length() - 1), (0, to_index)]
+
     def index_from_time(self, time: datetime) -> int:
         timestamp = time.timestamp()
         lo = self.min_time_index()
@@ -229,6 +383,12 @@ class LinearStorage(Storage, metaclass=ABCMeta):
         logging.debug(f"add_data_item: item={data_item}")
         self.append(data_item)
 
+    def add_data_items(self, data_items: List[DataItem]):
+        for data_item in data_items:
+            self.data_item_spec.check_units(data_item.data_item_spec)
+        logging.debug(f"add_data_items: {len(data_items)} items")
+        self.extend(data_items)
+
     def timedIndexes(self, from_index=None, to_index=None):
         """Geeft de indices op tijdsvolgorde terug door middel van een generator"""
         if from_index is None:
@@ -238,6 +398,15 @@ class LinearStorage(Storage, metaclass=ABCMeta):
         for idx in range(from_index, to_index + 1):
             yield idx
 
+    def index_ranges(self, from_index=None, to_index=None) -> List[Tuple[int, int]]:
+        if from_index is None:
+            from_index = self.min_time_index()
+        if to_index is None:
+            to_index = self.last_index()
+        if to_index is None or from_index > to_index:
+            return []
+        return [(from_index, to_index)]
+
     def index_from_time(self, time: datetime) -> int:
         timestamp = time.timestamp()
         lo = self.min_time_index()
@@ -272,9 +441,11 @@ class MemStorage(Storage, metaclass=ABCMeta):
 
     def append(self, item: DataItem):
         self.data.append(item)
+        self.written()
 
     def insert(self, item: DataItem, idx: int):
         self.data[idx] = item
+        self.written()
 
 
 class PersistentStorage(Storage, metaclass=ABCMeta):
@@ -291,13 +462,38 @@ class PersistentStorage(Storage, metaclass=ABCMeta):
         res = self.db_interface.get_data_items(self.table, idx, self.data_item_spec.get_elements())
         return DataItem.from_array(res, self.data_item_spec)
 
+    def add_data_items(self, data_items: List[DataItem]):  # override to commit all items at once
+        head = getattr(self, 'head', None)  # of a circular storage, restored when the transaction is rolled back
+        try:
+            with self.db_interface.transaction():
+                super().add_data_items(data_items)
+        except Exception:
+            if head is not None:
+                self.head = head
+            raise
+        self.written()  # again, as the items are visible to other connections after the commit only
+
     def append(self, data_item: DataItem):
         array = data_item.to_array(self.data_item_spec)
-        self.db_interface.append_data_item(self.table, self.data_item_spec, array)
+        with instrumentation.stage('db.append'):
+            self.db_interface.append_data_item(self.table, self.data_item_spec, array)
+        self.written()
+
+    def extend(self, data_items: List[DataItem]):  # override to insert all items in one transaction
+        arrays = [data_item.to_array(self.data_item_spec) for data_item in data_items]
+        with instrumentation.stage('db.extend'):
+            self.db_interface.append_data_items(self.table, self.data_item_spec, arrays)
+        self.written()
 
     def insert(self, data_item: DataItem, idx: int):
         array = data_item.to_array(self.data_item_spec)
-        self.db_interface.insert_data_item(self.table, idx, self.data_item_spec, array)
+        with instrumentation.stage('db.insert'):
+            self.db_interface.insert_data_item(self.table, idx, self.data_item_spec, array)
+        self.written()
+
+    def read_rows(self, names: List[str], first: int, last: int) -> Dict[str, list]:  # override, one query per block
+        rows = self.db_interface.get_rows(self.table, names, first, last)
+        return {name: [row[i] for row in rows] for i, name in enumerate(names)}
 
     def serialize(self, signals: List[DataType] = None) -> Dict:  # override as element-wise data retrieval would be too slow in database implementation
         all_data = self.db_interface.get_all_data(self.table)
@@ -78,6 +78,7 @@ class P1Sample:
     """
     def __init__(self, datatypes: List[P1DataType]):
         self.data: Dict[P1DataType, P1Value] = {datatype: None for datatype in datatypes}
+        self.telegram_end: Optional[float] = None  # perf_counter time at which the last line of the telegram was read
 
     def addValue(self, value: P1Value):
         self.data[value.dataType] = value
@@ -1,10 +1,12 @@
 import logging
+import time
 from datetime import datetime
 from typing import List, Optional, Callable
 from P1System.data_classes import P1DataType, P1Sample
 from P1System.data_classes import P1Value
 from P1System.serial_reader import SerialReader
 from P1System.serial_settings import SerialSettings
+from Utils.instrumentation import instrumentation
 
 
 class Interpreter:
@@ -37,8 +39,9 @@ class Interpreter:
 
     startTelegram = b'XMX5LGBBFG1012622655'
 
-    def __init__(self, serial_settings: SerialSettings):
-        self.reader: SerialReader = SerialReader(serial_settings)
+    def __init__(self, serial_settings: SerialSettings, reader=None):
+        """reader: optional replacement of the SerialReader, anything with a getLine() method"""
+        self.reader: SerialReader = reader if reader is not None else SerialReader(serial_settings)
         self._stop_running: bool = False
         self._raw_lines: List[str] = []
         self.start_time: Optional[datetime] = None
@@ -55,13 +58,24 @@ class Interpreter:
         sample = P1Sample(requested_P1DataTypes)
         line = self.reader.getLine()
         self._raw_lines.clear()
+        parse_time = 0.0
         while line and self.startTelegram not in line:
+            if line.startswith(b'!'):  # last line of the telegram
+                sample.telegram_end = time.perf_counter()
             self._raw_lines.append(line)
+            start = time.perf_counter()
             reset, value = self.decode(line, requested_P1DataTypes)
+            parse_time += time.perf_counter() - start
             assert reset is False
             if value:
                 sample.addValue(value)
             line = self.reader.getLine()
+        instrumentation.observe('p1.parse', parse_time)
+        instrumentation.count('p1.telegrams')
+        if sample.telegram_end is not None:
+            instrumentation.observe('p1.wait_next_telegram', time.perf_counter() - sample.telegram_end)
+        else:
+            instrumentation.count('p1.incomplete_telegrams')
         return sample
 
     def runContinuously(self, requested_values: List[str], post_sample_cb: Callable[[P1Sample], None]):
@@ -116,6 +130,7 @@ class Interpreter:
             except ValueError:  # in some rare cases the string contains weird characters
                 value = None
                 logging.error(f"decodeValue: could not convert {encoded_str} to float")
+                instrumentation.count('p1.parse_errors')
             unit = encoded_str[split + 1:]
             retVal.setValue(value, unit=unit)
         else:
@@ -44,9 +44,9 @@ class P1Interface:
             getSample():            returns latest sample
     """
 
-    def __init__(self, p1_value_types: List[P1DataType]):
+    def __init__(self, p1_value_types: List[P1DataType], interpreter: Interpreter = None):
         self.reqValues = P1DataType.all_poss() if p1_value_types is None else p1_value_types
-        self.interpreter = Interpreter(SerialSettings())
+        self.interpreter = interpreter if interpreter is not None else Interpreter(SerialSettings())
         self.sample: Optional[P1Sample] = None
         self.interval = None
         self.post_sample_CB = None
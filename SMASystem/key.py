@@ -18,7 +18,7 @@ class Key:
 	tide_ab = {'tag': '6380_40452100'}
 	power_amp = {'tag': '6100_40465300', 'unit': 'A'}
 
-	productivity_total = {'tag': '6400_00260100'}
+	productivity_total = {'tag': '6400_00260100', 'unit': 'Wh'}
 	service_time = {'tag': '6400_00462E00', 'unit': 's'}
 	injection_time = {'tag': '6400_00462F00', 'unit': 's'}
 
@@ -37,6 +37,6 @@ class Key:
 	wlan_status = {'tag': '6180_084ABC00', 'unit': 'status'}
 	wlan_scan_status = {'tag': '6180_084ABB00'}
 
-	device_state = {'tag': '6180_084B1E00', 'unit': 'W'}
+	device_state = {'tag': '6180_084B1E00', 'unit': 'status'}
 	device_warning = {'tag': '6100_00411F00', 'unit': 'W'}
 	device_error = {'tag': '6100_00412000', 'unit': 'W'}
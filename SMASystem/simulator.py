@@ -0,0 +1,176 @@
+"""
+    Local stand-in for the web server of an SMA Sunny Boy, for benchmarking and failure testing without an inverter.
+    Implements login.json, sessionCheck.json, getValues.json, getLogger.json and logout.json.
+"""
+
+import json
+import math
+import random
+import string
+import threading
+import time
+import logging
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Union, Callable
+from urllib import parse
+from SMASystem.key import Key
+
+
+def daylight_power(peak: float = 3000.0) -> Callable[[], float]:
+    """Current power following the sun, with some noise"""
+    def value():
+        hour = time.localtime().tm_hour + time.localtime().tm_min / 60
+        return max(0.0, peak * math.sin(math.pi * (hour - 6) / 14)) * random.uniform(0.9, 1.0)
+    return value
+
+
+@dataclass
+class SimulatorSettings:
+    latency_seconds: float = 0.02           # fixed latency per request
+    latency_jitter_seconds: float = 0.01    # additional uniformly distributed latency
+    error_rate: float = 0.0                 # fraction of requests answered with an error
+    session_lifetime_seconds: float = 300.0
+    serial: str = '1992015033'
+    logger_step_seconds: int = 300
+    values: Dict[str, Union[float, int, Callable[[], Union[float, int]]]] = field(default_factory=lambda: {
+        Key.power_current['tag']: daylight_power(),
+        Key.productivity_total['tag']: 12345678.0,
+        Key.power_amp['tag']: 4.2,
+        Key.device_state['tag']: 307,
+    })
+
+
+class SMASimulator:
+    """
+    Serves the SMA web API on a local port. The behaviour is set by SimulatorSettings and may be changed while
+    running.
+    """
+
+    c_STATUS_KEYS = [Key.device_state['tag'], Key.ethernet_status['tag'], Key.wlan_status['tag']]
+
+    def __init__(self, settings: SimulatorSettings = None, port: int = 0):
+        self.settings = settings if settings else SimulatorSettings()
+        self.sessions: Dict[str, float] = {}  # sid: time of login
+        self.num_requests = 0
+        self.num_errors = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), MakeHandlerClass(self))
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    def start(self) -> int:
+        self._thread = threading.Thread(name='sma_simulator', target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        logging.info(f"SMA simulator listening on port {self.port}")
+        return self.port
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def expire_sessions(self):
+        with self._lock:
+            self.sessions.clear()
+
+    def handle(self, service: str, sid: Optional[str], params: dict) -> dict:
+        with self._lock:
+            self.num_requests += 1
+        time.sleep(self.settings.latency_seconds + random.uniform(0, self.settings.latency_jitter_seconds))
+        if random.random() < self.settings.error_rate:
+            with self._lock:
+                self.num_errors += 1
+            return {'err': 503}
+        if service == 'login.json':
+            return self.login(params)
+        if not self.valid_session(sid):
+            return {'err': 401}
+        if service == 'sessionCheck.json':
+            return {'result': {'cntFreeSess': 3, 'cntDwnGg': 0}}
+        elif service == 'getValues.json':
+            return {'result': {self.settings.serial: {tag: {'1': [{'val': self.value(tag)}]}
+                                                      for tag in params.get('keys', [])}}}
+        elif service == 'getLogger.json':
+            return {'result': {self.settings.serial: self.logger(int(params['tStart']), int(params['tEnd']))}}
+        elif service == 'logout.json':
+            with self._lock:
+                self.sessions.pop(sid, None)
+            return {'result': {'isLogin': False}}
+        return {'err': 404}
+
+    def login(self, params: dict) -> dict:
+        if 'right' not in params or 'pass' not in params:
+            return {'err': 401}
+        sid = ''.join(random.choice(string.ascii_letters + string.digits) for _ in range(16))
+        with self._lock:
+            self.sessions[sid] = time.monotonic()
+        return {'result': {'sid': sid}}
+
+    def valid_session(self, sid: Optional[str]) -> bool:
+        with self._lock:
+            if (login_time := self.sessions.get(sid)) is None:
+                return False
+            if time.monotonic() - login_time > self.settings.session_lifetime_seconds:
+                del self.sessions[sid]
+                return False
+            return True
+
+    def value(self, tag: str):
+        if (value := self.settings.values.get(tag)) is None:
+            return None
+        if callable(value):
+            value = value()
+        if tag in self.c_STATUS_KEYS:
+            return [{'tag': value}]
+        return value
+
+    def logger(self, start: int, end: int) -> list:
+        step = self.settings.logger_step_seconds
+        total = self.settings.values.get(Key.productivity_total['tag'], 0.0)
+        total = total() if callable(total) else total
+        result = []
+        for t in range(start - start % step, end + 1, step):
+            if t >= start:
+                result.append({'t': t, 'v': total - 10.0 * (end - t) / step})
+        return result
+
+
+def MakeHandlerClass(simulator: SMASimulator):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_POST(self):
+            parsed = parse.urlsplit(self.path)
+            service = parsed.path.rsplit('/', 1)[-1]
+            sid = parse.parse_qs(parsed.query).get('sid', [None])[0]
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                params = json.loads(self.rfile.read(length) or b'{}')
+            except json.decoder.JSONDecodeError:
+                params = {}
+            body = json.dumps(simulator.handle(service, sid, params)).encode('utf-8')
+            try:
+                self.send_response(200)
+                self.send_header("Content-type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):  # client gave up waiting
+                pass
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+if __name__ == "__main__":
+    simulator = SMASimulator(port=8081)
+    simulator.start()
+    print(f"SMA simulator running on port {simulator.port}")
+    while True:
+        time.sleep(1)
@@ -1,10 +1,10 @@
-import time
 import random
 import string
 import json
 import requests
 import warnings
 import logging
+from typing import List, Dict, Optional, Union
 
 from .right import Right
 from .key import Key
@@ -33,6 +33,11 @@ from .key import Key
 # fwUpdate: 'input_file_update.htm',
 # SslCertUpdate: 'input_file_ssl.htm'
 
+
+class SessionExpiredError(Exception):
+    """Raised when the SMA rejects a request because the session is no longer valid"""
+
+
 class WebConnect:
     """The WebConnect object contains all methods to handle SMA features
 
@@ -52,6 +57,8 @@ class WebConnect:
     __serial = None
 
     c_timeout = 0.5
+    c_logger_timeout = 10.0  # a logger response holds up to days of 5-minute records
+    c_ERR_SESSION = 401
 
     def __init__(self, ip: str, user: Right, password: str, port=None, use_ssl=False):
         """Initialize a new WebConnect object
@@ -73,6 +80,8 @@ class WebConnect:
         self.use_ssl = use_ssl
 
         self.__url = 'http://' + self.ip
+        if port:
+            self.__port = port
         if self.use_ssl:
             self.__url = 'https://' + self.ip
             self.__port = port if port else 443
@@ -111,8 +120,8 @@ class WebConnect:
             return False
 
         if 'err' in json_data:
-            time.sleep(5)
-            return self.auth()
+            logging.error(f"auth(): login refused, error {json_data['err']}")
+            return False
         else:
             self.ssid = json_data['result']['sid']
             self.cookie = headers['Cookie']
@@ -185,12 +194,27 @@ class WebConnect:
 
         :param key: The key to retrieve values from (see in the Key class)
         :type key: dict
-        :return: A list of values
-        :rtype: str | int | None
+        :return: The value of the key
+        :rtype: float | int | None
+        """
+        if (values := self.get_values([key])) is not None:
+            return values.get(key['tag'])
+
+    def get_values(self, keys: List[Dict[str, str]]) -> Optional[Dict[str, Union[float, int, None]]]:
+        """Get a set of values in one single request
+
+        :param keys: The keys to retrieve values from (see in the Key class)
+        :type keys: list
+        :return: A dict tag: value, None if the request failed. Numerical values are returned as float, status values
+            as the int status code, missing values as 0.
+        :rtype: dict | None
+        :raises SessionExpiredError: The session is not (or no longer) valid
         """
-        # TODO: Check return type
+        if self.ssid is None:
+            raise SessionExpiredError("No session")
+        tags = list(dict.fromkeys(key['tag'] for key in keys))  # remove duplicates, maintain order
         params = {
-            'keys': [key['tag']],
+            'keys': tags,
             'destDev': []
         }
         headers = self.__get_header(params)
@@ -199,22 +223,46 @@ class WebConnect:
             r = requests.post(self.__url + '/dyn/getValues.json?sid=' + self.ssid, headers=headers, json=params,
                               verify=False, timeout=self.c_timeout)
         except Exception as e:
-            logging.error(f"Exception during get_value(): {e}")
+            logging.error(f"Exception during get_values(): {e}")
             return None
 
         try:
             json_data = json.loads(r.text)
-            if 'err' in json_data:
-                return None
-            else:
-                self.__serial = list(json_data['result'].keys())[0]
-                val = json_data['result'][self.__serial][key['tag']]['1'][0]['val']
-                if val is not None:
-                    return val
-                else:
-                    return 0
         except json.decoder.JSONDecodeError:
             return None
+        self.__check_session(json_data)
+        if 'err' in json_data or 'result' not in json_data:
+            return None
+        self.__serial = list(json_data['result'].keys())[0]
+        device_data = json_data['result'][self.__serial]
+        return {tag: self.__decode_val(device_data, tag) for tag in tags}
+
+    @staticmethod
+    def __decode_val(device_data: dict, tag: str) -> Union[float, int, None]:
+        """Decode a value from a getValues response
+
+        :param device_data: The result of the device
+        :type device_data: dict
+        :param tag: The tag of the key
+        :type tag: str
+        :return: The value, the status code for status values, 0 when the device reports no value (e.g. at night)
+        :rtype: float | int | None
+        """
+        try:
+            val = device_data[tag]['1'][0]['val']
+        except (KeyError, IndexError, TypeError):
+            return None
+        if val is None:
+            return 0
+        if isinstance(val, list):  # status values are reported as [{'tag': <code>}]
+            try:
+                return int(val[0]['tag'])
+            except (IndexError, KeyError, TypeError, ValueError):
+                return None
+        try:
+            return float(val)
+        except (TypeError, ValueError):
+            return None
 
     def get_all_keys(self):
         """Get all keys from the & API
@@ -243,9 +291,12 @@ class WebConnect:
         :type start: int
         :param end: The end timestamp
         :type end: int
-        :return: All values in the timestamp range
+        :return: All values in the timestamp range, None if the request failed
         :rtype: list
+        :raises SessionExpiredError: The session is not (or no longer) valid
         """
+        if self.ssid is None:
+            raise SessionExpiredError("No session")
 
         # select all data with a step of 5 minutes
         key = 28672
@@ -261,7 +312,7 @@ class WebConnect:
 
         try:
             r = requests.post(self.__url + '/dyn/getLogger.json?sid=' + self.ssid, headers=headers, json=params,
-                              verify=False, timeout=self.c_timeout)
+                              verify=False, timeout=self.c_logger_timeout)
         except Exception as e:
             logging.error(f"Exception during get_logger: {e}")
             return None
@@ -269,14 +320,28 @@ class WebConnect:
         try:
             json_data = json.loads(r.text)
         except json.decoder.JSONDecodeError:
-            return {}
+            logging.error("get_logger: response is not valid JSON")
+            return None
 
+        self.__check_session(json_data)
         if not 'result' in json_data:
-            return {}
+            logging.error(f"get_logger: no result in response: {json_data}")
+            return None  # a failed read, not an empty range, so the backfill resumes from here later
         else:
             self.__serial = list(json_data['result'].keys())[0]
             return json_data['result'][self.__serial]
 
+    def __check_session(self, json_data: dict):
+        """Check a response for an invalid session error
+
+        :param json_data: The decoded response
+        :type json_data: dict
+        :raises SessionExpiredError: The response reports an invalid session
+        """
+        if json_data.get('err') == self.c_ERR_SESSION:
+            self.ssid = None
+            raise SessionExpiredError(f"Session rejected by {self.ip}")
+
     def __gen_sid(self):
         """Generate a random SID
 
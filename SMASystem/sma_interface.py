@@ -5,68 +5,336 @@
 
 import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, wait
 from enum import Enum, auto
-from SMASystem.sma import WebConnect
+from datetime import datetime
+from typing import List, Dict, Optional, Union, Tuple
+from SMASystem.sma import WebConnect, SessionExpiredError
 from SMASystem.key import Key
 from SMASystem.right import Right
+from DataHolder.data_item import DataItemSpec, DataItem
 from Utils.settings import Settings
+from Utils.instrumentation import instrumentation, labels
 
 
 class SMADataType(Enum):
 
     SOLAR = auto()
+    SOLAR_TOTAL = auto()
+    SOLAR_DC_CURRENT = auto()
+    INVERTER_STATE = auto()
+
+
+class SMAStatus(Enum):
+
+    OK = auto()               # fresh value from the inverter
+    READ_FAILED = auto()      # request failed, last cached value is returned
+    AUTHENTICATING = auto()   # re-authentication running in the background, last cached value is returned
+    CIRCUIT_OPEN = auto()     # authentication failed repeatedly, no requests until cooldown has passed
+
+
+class SMAInverter:
+    """
+        Connection to the web server of one inverter.
+
+        The session is assumed to be valid until a request is refused with a session error. Re-authentication then
+        runs in a background thread with exponential backoff; after a number of consecutive failures the circuit
+        opens and no requests are made until the cooldown has passed. Meanwhile readers get the last cached values.
+    """
+
+    def __init__(self, name: str, host: str, password: str, port: int = None):
+        self.name = name
+        self.client = WebConnect(host, Right.USER, password, port=port)
+        self.status = SMAStatus.AUTHENTICATING
+        self.cached_values: Optional[Dict[str, Union[float, int, None]]] = None
+        self.cached_time: Optional[float] = None
+        self.cache_max_age = Settings().sma_cache_max_age_seconds()
+        self.pending: Optional[Future] = None  # live poll that is still running
+        self._pending_lock = threading.Lock()
+        self._status_lock = threading.Lock()  # status is changed by the authentication, poll and backfill threads
+        self._auth_lock = threading.Lock()
+        self._auth_thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self.start_authentication()
+
+    def start_authentication(self):
+        """Starts the background authentication, unless it is already running"""
+        with self._auth_lock:
+            if self._auth_thread is not None and self._auth_thread.is_alive():
+                return
+            self.transition(SMAStatus.AUTHENTICATING, (SMAStatus.OK,))
+            self._auth_thread = threading.Thread(name=f'sma_auth_{self.name}', target=self.authenticate, daemon=True)
+            self._auth_thread.start()
+
+    def transition(self, status: SMAStatus, from_statuses: Tuple[SMAStatus, ...] = None) -> SMAStatus:
+        """Sets the status, if from_statuses is given only from one of these; returns the resulting status"""
+        with self._status_lock:
+            if from_statuses is None or self.status in from_statuses:
+                self.status = status
+            return self.status
+
+    def submit_poll(self, executor: ThreadPoolExecutor, method, *args) -> Optional[Future]:
+        """Submits method(self, *args) as live poll, unless the previous one is still running; None if not submitted"""
+        with self._pending_lock:
+            if self.pending is not None and not self.pending.done():
+                return None
+            self.pending = executor.submit(method, self, *args)
+            return self.pending
+
+    def authenticate(self):
+        backoff = Settings().sma_backoff_start_seconds()
+        max_backoff = Settings().sma_backoff_max_seconds()
+        max_failures = Settings().sma_circuit_failures()
+        cooldown = Settings().sma_circuit_cooldown_seconds()
+        delay = backoff
+        failures = 0
+        while not self._stop_event.is_set():
+            if self.client.auth() is True:
+                logging.info(f"Authentication on SMA inverter {self.name}: success")
+                self.transition(SMAStatus.OK)
+                return
+            failures += 1
+            instrumentation.count('sma.auth_failures', inverter=self.name)
+            if failures >= max_failures:
+                logging.error(f"SMA {self.name}: authentication failed {failures} times, circuit open for {cooldown} s")
+                self.transition(SMAStatus.CIRCUIT_OPEN)
+                instrumentation.count('sma.circuit_opened', inverter=self.name)
+                self._stop_event.wait(cooldown)
+                self.transition(SMAStatus.AUTHENTICATING)
+                failures = 0
+                delay = backoff
+            else:
+                logging.warning(f"SMA {self.name}: authentication failed, retry in {delay} s")
+                self._stop_event.wait(delay)
+                delay = min(2 * delay, max_backoff)
+
+    def request(self, method, *args):
+        """Performs a request on the client, a session error triggers re-authentication"""
+        if self.status not in (SMAStatus.OK, SMAStatus.READ_FAILED):
+            self.start_authentication()
+            return None
+        try:
+            return method(*args)
+        except SessionExpiredError as err:
+            logging.warning(f"SMA {self.name}: session expired: {err}")
+            instrumentation.count('sma.sessions_expired', inverter=self.name)
+            self.transition(SMAStatus.AUTHENTICATING, (SMAStatus.OK, SMAStatus.READ_FAILED))
+            self.start_authentication()
+
+    def getValues(self, keys: List[Dict[str, str]]) -> Optional[Dict[str, Union[float, int, None]]]:
+        """Retrieves the values of a set of keys in one request, returns a dict tag: value"""
+        return self.request(self.client.get_values, keys)
+
+    def poll(self, keys: List[Dict[str, str]]) -> Tuple[Optional[Dict[str, Union[float, int, None]]], SMAStatus]:
+        """
+        Retrieves the keys in one request. If this fails the last values are returned, provided these are not older
+        than the configured maximum age. The status tells whether the values are fresh.
+        """
+        if (values := self.getValues(keys)) is not None:
+            self.cached_values = values
+            self.cached_time = time.monotonic()
+            self.transition(SMAStatus.OK, (SMAStatus.READ_FAILED,))
+            return values, SMAStatus.OK
+        instrumentation.count('sma.read_failures', inverter=self.name)
+        return self.cached(), self.transition(SMAStatus.READ_FAILED, (SMAStatus.OK,))
+
+    def cached(self) -> Optional[Dict[str, Union[float, int, None]]]:
+        if self.cached_time is not None and time.monotonic() - self.cached_time <= self.cache_max_age:
+            return self.cached_values
+
+    def getLoggerRecords(self, start: int, end: int) -> Optional[List[Tuple[int, float]]]:
+        """
+        Retrieves the 5-minute logger of the inverter in the range [start, end], as a time-ordered list of
+        (timestamp, total yield in Wh). Returns None if the request failed.
+        """
+        if (records := self.request(self.client.get_logger, start, end)) is None:
+            return None
+        result = []
+        for record in records:
+            try:
+                if record['v'] is not None:
+                    result.append((int(record['t']), float(record['v'])))
+            except (KeyError, TypeError, ValueError):
+                logging.debug(f"getLoggerRecords: skipping record {record}")
+        return sorted(result)
+
+    def close(self):
+        self._stop_event.set()
+        if self.client.ssid:
+            self.client.logout()
 
 
 class SMAInterface:
     """
-        Interface to the SMA Sunny Boy web server.
+        Interface to the SMA Sunny Boy web servers of one or more inverters.
+
+        All inverters are polled concurrently, so a poll takes as long as the slowest inverter. The logger downloads
+        of the backfill run in an executor of their own, with a longer timeout, next to the live polls. A sample
+        holds every signal per inverter (SOLAR_EAST, ...) and, for the additive signals, the sum over the inverters
+        (SOLAR, ...).
     """
 
     c_POWER_UNIT = 'W'
+    c_ENERGY_UNIT = 'Wh'
+    c_SUMMED_SIGNALS = [SMADataType.SOLAR.name, SMADataType.SOLAR_TOTAL.name, SMADataType.SOLAR_DC_CURRENT.name]
+
+    def __init__(self, inverters: Dict[str, Tuple[str, Optional[int]]] = None):
+        """inverters: dict name: (host, port), default from the settings"""
+        if inverters is None:
+            inverters = Settings().get_sma_inverters()
+        self.signals: Dict[str, Dict[str, str]] = self.init_signals(Settings().get_sma_signals())
+        self.inverters: List[SMAInverter] = [SMAInverter(name, host, Settings().smaPassword(), port=port)
+                                             for name, (host, port) in inverters.items()]
+        self.poll_timeout = Settings().sma_poll_timeout_seconds()
+        self.logger_timeout = Settings().sma_logger_timeout_seconds()
+        self.executor = ThreadPoolExecutor(max_workers=len(self.inverters), thread_name_prefix='sma_poll')
+        self.logger_executor = ThreadPoolExecutor(max_workers=len(self.inverters), thread_name_prefix='sma_logger')
+        instrumentation.register_gauge('sma.status', self.status_gauge)
+
+    @staticmethod
+    def init_signals(signal_keys: Dict[str, str]) -> Dict[str, Dict[str, str]]:
+        """Maps the configured signal names on the keys of the inverter, SOLAR is always sampled"""
+        signals = {SMADataType.SOLAR.name: Key.power_current}
+        for signal, key_name in signal_keys.items():
+            if (key := getattr(Key, key_name, None)) is not None:
+                signals[signal] = key
+            else:
+                logging.error(f"SMA interface: unknown key {key_name} for signal {signal}")
+        return signals
+
+    @staticmethod
+    def inverter_signal(signal: str, inverter: SMAInverter) -> str:
+        return f"{signal}_{inverter.name.upper()}"
+
+    def signal_names(self) -> List[str]:
+        """Names of the signals in a sample, in the order of the sample"""
+        return ([signal for signal in self.signals if signal in self.c_SUMMED_SIGNALS] +
+                [self.inverter_signal(signal, inverter) for inverter in self.inverters for signal in self.signals])
 
-    def __init__(self):
-        self.client = self.initConnection()
+    def poll_all(self, method, *args) -> Dict[str, tuple]:
+        """
+        Runs method(inverter, *args) as live poll for all inverters concurrently, waiting at most the poll timeout.
+        An inverter whose previous poll is still running is not polled again. Returns a dict inverter name: result,
+        an inverter that did not finish in time is absent.
+        """
+        futures = {}
+        for inverter in self.inverters:
+            if (future := inverter.submit_poll(self.executor, method, *args)) is None:
+                logging.debug(f"SMA {inverter.name}: previous poll still running")
+                continue
+            futures[inverter.name] = future
+        return self.results(futures, self.poll_timeout, 'poll')
 
     @staticmethod
-    def initConnection():
-        client = WebConnect(Settings().smaHostname(), Right.USER, Settings().smaPassword())
-        result = client.auth()
-        if result is True:
-            logging.info(f"Initializing connection to SMA Interface: success")
-            return client
-        else:
-            logging.warning("Failed to initialize SMA interface")
+    def results(futures: Dict[str, Future], timeout: float, request: str) -> Dict[str, tuple]:
+        """Results of the futures done within the timeout, by inverter name"""
+        wait(futures.values(), timeout=timeout)
+        results = {}
+        for name, future in futures.items():
+            if future.done():
+                try:
+                    results[name] = future.result()
+                except Exception as err:
+                    logging.error(f"SMA {name}: {request} failed: {err}")
+                    instrumentation.count(f'sma.{request}_errors', inverter=name)
+            else:
+                instrumentation.count(f'sma.{request}_timeouts', inverter=name)
+        return results
+
+    def getValues(self, keys: List[Dict[str, str]]) -> Dict[str, Optional[Dict[str, Union[float, int, None]]]]:
+        """Retrieves the values of a set of keys from all inverters, returns a dict inverter name: {tag: value}"""
+        results = self.poll_all(SMAInverter.getValues, keys)
+        return {inverter.name: results.get(inverter.name) for inverter in self.inverters}
 
     def getCurrentPower(self):
-        self.validateConnection()
-        if self.client:
-            return self.client.get_value(Key.power_current)
+        return self.summed(Key.power_current, self.getValues([Key.power_current]).values())
 
     def getTotal(self):
-        self.validateConnection()
-        if self.client:
-            return self.client.get_value(Key.productivity_total)
-
-    def getHistory(self, time_in_seconds):
-        self.validateConnection()
-        if self.client:
-            now_time = int(time.time())
-            return self.client.get_logger(now_time - time_in_seconds, now_time)
-
-    def validateConnection(self):
-        if self.client:
-            if self.client.check_connection() is False:
-                logging.error("SMA interface connection check failed")
-                self.client = self.initConnection()
-        else:
-            self.client = self.initConnection()
+        return self.summed(Key.productivity_total, self.getValues([Key.productivity_total]).values())
+
+    @staticmethod
+    def summed(key: Dict[str, str], values_per_inverter) -> Optional[float]:
+        values = [values.get(key['tag']) for values in values_per_inverter if values is not None]
+        values = [value for value in values if value is not None]
+        return sum(values) if values else None
+
+    def getSample(self, timestamp: float = None, signals: List[str] = None) -> Tuple[Optional[DataItem], SMAStatus]:
+        """
+        Retrieves all configured signals of all inverters. An inverter that fails or does not respond in time
+        contributes its last cached values; the status is OK only if all values are fresh.
+        signals: the signals of the returned data item in this order, default signal_names()
+        """
+        results = self.poll_all(SMAInverter.poll, list(self.signals.values()))
+        statuses = []
+        values_per_inverter: Dict[str, Optional[Dict[str, Union[float, int, None]]]] = {}
+        for inverter in self.inverters:
+            if inverter.name in results:
+                values_per_inverter[inverter.name], status = results[inverter.name]
+            else:
+                values_per_inverter[inverter.name], status = inverter.cached(), SMAStatus.READ_FAILED
+            statuses.append(status)
+        if all(values is None for values in values_per_inverter.values()):
+            return None, next((status for status in statuses if status != SMAStatus.OK), SMAStatus.READ_FAILED)
+        status = SMAStatus.OK if all(status == SMAStatus.OK for status in statuses) else SMAStatus.READ_FAILED
+
+        sample_values = {}
+        units = {}
+        for signal, key in self.signals.items():
+            if signal in self.c_SUMMED_SIGNALS:
+                sample_values[signal] = self.summed(key, values_per_inverter.values())
+                units[signal] = key.get('unit')
+            for inverter in self.inverters:
+                values = values_per_inverter[inverter.name]
+                sample_values[self.inverter_signal(signal, inverter)] = values.get(key['tag']) if values else None
+                units[self.inverter_signal(signal, inverter)] = key.get('unit')
+        if signals is None:
+            signals = self.signal_names()
+        data_item = DataItem(DataItemSpec({signal: units.get(signal) for signal in signals}),
+                             timestamp=timestamp if timestamp is not None else datetime.timestamp(datetime.now()))
+        for signal in signals:
+            if signal not in sample_values:
+                logging.debug(f"SMA interface: signal {signal} is not sampled")
+            data_item.set_value(signal, sample_values.get(signal))
+        return data_item, status
+
+    def getLoggerRecords(self, start: int, end: int) -> Optional[List[Tuple[int, float]]]:
+        """
+        Retrieves the 5-minute logger of all inverters in the range [start, end], as a time-ordered list of
+        (timestamp, total yield in Wh summed over the inverters). Only timestamps logged by all inverters are
+        returned. Returns None if the request failed for one of the inverters.
+        """
+        futures = {inverter.name: self.logger_executor.submit(inverter.getLoggerRecords, start, end)
+                   for inverter in self.inverters}
+        results = self.results(futures, self.logger_timeout, 'logger')
+        totals: Dict[int, List[float]] = {}
+        for inverter in self.inverters:
+            if (records := results.get(inverter.name)) is None:
+                return None
+            for timestamp, total in records:
+                totals.setdefault(timestamp, []).append(total)
+        return sorted((timestamp, sum(values)) for timestamp, values in totals.items()
+                      if len(values) == len(self.inverters))
+
+    def status_gauge(self) -> Dict[str, float]:
+        """1 for the current status of every inverter, 0 for the other statuses"""
+        return {labels(inverter=inverter.name, status=status.name): int(inverter.status == status)
+                for inverter in self.inverters for status in SMAStatus}
+
+    def getStatus(self) -> SMAStatus:
+        statuses = [inverter.status for inverter in self.inverters]
+        return next((status for status in statuses if status != SMAStatus.OK), SMAStatus.OK)
 
     def __del__(self):
-        if self.client:
-            self.client.logout()
+        for inverter in self.inverters:
+            inverter.close()
+        self.executor.shutdown(wait=False)
+        self.logger_executor.shutdown(wait=False)
 
 
 if __name__ == "__main__":
     smaInterface = SMAInterface()
+    time.sleep(2)
     print(f"SMA power: {smaInterface.getCurrentPower()}")
-    print(f"SMA keys: {smaInterface.client.get_all_keys()}")
+    print(f"SMA sample: {smaInterface.getSample()}")
+    print(f"SMA keys: {[inverter.client.get_all_keys() for inverter in smaInterface.inverters]}")
@@ -0,0 +1,96 @@
+import inspect
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Callable, Optional, Any
+from Utils.instrumentation import Histogram, c_LATENCY_BOUNDS
+
+
+@dataclass
+class JobDefinition:
+    """
+    A job that can be scheduled by name. The function is called with the ScheduledJob holding its configuration.
+    Functions of jobs on the process executor are pickled to run in another process: they must be module level
+    functions, not bound methods, and cannot use the state of this process such as data stores and connections.
+    """
+    name: str
+    function: Callable
+    executor: str = 'thread'  # thread or process
+    description: str = ''
+
+
+class JobRegistry:
+
+    c_EXECUTORS = ('thread', 'process')
+
+    def __init__(self):
+        self.jobs: Dict[str, JobDefinition] = {}
+
+    def register(self, name: str, function: Callable, executor: str = 'thread', description: str = ''):
+        if executor not in self.c_EXECUTORS:
+            raise ValueError(f"Job {name}: executor {executor} not in {self.c_EXECUTORS}")
+        if name in self.jobs:
+            raise ValueError(f"Job {name} is registered twice")
+        if executor == 'process' and inspect.ismethod(function):
+            raise ValueError(f"Job {name}: a bound method cannot run on the process executor")
+        self.jobs[name] = JobDefinition(name, function, executor, description)
+
+    def get(self, name: str) -> JobDefinition:
+        try:
+            return self.jobs[name]
+        except KeyError:
+            raise ValueError(f"No job registered with name {name}, registered: {list(self.jobs)}")
+
+
+def timed_call(function: Callable, *args) -> float:
+    """Runs the job, in the executor, and returns its duration"""
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+class JobMetrics:
+    """Outcome and duration of the runs of one job"""
+
+    def __init__(self):
+        self.durations = Histogram(c_LATENCY_BOUNDS + [60.0, 300.0, 900.0])
+        self.succeeded = 0
+        self.failed = 0
+        self.missed = 0
+        self.skipped = 0  # max instances reached
+        self.last_run: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+        self.lock = threading.Lock()
+
+    def executed(self, run_time: datetime, duration: float):
+        self.durations.observe(duration)
+        with self.lock:
+            self.succeeded += 1
+            self.last_run = run_time
+
+    def error(self, run_time: datetime, exception: BaseException):
+        with self.lock:
+            self.failed += 1
+            self.last_run = run_time
+            self.last_error = repr(exception)
+
+    def missed_run(self):
+        with self.lock:
+            self.missed += 1
+
+    def skipped_run(self):
+        with self.lock:
+            self.skipped += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+                "missed": self.missed,
+                "skipped": self.skipped,
+                "last_run": str(self.last_run) if self.last_run else None,
+                "last_error": self.last_error,
+                "duration_s": self.durations.snapshot(),
+            }
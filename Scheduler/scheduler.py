@@ -1,37 +1,91 @@
 from datetime import datetime, timedelta
 import logging
+from typing import Dict, Any
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.executors.pool import ThreadPoolExecutor, ProcessPoolExecutor
+from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES
 from Utils.settings import Settings
 from Application.processor import Processor
+from Scheduler.job_registry import JobRegistry, JobMetrics, timed_call
+from DataHolder.db_interface import DBInterface
+from DataHolder.db_backup import DatabaseBackup
 
 
 class Scheduler:
     """
     Initializes scheduled events, and receives and handles events.
+    Jobs are registered by name in the job registry; the configured jobs are scheduled on the thread or process
+    executor of their registration, with per-job max instances, coalescing and misfire grace time. The process
+    executor is started only when a configured job runs on it.
     """
 
     def __init__(self, processor: Processor):
         self.processor = processor
-        self.scheduler = BackgroundScheduler(timezone="Europe/Berlin")
+        self.registry = JobRegistry()
+        self.register_jobs(self.registry)
+        self.metrics: Dict[str, JobMetrics] = {}
+        executors = {'thread': ThreadPoolExecutor(Settings().scheduler_thread_pool_size())}
+        if any(self.registry.get(job_id).executor == 'process' for job_id in Settings().scheduled_jobs()):
+            executors['process'] = ProcessPoolExecutor(Settings().scheduler_process_pool_size())
+        self.scheduler = BackgroundScheduler(timezone="Europe/Berlin", executors=executors)
+        self.scheduler.add_listener(self.job_event,
+                                    EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
         self.initialize(self.scheduler)
 
+    def register_jobs(self, registry: JobRegistry):
+        registry.register('persist', self.persist, description="average of the source over the interval")
+        registry.register('sma_backfill', self.sma_backfill, description="SMA logger history")
+        registry.register('db_backup', self.db_backup, description="online backup of the database")
+
     def initialize(self, scheduler: BackgroundScheduler):
         job_ids = Settings().scheduled_jobs()
         for job_id in job_ids:
             sched_job = ScheduledJob(job_id)
-            scheduler.add_job(self.exec_job, 'interval', minutes=sched_job.interval_minutes,
-                              kwargs={'id': job_id, 'source': sched_job.source, 'dest': sched_job.destination},
-                              start_date=datetime.now() + timedelta(minutes=sched_job.start_delay_minutes), id=job_id)
+            definition = self.registry.get(job_id)
+            self.metrics[job_id] = JobMetrics()
+            scheduler.add_job(timed_call, 'interval', minutes=sched_job.interval_minutes,
+                              args=(definition.function, sched_job), executor=definition.executor,
+                              max_instances=sched_job.max_instances, coalesce=sched_job.coalesce,
+                              misfire_grace_time=sched_job.misfire_grace_seconds,
+                              start_date=datetime.now() + timedelta(minutes=sched_job.start_delay_minutes), id=job_id,
+                              name=job_id)
         scheduler.start()
 
-    def exec_job(self, **kwargs):
-        job_id = kwargs['id']
-        job = self.scheduler.get_job(job_id=job_id)
-        interval = job.trigger.interval
-        if job_id == "persist":
-            self.processor.transfer_derived_value(source=kwargs['source'], dest=kwargs['dest'], interval=interval)
-        else:
-            raise NotImplementedError
+    def job_event(self, event):
+        if (metrics := self.metrics.get(event.job_id)) is None:
+            return
+        if event.code == EVENT_JOB_EXECUTED:
+            metrics.executed(event.scheduled_run_time, event.retval)
+        elif event.code == EVENT_JOB_ERROR:
+            metrics.error(event.scheduled_run_time, event.exception)
+            logging.error(f"Job {event.job_id} failed: {event.exception!r}")
+        elif event.code == EVENT_JOB_MISSED:
+            metrics.missed_run()
+            logging.warning(f"Job {event.job_id} missed its run at {event.scheduled_run_time}")
+        elif event.code == EVENT_JOB_MAX_INSTANCES:
+            metrics.skipped_run()
+            logging.warning(f"Job {event.job_id} skipped, maximum number of running instances reached")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        res = {}
+        for job_id, metrics in self.metrics.items():
+            job = self.scheduler.get_job(job_id)
+            res[job_id] = dict(metrics.snapshot(), executor=self.registry.get(job_id).executor,
+                               next_run=str(job.next_run_time) if job and job.next_run_time else None)
+        return res
+
+    def persist(self, job):
+        self.processor.transfer_derived_value(source=job.source, dest=job.destination,
+                                              interval=timedelta(minutes=job.interval_minutes))
+
+    def sma_backfill(self, job):
+        self.processor.backfill_sma_history(dest=job.destination)
+
+    @staticmethod
+    def db_backup(job):
+        DatabaseBackup(DBInterface.db_file_name(), backup_dir=job.destination, keep=Settings().backup_keep(),
+                       pages_per_step=Settings().backup_pages_per_step(),
+                       step_pause_seconds=Settings().backup_step_pause_seconds()).run()
 
 
 class ScheduledJob:
@@ -42,3 +96,6 @@ class ScheduledJob:
         self.start_delay_minutes = Settings().start_delay_minutes(job_id)
         self.source = Settings().source(job_id)
         self.destination = Settings().destination(job_id)
+        self.max_instances = Settings().max_instances(job_id)
+        self.coalesce = Settings().coalesce(job_id)
+        self.misfire_grace_seconds = Settings().misfire_grace_seconds(job_id)
@@ -0,0 +1,229 @@
+"""
+    In-memory latency instrumentation, cheap enough to stay on in production.
+
+    Stage durations are measured with the monotonic perf_counter clock and kept in histograms with fixed buckets, so
+    recording is a bisect and a few additions under a lock. Freshness is the wall clock time minus the timestamp of a
+    sample at the moment it is stored.
+
+    Counters and gauges take optional labels. A gauge is set, or computed by a registered function when the metrics
+    are read; so is a counter kept elsewhere, such as the CPU time of the process. The metrics are exported in the
+    Prometheus text format: counters as powerlogger_<name>_total, gauges as powerlogger_<name>, with the dots of the
+    name replaced by underscores, the stages as histogram powerlogger_stage_duration_seconds with label stage and the
+    freshnesses as powerlogger_freshness_seconds with label source.
+
+    Usage:
+        with instrumentation.stage('processor.store'):
+            ...
+        instrumentation.observe('p1.parse', seconds)
+        instrumentation.freshness('p1', timestamp)
+        instrumentation.count('dataholder.items_stored', len(items), store=name)
+        instrumentation.gauge('sma.circuit_open', 1, inverter=name)
+        instrumentation.register_gauge('storage.rows', lambda: {labels(store=name): rows, ...})
+        instrumentation.register_counter('process.cpu_seconds', lambda: {'': seconds})
+"""
+
+import logging
+import math
+import threading
+import time
+from bisect import bisect_left
+from typing import List, Dict, Any, Optional, Callable
+
+c_LATENCY_BOUNDS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                    10.0]  # seconds
+c_FRESHNESS_BOUNDS = [0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 300.0, 3600.0]  # seconds
+c_PREFIX = 'powerlogger_'
+
+
+def labels(**label_values) -> str:
+    """Labels in the Prometheus format, {name="value",...}, empty without labels"""
+    if not label_values:
+        return ''
+    escaped = (name + '="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+               for name, value in sorted(label_values.items()))
+    return '{' + ','.join(escaped) + '}'
+
+
+def sample_value(value: float) -> str:
+    if isinstance(value, float) and not math.isfinite(value):
+        return 'NaN' if math.isnan(value) else ('+Inf' if value > 0 else '-Inf')
+    return repr(value)
+
+
+class Histogram:
+    """Counts per bucket; bucket i holds the values <= bounds[i], the last bucket the values above all bounds"""
+
+    def __init__(self, bounds: List[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.last: Optional[float] = None
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        idx = bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[idx] += 1
+            self.count += 1
+            self.sum += value
+            self.last = value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for idx, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return self.bounds[idx] if idx < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self, scale: float = 1.0) -> Dict[str, Any]:
+        with self.lock:
+            buckets = {f"{bound * scale:g}": count for bound, count in zip(self.bounds, self.counts)}
+            buckets["+Inf"] = self.counts[-1]
+            return {
+                "count": self.count,
+                "mean": self.sum / self.count * scale if self.count else None,
+                "max": self.max * scale,
+                "last": self.last * scale if self.last is not None else None,
+                "p50": self.scaled(self.quantile(0.5), scale),
+                "p99": self.scaled(self.quantile(0.99), scale),
+                "buckets": buckets,
+            }
+
+    def exposition(self, family: str, label_string: str) -> List[str]:
+        """Cumulative buckets, sum and count in the Prometheus text format"""
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.bounds + [math.inf], counts):
+            cumulative += bucket_count
+            le = '+Inf' if bound == math.inf else f"{bound:g}"
+            lines.append(f'{family}_bucket{{{label_string},le="{le}"}} {cumulative}')
+        lines.append(f"{family}_sum{{{label_string}}} {sample_value(total)}")
+        lines.append(f"{family}_count{{{label_string}}} {count}")
+        return lines
+
+    @staticmethod
+    def scaled(value: Optional[float], scale: float) -> Optional[float]:
+        return value * scale if value is not None else None
+
+
+class StageTimer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Instrumentation:
+
+    def __init__(self):
+        self.stages: Dict[str, Histogram] = {}
+        self.freshnesses: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = {}  # name and labels: count
+        self.gauges: Dict[str, float] = {}  # name and labels: value
+        self.gauge_functions: Dict[str, Callable[[], Dict[str, float]]] = {}  # name: function giving labels: value
+        self.counter_functions: Dict[str, Callable[[], Dict[str, float]]] = {}
+        self.lock = threading.Lock()
+
+    def histogram(self, name: str) -> Histogram:
+        if (histogram := self.stages.get(name)) is None:
+            with self.lock:
+                histogram = self.stages.setdefault(name, Histogram(c_LATENCY_BOUNDS))
+        return histogram
+
+    def stage(self, name: str) -> StageTimer:
+        return StageTimer(self.histogram(name))
+
+    def observe(self, name: str, seconds: float):
+        self.histogram(name).observe(seconds)
+
+    def freshness(self, source: str, timestamp: float):
+        if (histogram := self.freshnesses.get(source)) is None:
+            with self.lock:
+                histogram = self.freshnesses.setdefault(source, Histogram(c_FRESHNESS_BOUNDS))
+        histogram.observe(time.time() - timestamp)
+
+    def count(self, name: str, n: int = 1, **label_values):
+        key = name + labels(**label_values)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def gauge(self, name: str, value: float, **label_values):
+        self.gauges[name + labels(**label_values)] = value
+
+    def register_gauge(self, name: str, function: Callable[[], Dict[str, float]]):
+        """function gives the values of the gauge by labels, computed when the metrics are read"""
+        self.gauge_functions[name] = function
+
+    def register_counter(self, name: str, function: Callable[[], Dict[str, float]]):
+        """function gives the values of the counter by labels, never decreasing, computed when the metrics are read"""
+        self.counter_functions[name] = function
+
+    def computed_gauges(self) -> Dict[str, float]:
+        return self.computed(self.gauges, self.gauge_functions)
+
+    def computed_counters(self) -> Dict[str, float]:
+        with self.lock:
+            counters = dict(self.counters)
+        return self.computed(counters, self.counter_functions)
+
+    @staticmethod
+    def computed(values: Dict[str, float], functions: Dict[str, Callable[[], Dict[str, float]]]) -> Dict[str, float]:
+        res = dict(values)
+        for name, function in list(functions.items()):
+            try:
+                res.update({name + label_string: value for label_string, value in function().items()})
+            except Exception as err:
+                logging.error(f"Metric {name} failed: {err}")
+        return res
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "stages_ms": {name: histogram.snapshot(scale=1000.0) for name, histogram in sorted(self.stages.items())},
+            "freshness_s": {name: histogram.snapshot() for name, histogram in sorted(self.freshnesses.items())},
+            "counters": self.computed_counters(),
+            "gauges": self.computed_gauges(),
+        }
+
+    def exposition(self) -> str:
+        """The metrics in the Prometheus text format"""
+        lines = []
+        for kind, suffix, metrics in (('counter', '_total', self.computed_counters()),
+                                      ('gauge', '', self.computed_gauges())):
+            families: Dict[str, List[str]] = {}
+            for key, value in sorted(metrics.items()):
+                name, _, label_string = key.partition('{')
+                family = c_PREFIX + name.replace('.', '_') + suffix
+                families.setdefault(family, []).append(
+                    f"{family}{'{' + label_string if label_string else ''} {sample_value(value)}")
+            for family, samples in families.items():
+                lines.append(f"# TYPE {family} {kind}")
+                lines.extend(samples)
+        for family, label, histograms in (('stage_duration_seconds', 'stage', self.stages),
+                                          ('freshness_seconds', 'source', self.freshnesses)):
+            lines.append(f"# TYPE {c_PREFIX}{family} histogram")
+            for name, histogram in sorted(histograms.items()):
+                lines.extend(histogram.exposition(c_PREFIX + family, labels(**{label: name})[1:-1]))
+        return "\n".join(lines) + "\n"
+
+
+instrumentation = Instrumentation()
@@ -2,7 +2,7 @@ import os
 import configparser
 import serial
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Tuple, Optional, Union
 from DataHolder.buffer_attrs import Persistency, LifeSpan
 from DataHolder.data_types import DataType
 from P1System.data_classes import P1DataType
@@ -17,15 +17,78 @@ class Settings:
         configFilePath = os.path.join(currDir, 'config.ini')
         self.config.read(configFilePath)
 
-    def smaHostname(self):
-        return self.config.get('CONNECTION', 'sma_host')
+    def get_sma_inverters(self) -> Dict[str, Tuple[str, Optional[int]]]:
+        """Dict name: (host, port) of the lines name:host or name:host:port, port None for the default port"""
+        res = {}
+        for line in self.config.get('CONNECTION', 'sma_inverters').split('\n'):
+            name, address = line.split(':', 1)
+            host, _, port = address.partition(':')
+            res[name.strip()] = (host.strip(), int(port) if port.strip() else None)
+        return res
 
     def smaPassword(self):
         return self.config.get('CONNECTION', 'sma_pwd')
 
+    def sma_backoff_start_seconds(self) -> float:
+        return float(self.config.get('CONNECTION', 'sma_backoff_start_seconds'))
+
+    def sma_backoff_max_seconds(self) -> float:
+        return float(self.config.get('CONNECTION', 'sma_backoff_max_seconds'))
+
+    def sma_circuit_failures(self) -> int:
+        return int(self.config.get('CONNECTION', 'sma_circuit_failures'))
+
+    def sma_circuit_cooldown_seconds(self) -> float:
+        return float(self.config.get('CONNECTION', 'sma_circuit_cooldown_seconds'))
+
+    def sma_cache_max_age_seconds(self) -> float:
+        return float(self.config.get('CONNECTION', 'sma_cache_max_age_seconds'))
+
+    def sma_poll_timeout_seconds(self) -> float:
+        return float(self.config.get('CONNECTION', 'sma_poll_timeout_seconds'))
+
+    def sma_logger_timeout_seconds(self) -> float:
+        return float(self.config.get('CONNECTION', 'sma_logger_timeout_seconds'))
+
     def webServerPort(self):
         return int(self.config.get('WEBSERVER', 'port'))
 
+    def events_queue_size(self) -> int:
+        return int(self.config.get('WEBSERVER', 'events_queue_size'))
+
+    def events_heartbeat_seconds(self) -> float:
+        return float(self.config.get('WEBSERVER', 'events_heartbeat_seconds'))
+
+    def cache_entries(self) -> int:
+        return int(self.config.get('WEBSERVER', 'cache_entries'))
+
+    def cache_max_body_bytes(self) -> int:
+        return int(self.config.get('WEBSERVER', 'cache_max_body_bytes'))
+
+    def compression_min_bytes(self) -> int:
+        return int(self.config.get('WEBSERVER', 'compression_min_bytes'))
+
+    def compression_level(self) -> int:
+        return int(self.config.get('WEBSERVER', 'compression_level'))
+
+    def webserver_type(self) -> str:
+        return self.config.get('WEBSERVER', 'server')
+
+    def webserver_worker_threads(self) -> int:
+        return int(self.config.get('WEBSERVER', 'worker_threads'))
+
+    def webserver_read_threads(self) -> int:
+        return int(self.config.get('WEBSERVER', 'read_threads'))
+
+    def webserver_max_connections(self) -> int:
+        return int(self.config.get('WEBSERVER', 'max_connections'))
+
+    def webserver_keep_alive_seconds(self) -> float:
+        return float(self.config.get('WEBSERVER', 'keep_alive_seconds'))
+
+    def webserver_request_timeout_seconds(self) -> float:
+        return float(self.config.get('WEBSERVER', 'request_timeout_seconds'))
+
     def rs232Port(self):
         return self.config.get('RS232', 'port')
 
@@ -44,12 +107,22 @@ class Settings:
     def get_measurement_p1_signals(self) -> List[P1DataType]:
         return self.config.get('DATARETRIEVAL', 'p1_signals').split()
 
+    def get_sma_signals(self) -> Dict[str, str]:
+        res = {}
+        for line in self.config.get('DATARETRIEVAL', 'sma_signals').split('\n'):
+            signal, key_name = line.split(':')
+            res[signal.strip()] = key_name.strip()
+        return res
+
     def get_data_stores(self): # -> List[str]:
         return self.config.get('DATASTORAGE', 'data_stores').split()
 
     def get_P1_data_store(self):
         return self.config.get('DATASTORAGE', 'p1_data_store')
 
+    def get_SMA_data_store(self):
+        return self.config.get('DATASTORAGE', 'sma_data_store')
+
     def get_data_store_name(self, data_store_id) -> str:
         return self.config.get('DATASTORAGE', data_store_id + '_name')
 
@@ -94,10 +167,37 @@ class Settings:
             return int(parameter)
 
     def source(self, job_id) -> str:
-        return self.config.get('SCHEDULER', job_id + '_source')
+        return self.config.get('SCHEDULER', job_id + '_source', fallback=None)
 
     def destination(self, job_id) -> str:
-        return self.config.get('SCHEDULER', job_id + '_destination')
+        return self.config.get('SCHEDULER', job_id + '_destination', fallback=None)
+
+    def max_instances(self, job_id) -> int:
+        return int(self.config.get('SCHEDULER', job_id + '_max_instances',
+                                   fallback=self.config.get('SCHEDULER', 'max_instances')))
+
+    def coalesce(self, job_id) -> bool:
+        return self.config.get('SCHEDULER', job_id + '_coalesce',
+                               fallback=self.config.get('SCHEDULER', 'coalesce')) == "true"
+
+    def misfire_grace_seconds(self, job_id) -> int:
+        return int(self.config.get('SCHEDULER', job_id + '_misfire_grace_seconds',
+                                   fallback=self.config.get('SCHEDULER', 'misfire_grace_seconds')))
+
+    def scheduler_thread_pool_size(self) -> int:
+        return int(self.config.get('SCHEDULER', 'thread_pool_size'))
+
+    def scheduler_process_pool_size(self) -> int:
+        return int(self.config.get('SCHEDULER', 'process_pool_size'))
+
+    def backup_keep(self) -> int:
+        return int(self.config.get('BACKUP', 'keep'))
+
+    def backup_pages_per_step(self) -> int:
+        return int(self.config.get('BACKUP', 'pages_per_step'))
+
+    def backup_step_pause_seconds(self) -> float:
+        return float(self.config.get('BACKUP', 'step_pause_seconds'))
 
     def data_dir_name(self):
         return self.config.get('PATHS', 'data')
@@ -117,20 +217,56 @@ class Settings:
     def get_signal_to_shift(self) -> str:
         return self.config.get('PROCESSING', 'signal_to_shift')
 
-    def get_differential_source_signal(self) -> DataType:
-        return self.config.get('PROCESSING', 'differential_source_signal')
+    def get_pipelines(self) -> List[str]:
+        return self.config.get('PIPELINES', 'pipelines', fallback='').split()
+
+    def get_pipeline_source(self, pipeline: str) -> Tuple[str, str]:
+        """Source (data store or p1_extra) and signal"""
+        source, signal = self.config.get('PIPELINES', pipeline + '_source').split()
+        return source, signal
+
+    def get_pipeline_stages(self, pipeline: str) -> List[Tuple[str, str, str, Dict[str, Union[float, str]]]]:
+        """List of (stage, operator, input, parameters), from lines 'stage: operator input [param=value ...]'"""
+        res = []
+        for line in self.config.get('PIPELINES', pipeline + '_stages').split('\n'):
+            stage, definition = line.split(':')
+            operator, input_stage, *params = definition.split()
+            res.append((stage.strip(), operator, input_stage,
+                        {key: self.parse_number(value) for key, value in (param.split('=') for param in params)}))
+        return res
+
+    def get_pipeline_sinks(self, pipeline: str) -> List[Tuple[str, str, str, Optional[str]]]:
+        """List of (stage, data store, signal, unit), from lines 'stage data_store signal [unit]'"""
+        res = []
+        for line in self.config.get('PIPELINES', pipeline + '_sinks').split('\n'):
+            stage, data_store, signal, *unit = line.split()
+            res.append((stage, data_store, signal, unit[0] if unit else None))
+        return res
+
+    @staticmethod
+    def parse_number(value: str) -> Union[float, str]:
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+    def get_energy_signals(self) -> List[str]:
+        return self.config.get('PROCESSING', 'energy_signals').split()
+
+    def get_energy_max_gap_seconds(self) -> float:
+        return float(self.config.get('PROCESSING', 'energy_max_gap_seconds'))
 
-    def get_filtered_data_store(self) -> str:
-        return self.config.get('PROCESSING', 'filtered_data_store')
+    def get_energy_gap_rule(self) -> str:
+        return self.config.get('PROCESSING', 'energy_gap_rule')
 
-    def get_differential_dest_data_store(self) -> str:
-        return self.config.get('PROCESSING', 'differential_dest_data_store')
+    def get_energy_flush_seconds(self) -> float:
+        return float(self.config.get('PROCESSING', 'energy_flush_seconds'))
 
-    def get_differential_dest_signal(self) -> str:
-        return self.config.get('PROCESSING', 'differential_dest_signal')
+    def sma_backfill_chunk_hours(self) -> float:
+        return float(self.config.get('PROCESSING', 'sma_backfill_chunk_hours'))
 
-    def get_differential_dest_unit(self) -> str:
-        return self.config.get('PROCESSING', 'differential_dest_unit')
+    def sma_backfill_max_days(self) -> float:
+        return float(self.config.get('PROCESSING', 'sma_backfill_max_days'))
 
     def get_config(self):
         if os.name == 'nt':
@@ -144,25 +280,72 @@ class Settings:
         else:
             return self.config.get('ZWAVE', 'device_linux')
 
+    def get_zwave_journal_file(self) -> str:
+        return self.config.get('ZWAVE', 'journal_file')
+
+    def get_zwave_journal_max_bytes(self) -> int:
+        return int(eval(self.config.get('ZWAVE', 'journal_max_bytes')))
+
+    def get_zwave_journal_backup_count(self) -> int:
+        return int(self.config.get('ZWAVE', 'journal_backup_count'))
+
+    def get_zwave_journal_queue_size(self) -> int:
+        return int(self.config.get('ZWAVE', 'journal_queue_size'))
+
+    def get_zwave_journal_flush_seconds(self) -> float:
+        return float(self.config.get('ZWAVE', 'journal_flush_seconds'))
+
+    def get_zwave_coalesce_window_seconds(self) -> float:
+        return float(self.config.get('ZWAVE', 'coalesce_window_seconds'))
+
+    def get_zwave_deadbands(self) -> Dict[str, float]:
+        """Dict signal: deadband"""
+        res = {}
+        for deadband in self.config.get('ZWAVE', 'deadbands').split():
+            signal, value = deadband.split(':')
+            res[signal] = float(value)
+        return res
+
+    def get_zwave_worker_batch_size(self) -> int:
+        return int(self.config.get('ZWAVE', 'worker_batch_size'))
+
+    def get_zwave_worker_max_attempts(self) -> int:
+        return int(self.config.get('ZWAVE', 'worker_max_attempts'))
+
+    def get_zwave_worker_retry_seconds(self) -> float:
+        return float(self.config.get('ZWAVE', 'worker_retry_seconds'))
+
+    def get_zwave_pending_file(self) -> str:
+        return self.config.get('ZWAVE', 'pending_file')
+
     def get_zwave_subscriptions(self) -> Dict[int, List[str]]:
+        """Subscribed value labels per node, node '*' holds the labels subscribed for every node"""
         res = {}
         for subscr in self.config.get('ZWAVE', 'subscriptions').split('\n'):
             split_res = subscr.split(':')
-            node = int(split_res[0])
+            node = split_res[0].strip() if split_res[0].strip() == '*' else int(split_res[0])
             val_ids = [val for val in split_res[1].split(',')]
             res[node] = val_ids
         return res
 
-    def get_ZWave_data_store(self, node: int, data_types: List[str]) -> str:
-        assert len(data_types) == 1  # Implemented for single data type
-        data_type = data_types[0]
-        if node == 2 and data_type == 'TEMPERATURE':
-            return self.get_data_store_name('zwave_node2_temperature')
-        elif node == 2 and data_type == 'RELATIVE_HUMIDITY':
-            return self.get_data_store_name('zwave_node2_humid')
-        elif node == 3 and data_type == 'TEMPERATURE':
-            return self.get_data_store_name('zwave_node3_temperature')
-        elif node == 3 and data_type == 'RELATIVE_HUMIDITY':
-            return self.get_data_store_name('zwave_node3_humid')
-        else:
-            raise NotImplementedError
+    def get_zwave_routes(self) -> Dict[tuple, str]:
+        """Dict (node, value label): data store id"""
+        res = {}
+        for route in self.config.get('ZWAVE', 'routes').split('\n'):
+            node, label, data_store_id = route.split(':')
+            res[(int(node), label.strip())] = data_store_id.strip()
+        return res
+
+    def get_zwave_auto_store_persistency(self) -> Persistency:
+        return Persistency.Persistent if self.config.get('ZWAVE', 'auto_store_persistency') == "persistent" \
+            else Persistency.Volatile
+
+    def get_zwave_auto_store_lifespan(self) -> LifeSpan:
+        return LifeSpan.Circular if self.config.get('ZWAVE', 'auto_store_lifespan') == "circular" \
+            else LifeSpan.Linear
+
+    def get_zwave_auto_store_buflen(self) -> int:
+        return eval(self.config.get('ZWAVE', 'auto_store_buflen'))
+
+    def get_zwave_auto_store_db(self) -> str:
+        return self.config.get('ZWAVE', 'auto_store_db')
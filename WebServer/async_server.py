@@ -0,0 +1,181 @@
+import asyncio
+import http.client
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from email.utils import formatdate
+from http import HTTPStatus
+from typing import Optional, Tuple
+from Utils.settings import Settings
+from Utils.instrumentation import instrumentation
+from WebServer.request_handler import RequestHandler
+from WebServer.response import Response
+
+Headers = http.client.HTTPMessage  # case insensitive, as the headers of BaseHTTPRequestHandler
+
+
+class AsyncServer:
+    """
+    HTTP/1.1 server on asyncio serving the views of the RequestHandler, the alternative to ThreadedServer.
+    One event loop thread handles all connections, with keep-alive. The views and the production of the chunks of
+    streamed responses run in a bounded pool of worker threads; event streams, which wait for new data, run in a
+    pool bounded by the connection limit. Connections beyond the limit get 503, idle connections are closed after
+    keep_alive_seconds and a view taking longer than request_timeout_seconds gets 504. A view that timed out keeps
+    its worker thread until it ends; while all worker threads are held by such views, requests get 503 at once.
+    """
+
+    c_MAX_HEADERS = 100
+
+    def __init__(self, processor, scheduler=None, port: int = None):
+        self.request_handler = RequestHandler(processor, scheduler)
+        self.port = port if port is not None else Settings().webServerPort()
+        self.max_connections = Settings().webserver_max_connections()
+        self.keep_alive_seconds = Settings().webserver_keep_alive_seconds()
+        self.request_timeout_seconds = Settings().webserver_request_timeout_seconds()
+        self.num_workers = Settings().webserver_worker_threads()
+        self.workers = ThreadPoolExecutor(self.num_workers, thread_name_prefix='web_worker')
+        self.num_abandoned = 0  # views that timed out and still hold a worker thread
+        self.abandoned_lock = threading.Lock()
+        self.streams = ThreadPoolExecutor(self.max_connections, thread_name_prefix='web_stream')
+        self.num_connections = 0
+        self.num_rejected = 0
+        self.started = threading.Event()
+        self.runServer()
+
+    def runServer(self):
+        daemon = threading.Thread(name='daemon_server', target=self.start_server, daemon=True)
+        daemon.start()
+        self.started.wait()
+
+    def start_server(self):
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        server = await asyncio.start_server(self.connection, host='0.0.0.0', port=self.port)  # as ThreadedServer
+        self.port = server.sockets[0].getsockname()[1]
+        logging.info(f"Web server on port {self.port}")
+        self.started.set()
+        async with server:
+            await server.serve_forever()
+
+    async def connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if self.num_connections >= self.max_connections:
+            self.num_rejected += 1
+            instrumentation.count('http.rejected_connections')
+            logging.warning(f"Connection limit of {self.max_connections} reached, {self.num_rejected} rejected")
+            await self.send(writer, Response.error(503, "Too many connections"), 'GET', keep_alive=False)
+            writer.close()
+            return
+        self.num_connections += 1
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    request = await asyncio.wait_for(self.read_request(reader), self.keep_alive_seconds)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, ConnectionError):
+                    break
+                if request is None:
+                    break
+                method, path, version, headers = request
+                keep_alive = self.keep_alive(version, headers)
+                response = await self.response(method, path, headers)
+                keep_alive = await self.send(writer, response, method, keep_alive)
+        finally:
+            self.num_connections -= 1
+            writer.close()
+
+    async def read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, str, Headers]]:
+        """Method, path, HTTP version and headers; None at the end of the connection"""
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, path, version = request_line.decode('latin-1').split()
+        lines = []
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            lines.append(line)
+            if len(lines) > self.c_MAX_HEADERS:
+                raise ValueError("Too many headers")
+        return method, path, version, http.client.parse_headers(io.BytesIO(b"".join(lines) + b"\r\n"))
+
+    @staticmethod
+    def keep_alive(version: str, headers: Headers) -> bool:
+        connection = headers.get("Connection", "").lower()
+        return connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+
+    async def response(self, method: str, path: str, headers: Headers) -> Response:
+        if method == 'HEAD':
+            return Response(content_type="text/html")
+        if method != 'GET':
+            return Response.error(405, f"Method {method} not allowed")
+        logging.debug(f"GET request: {path}")
+        if self.num_abandoned >= self.num_workers:
+            instrumentation.count('http.rejected_busy')
+            return Response.error(503, "All workers are busy with requests that timed out")
+        future = self.workers.submit(self.request_handler.handle_get, path, headers)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.request_timeout_seconds)
+        except asyncio.TimeoutError:
+            logging.error(f"Request {path} took longer than {self.request_timeout_seconds} s")
+            self.abandon(future)
+            return Response.error(504, f"Request {path} timed out")
+        except Exception as err:
+            logging.exception(f"Request {path} failed")
+            return Response.error(500, f"Request {path} failed: {err}")
+
+    def abandon(self, future: Future):
+        """Counts the view of the future as holding a worker thread until it ends, unless it never started"""
+        if future.cancelled():
+            return
+        with self.abandoned_lock:
+            self.num_abandoned += 1
+        future.add_done_callback(self.released)
+
+    def released(self, future: Future):
+        with self.abandoned_lock:
+            self.num_abandoned -= 1
+
+    async def send(self, writer: asyncio.StreamWriter, response: Response, method: str, keep_alive: bool) -> bool:
+        """Writes the response, returns whether the connection is kept alive"""
+        head = [f"HTTP/1.1 {response.status} {HTTPStatus(response.status).phrase}",
+                f"Date: {formatdate(usegmt=True)}",
+                f"Content-type: {response.content_type}"]
+        head += [f"{key}: {value}" for key, value in response.headers.items()]
+        head.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        try:
+            if response.status == 304 or method == 'HEAD':  # no body, and no Content-Length of the empty body
+                writer.write(self.encode_head(head))
+            elif response.streamed:
+                writer.write(self.encode_head(head + ["Transfer-Encoding: chunked"]))
+                return await self.send_chunks(writer, response) and keep_alive
+            else:
+                writer.write(self.encode_head(head + [f"Content-Length: {len(response.body)}"]) + response.body)
+                instrumentation.count('http.body_bytes_sent', len(response.body))
+            await asyncio.wait_for(writer.drain(), self.request_timeout_seconds)
+        except (asyncio.TimeoutError, ConnectionError):
+            return False
+        return keep_alive
+
+    async def send_chunks(self, writer: asyncio.StreamWriter, response: Response) -> bool:
+        """Writes the chunks, produced in a worker thread, returns whether the response was complete"""
+        loop = asyncio.get_running_loop()
+        pool = self.streams if response.content_type == "text/event-stream" else self.workers
+        chunks = response.iter_body()
+        try:
+            while (chunk := await loop.run_in_executor(pool, next, chunks, None)) is not None:
+                if chunk:
+                    writer.write(b"%x\r\n%b\r\n" % (len(chunk), chunk))
+                    await asyncio.wait_for(writer.drain(), self.request_timeout_seconds)
+                    instrumentation.count('http.body_bytes_sent', len(chunk))
+            writer.write(b"0\r\n\r\n")
+            await asyncio.wait_for(writer.drain(), self.request_timeout_seconds)
+            return True
+        except (asyncio.TimeoutError, ConnectionError):
+            logging.debug("Client disconnected during a streamed response")
+            return False
+        finally:
+            chunks.close()
+
+    @staticmethod
+    def encode_head(lines) -> bytes:
+        return ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1')
@@ -0,0 +1,68 @@
+"""
+    Binary columnar format of /get_data, for clients that map the columns directly into typed arrays.
+
+    Layout:
+        uint32 little-endian   n, the size of the header
+        n bytes                JSON header, padded with spaces to let the data start at a multiple of 8 bytes:
+                               {"length": rows, "columns": [{"name", "dtype", "unit", "offset"}, ...], ...}
+        data                   per column, at data start + offset, length little-endian float64 or float32 values;
+                               every column starts at a multiple of 8 bytes, missing values are NaN
+
+    In JavaScript: new Float64Array(buffer, dataStart + column.offset, header.length).
+    Timestamps are always float64, float32 would round them to minutes.
+"""
+
+import json
+import math
+import struct
+import sys
+from array import array
+from typing import Dict, Iterable, Iterator, List, Any, Optional
+
+c_CONTENT_TYPE = "application/vnd.powerlogger.columns"
+c_TYPECODES = {"float64": "d", "float32": "f"}
+c_ALIGNMENT = 8
+
+
+def aligned(size: int) -> int:
+    return (size + c_ALIGNMENT - 1) // c_ALIGNMENT * c_ALIGNMENT
+
+
+def to_array(block: list, typecode: str) -> array:
+    try:
+        values = array(typecode, block)
+    except TypeError:  # missing values
+        values = array(typecode, (math.nan if value is None else value for value in block))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def binary_columns(columns: Dict[str, Iterable[list]], length: int, dtypes: Dict[str, str],
+                   units: Dict[str, Optional[str]], trailer: Dict[str, Any] = None) -> Iterator[bytes]:
+    """
+    The columns, as blocks of values, in the binary format. A column with fewer than length values is padded with
+    NaN, values beyond length are left out.
+    """
+    descriptions: List[Dict[str, Any]] = []
+    offset = 0
+    for name in columns:
+        descriptions.append({"name": name, "dtype": dtypes[name], "unit": units.get(name), "offset": offset})
+        offset += aligned(length * array(c_TYPECODES[dtypes[name]]).itemsize)
+    header = json.dumps(dict({"length": length, "columns": descriptions}, **(trailer if trailer else {}))).encode()
+    header += b" " * (aligned(4 + len(header)) - 4 - len(header))
+    yield struct.pack('<I', len(header)) + header
+    for name, blocks in columns.items():
+        typecode = c_TYPECODES[dtypes[name]]
+        remaining = length
+        for block in blocks:
+            if remaining <= 0:
+                break
+            values = to_array(block[:remaining] if len(block) > remaining else block, typecode)
+            remaining -= len(values)
+            yield memoryview(values).cast('B')
+        if remaining > 0:
+            yield to_array([math.nan] * remaining, typecode).tobytes()
+        size = length * array(typecode).itemsize
+        if aligned(size) > size:
+            yield b"\0" * (aligned(size) - size)
@@ -0,0 +1,98 @@
+"""
+    Content-Encoding of responses, negotiated on Accept-Encoding. Bodies below the size threshold are sent as they
+    are; streamed bodies are compressed chunk by chunk. The compression CPU time is observed per response and the
+    bytes before and after compression are counted in the instrumentation, as stage http.compress.<encoding> and
+    counters http.uncompressed_bytes and http.compressed_bytes with label encoding.
+"""
+
+import time
+import zlib
+from typing import Optional, Iterator, List
+from Utils.instrumentation import instrumentation
+from WebServer.response import Response
+from WebServer.columnar import c_CONTENT_TYPE
+
+c_WBITS = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}  # deflate is the zlib format, as in HTTP
+c_COMPRESSIBLE = ("application/json", "text/html", c_CONTENT_TYPE)
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """The supported encoding with the highest q-value in Accept-Encoding, gzip preferred; None for identity"""
+    if not accept_encoding:
+        return None
+    best, best_q = None, 0.0
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        try:
+            q = float(params.strip()[2:]) if params.strip().startswith('q=') else 1.0
+        except ValueError:
+            q = 0.0
+        candidates = list(c_WBITS) if name == '*' else [name]
+        for candidate in candidates:
+            if candidate in c_WBITS and (q > best_q or (q == best_q and candidate == "gzip")):
+                best, best_q = candidate, q
+    return best
+
+
+def compress(response: Response, encoding: Optional[str], min_size: int, level: int) -> Response:
+    """The response with the encoding applied, or the response itself if not compressed"""
+    if encoding is None or response.status != 200 or response.content_type not in c_COMPRESSIBLE:
+        return response
+    if not response.streamed:
+        if len(response.body) < min_size:
+            return response
+        start = time.thread_time()
+        compressor = zlib.compressobj(level, zlib.DEFLATED, c_WBITS[encoding])
+        body = compressor.compress(response.body) + compressor.flush()
+        account(encoding, len(response.body), len(body), time.thread_time() - start)
+        return Response(response.status, response.content_type, body=body, headers=encoded_headers(response, encoding))
+    head: List[bytes] = []  # the first chunks decide on compression
+    size = 0
+    chunks = iter(response.chunks)
+    for chunk in chunks:
+        head.append(chunk)
+        size += len(chunk)
+        if size >= min_size:
+            break
+    else:
+        return Response(response.status, response.content_type, body=b"".join(head), headers=response.headers)
+    return Response(response.status, response.content_type, chunks=compressed_chunks(head, chunks, encoding, level),
+                    headers=encoded_headers(response, encoding))
+
+
+def compressed_chunks(head: List[bytes], chunks: Iterator[bytes], encoding: str, level: int) -> Iterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, c_WBITS[encoding])
+    size_in = size_out = 0
+    cpu = 0.0
+    try:
+        for source in (head, chunks):
+            for chunk in source:
+                start = time.thread_time()
+                data = compressor.compress(chunk)
+                cpu += time.thread_time() - start
+                size_in += len(chunk)
+                if data:
+                    size_out += len(data)
+                    yield data
+        start = time.thread_time()
+        data = compressor.flush()
+        cpu += time.thread_time() - start
+        size_out += len(data)
+        yield data
+    finally:
+        account(encoding, size_in, size_out, cpu)
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def encoded_headers(response: Response, encoding: str):
+    vary = response.headers.get("Vary")
+    vary = vary + ", Accept-Encoding" if vary and "Accept-Encoding" not in vary else vary or "Accept-Encoding"
+    return dict(response.headers, **{"Content-Encoding": encoding, "Vary": vary})
+
+
+def account(encoding: str, size_in: int, size_out: int, cpu_seconds: float):
+    instrumentation.observe(f"http.compress.{encoding}", cpu_seconds)
+    instrumentation.count('http.uncompressed_bytes', size_in, encoding=encoding)
+    instrumentation.count('http.compressed_bytes', size_out, encoding=encoding)
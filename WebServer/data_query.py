@@ -0,0 +1,73 @@
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Tuple, Iterator, Iterable
+from DataHolder.storage import c_TIMESTAMP, CircularStorage
+from WebServer import downsampling
+
+
+@dataclass
+class DataQuery:
+    """
+    Signals of a data store between from_time and to_time, or after the cursor since, since_count and up to
+    to_time, optionally downsampled to max_points with agg
+    """
+    data_store: object
+    signals: List[str]
+    from_time: Optional[float] = None
+    to_time: Optional[float] = None
+    max_points: Optional[int] = None
+    agg: str = "avg"
+    since: Optional[float] = None
+    since_count: Optional[int] = None  # items at timestamp since that were sent already, None for all of them
+
+    def units(self) -> Dict[str, str]:
+        spec = self.data_store.data.data_item_spec
+        return {str(data_type): spec.get_unit(data_type) for data_type in spec.get_elements()}
+
+    def indexes(self) -> Optional[Tuple[int, int]]:
+        """(from_index, to_index) of the items in the time range, fixed at the call; None if there are none"""
+        storage = self.data_store.data
+        if self.since is not None:
+            return storage.indexes_after(self.since, self.since_count, self.to_time)
+        if self.from_time is None and self.to_time is None:
+            if storage.length() == 0:
+                return None
+            return storage.min_time_index(), storage.last_index()
+        return storage.indexes_between(self.from_time, self.to_time)
+
+    def columns(self, from_index: int, to_index: int, last_time: float) -> Tuple[Dict[str, Iterable[list]], int]:
+        """
+        Timestamps and signals in blocks of values, and the number of items, up to the item at to_index with
+        timestamp last_time. A circular buffer overwrites its oldest items while the columns are sent, so its items
+        are read once, as rows, before the first column; the items written after to_index was found, that is after
+        last_time, are left out. The items of a linear buffer are never overwritten, they are read column by column.
+        """
+        storage = self.data_store.data
+        names = [c_TIMESTAMP] + self.signals
+        if not isinstance(storage, CircularStorage):
+            length = sum(last - first + 1 for first, last in storage.index_ranges(from_index, to_index))
+            return {name: self.column(name, from_index, to_index) for name in names}, length
+        blocks = []
+        for block in storage.iter_rows(names, from_index, to_index):
+            if any(timestamp > last_time for timestamp in block[c_TIMESTAMP]):
+                kept = [i for i, timestamp in enumerate(block[c_TIMESTAMP]) if timestamp <= last_time]
+                block = {name: [values[i] for i in kept] for name, values in block.items()}
+            blocks.append(block)
+        length = sum(len(block[c_TIMESTAMP]) for block in blocks)
+        return {name: [block[name] for block in blocks] for name in names}, length
+
+    def column(self, name: str, from_index: int, to_index: int) -> Iterator[list]:
+        for block in self.data_store.data.iter_rows([name], from_index, to_index):
+            yield block[name]
+
+    def read(self) -> Tuple[List[float], Dict[str, list], int]:
+        """Timestamps, values per signal and the number of items read, downsampled if max_points is given"""
+        if (indexes := self.indexes()) is None:
+            return [], {signal: [] for signal in self.signals}, 0
+        last_time = self.data_store.data.get_data_item(indexes[1]).get_timestamp()
+        blocks, _ = self.columns(*indexes, last_time)
+        columns = {name: [value for block in blocks[name] for value in block] for name in blocks}
+        timestamps = columns.pop(c_TIMESTAMP)
+        source_points = len(timestamps)
+        if self.max_points is not None:
+            timestamps, columns = downsampling.downsample(timestamps, columns, self.max_points, self.agg)
+        return timestamps, columns, source_points
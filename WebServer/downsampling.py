@@ -0,0 +1,135 @@
+"""
+    Server-side downsampling of columns of timed data to at most max_points points.
+
+    Time-bucket aggregation divides the time range in max_points buckets of equal width and aggregates the values
+    in each bucket; buckets without data are left out and a bucket is reported at its start time.
+    LTTB (largest triangle three buckets) selects the points that keep the shape of a line chart; the points are
+    selected on the signal with the most values and the other signals are reported at the same timestamps. Columns
+    of at most max_points points are not downsampled.
+    Alignment aggregates the values in the cells of a fixed time grid, to put columns of different data stores on
+    common timestamps.
+"""
+
+from typing import List, Dict, Optional, Callable, Tuple
+
+c_AGGREGATES: Dict[str, Callable[[list], Optional[float]]] = {
+    "avg": lambda values: sum(values) / len(values),
+    "min": min,
+    "max": max,
+    "last": lambda values: values[-1],
+}
+c_LTTB = "lttb"
+
+
+def buckets(timestamps: List[float], max_points: int) -> List[Tuple[float, int, int]]:
+    """(start time, first, end) of the non-empty buckets; timestamps[first:end] is in the bucket"""
+    if not timestamps:
+        return []
+    start = timestamps[0]
+    width = (timestamps[-1] - start) / max_points
+    if width <= 0:
+        return [(start, 0, len(timestamps))]
+    res = []
+    current, first = None, 0
+    for idx, timestamp in enumerate(timestamps):
+        bucket = min(int((timestamp - start) / width), max_points - 1)
+        if bucket != current:
+            if current is not None:
+                res.append((start + current * width, first, idx))
+            current, first = bucket, idx
+    res.append((start + current * width, first, len(timestamps)))
+    return res
+
+
+def aggregate(timestamps: List[float], columns: Dict[str, list], max_points: int,
+              agg: str) -> Tuple[List[float], Dict[str, list]]:
+    """Time-bucket aggregation with aggregate agg; missing values (None) are skipped"""
+    function = c_AGGREGATES[agg]
+    bucket_list = buckets(timestamps, max_points)
+    res_columns = {}
+    for signal, values in columns.items():
+        res = []
+        for _, first, end in bucket_list:
+            present = [value for value in values[first:end] if value is not None]
+            res.append(function(present) if present else None)
+        res_columns[signal] = res
+    return [start for start, _, _ in bucket_list], res_columns
+
+
+def lttb_indexes(timestamps: List[float], values: List[float], max_points: int) -> List[int]:
+    """Indexes of the points selected by largest triangle three buckets; points without a value are skipped"""
+    candidates = [idx for idx, value in enumerate(values) if value is not None]
+    n = len(candidates)
+    if n <= max_points:
+        return candidates
+    if max_points <= 2:
+        return [candidates[0], candidates[-1]][:max_points]
+    every = (n - 2) / (max_points - 2)
+    selected = [candidates[0]]
+    a = candidates[0]
+    for bucket in range(max_points - 2):
+        first = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        next_first, next_end = end, min(int((bucket + 2) * every) + 1, n)
+        next_points = candidates[next_first:next_end] if next_first < next_end else [candidates[-1]]
+        avg_x = sum(timestamps[idx] for idx in next_points) / len(next_points)
+        avg_y = sum(values[idx] for idx in next_points) / len(next_points)
+        ax, ay = timestamps[a], values[a]
+        best, best_area = candidates[first], -1.0
+        for idx in candidates[first:end]:
+            area = abs((ax - avg_x) * (values[idx] - ay) - (ax - timestamps[idx]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = idx, area
+        selected.append(best)
+        a = best
+    selected.append(candidates[-1])
+    return selected
+
+
+def lttb(timestamps: List[float], columns: Dict[str, list], max_points: int) -> Tuple[List[float], Dict[str, list]]:
+    if len(timestamps) <= max_points:
+        return timestamps, columns
+    if not columns:
+        indexes = [idx for _, idx, _ in buckets(timestamps, max_points)]
+    else:
+        values = max(columns.values(), key=lambda column: sum(value is not None for value in column))
+        indexes = lttb_indexes(timestamps, values, max_points)
+    return [timestamps[idx] for idx in indexes], \
+        {signal: [values[idx] for idx in indexes] for signal, values in columns.items()}
+
+
+def downsample(timestamps: List[float], columns: Dict[str, list], max_points: int,
+               agg: str) -> Tuple[List[float], Dict[str, list]]:
+    if agg == c_LTTB:
+        return lttb(timestamps, columns, max_points)
+    if len(timestamps) <= max_points:
+        return timestamps, columns
+    return aggregate(timestamps, columns, max_points, agg)
+
+
+def align(timestamps: List[float], columns: Dict[str, list], start: float, step: float, num_points: int,
+          agg: str) -> Dict[str, list]:
+    """
+    Values aggregated with aggregate agg per grid cell start + k * step <= timestamp < start + (k + 1) * step for k in
+    range(num_points); None for the cells without data
+    """
+    function = c_AGGREGATES[agg]
+    cells = []  # (k, first, end) of the non-empty cells; timestamps[first:end] is in cell k
+    current, first = None, 0
+    for idx, timestamp in enumerate(timestamps):
+        cell = int((timestamp - start) // step)
+        if cell != current:
+            if current is not None and 0 <= current < num_points:
+                cells.append((current, first, idx))
+            current, first = cell, idx
+    if current is not None and 0 <= current < num_points:
+        cells.append((current, first, len(timestamps)))
+    res_columns = {}
+    for signal, values in columns.items():
+        res = [None] * num_points
+        for cell, first, end in cells:
+            present = [value for value in values[first:end] if value is not None]
+            if present:
+                res[cell] = function(present)
+        res_columns[signal] = res
+    return res_columns
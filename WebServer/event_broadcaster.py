@@ -0,0 +1,96 @@
+import json
+import logging
+import queue
+import threading
+from typing import Dict, List, Tuple, Iterator, Optional
+from DataHolder.data_item import DataItem
+
+
+class Subscription:
+
+    def __init__(self, data_store: str, signals: Tuple[str, ...], queue_size: int):
+        self.data_store = data_store
+        self.signals = signals
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.dropped = False
+
+
+class EventBroadcaster:
+    """
+    Fan-out of newly stored data items to the clients of /events as Server-Sent Events.
+    Clients subscribing to the same data store and signals form a group; an item is serialized once per group and
+    the message is put on the bounded queue of every client in the group. A client whose queue is full is dropped,
+    so a slow client never holds up the ingest path.
+    """
+
+    c_HEARTBEAT = b": keep-alive\n\n"
+
+    def __init__(self, queue_size: int, heartbeat_seconds: float):
+        self.queue_size = queue_size
+        self.heartbeat_seconds = heartbeat_seconds
+        self.groups: Dict[str, Dict[Tuple[str, ...], List[Subscription]]] = {}  # data store: signals: subscriptions
+        self.lock = threading.Lock()
+        self.num_sent = 0
+        self.num_dropped_clients = 0
+
+    def subscribe(self, data_store: str, signals: List[str]) -> Subscription:
+        subscription = Subscription(data_store, tuple(signals), self.queue_size)
+        with self.lock:
+            self.groups.setdefault(data_store, {}).setdefault(subscription.signals, []).append(subscription)
+        logging.info(f"Events: client subscribed to {data_store} {signals}")
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self.lock:
+            group = self.groups.get(subscription.data_store, {}).get(subscription.signals, [])
+            if subscription in group:
+                group.remove(subscription)
+                if not group:
+                    del self.groups[subscription.data_store][subscription.signals]
+                    if not self.groups[subscription.data_store]:
+                        del self.groups[subscription.data_store]
+
+    def publish(self, data_store: str, data_items: List[DataItem]):
+        """Called by the data holder on the thread that stored the items"""
+        if data_store not in self.groups:
+            return
+        with self.lock:
+            groups = [(signals, list(subscriptions)) for signals, subscriptions in self.groups[data_store].items()]
+        for signals, subscriptions in groups:
+            message = b"".join(self.message(data_store, signals, data_item) for data_item in data_items)
+            for subscription in subscriptions:
+                try:
+                    subscription.queue.put_nowait(message)
+                    self.num_sent += 1
+                except queue.Full:
+                    logging.warning(f"Events: slow client of {data_store} dropped")
+                    subscription.dropped = True
+                    self.num_dropped_clients += 1
+                    self.unsubscribe(subscription)
+
+    @staticmethod
+    def message(data_store: str, signals: Tuple[str, ...], data_item: DataItem) -> bytes:
+        data = {"timestamp": data_item.get_timestamp()}
+        for signal in signals:
+            data[signal] = data_item.get_value(signal) \
+                if data_item.data_item_spec.datatype_from_name(signal) is not None else None
+        return f"event: {data_store}\ndata: {json.dumps(data)}\n\n".encode('utf-8')
+
+    def stream(self, subscription: Subscription) -> Iterator[bytes]:
+        """Messages for one client, ends when the client is dropped or disconnects"""
+        try:
+            yield b"retry: 5000\n\n"
+            while not subscription.dropped:
+                try:
+                    message: Optional[bytes] = subscription.queue.get(timeout=self.heartbeat_seconds)
+                except queue.Empty:
+                    message = self.c_HEARTBEAT
+                yield message
+        finally:
+            self.unsubscribe(subscription)
+
+    def stats(self):
+        with self.lock:
+            clients = {data_store: sum(len(subscriptions) for subscriptions in groups.values())
+                       for data_store, groups in self.groups.items()}
+        return {"clients": clients, "sent": self.num_sent, "dropped_clients": self.num_dropped_clients}
@@ -1,12 +1,149 @@
-from typing import Dict, Any
+from datetime import datetime
+import json
+import logging
+import hashlib
+import secrets
+import psutil
+from concurrent.futures import ThreadPoolExecutor
+from urllib import parse
+from typing import List, Dict, Any, Optional, Iterable, Union, Tuple
 from Application.Models.shift_info import ShiftInfo
 from Application.Models.system_info import SystemInfo
+from Utils.instrumentation import instrumentation, labels
+from DataHolder.storage import c_TIMESTAMP
+from DataHolder.db_interface import reader_thread
+from WebServer.response import Response, json_columns
+from WebServer.event_broadcaster import EventBroadcaster
+from WebServer.response_cache import ResponseCache
+from WebServer.data_query import DataQuery
+from WebServer.compression import negotiate, compress
+from WebServer import downsampling, columnar
+from Utils.settings import Settings
 
 
 class RequestHandler:
 
-    def __init__(self, processor):
+    URL_BROWSER_VIEWS = {
+        "/raw": "getRaw",
+        "/dumpdata": "getRealtimeDatadump",
+        "/": "getStr",
+    }
+
+    URL_DATA_VIEWS = {
+        "/data_stores": "get_data_stores",
+        "/data_store_info": "get_data_store_info",
+        "/get_data": "get_data",
+        "/get_batch": "get_batch",
+        "/events": "get_events",
+        "/events_stats": "get_events_stats",
+        "/shift_info": "get_shift_info",
+        "/system_info": "get_system_info",
+        "/energy": "get_energy",
+        "/instrumentation": "get_instrumentation",
+        "/job_metrics": "get_job_metrics",
+        "/zwave_stats": "get_zwave_stats",
+        "/cache_stats": "get_cache_stats",
+        "/metrics": "get_metrics",
+        "/terminate": "terminate",
+    }
+
+    CACHED_VIEWS = ("get_data", "get_data_store_info", "get_data_stores")
+
+    c_MAX_BATCH_QUERIES = 16
+    c_MAX_GRID_POINTS = 100000
+
+    def __init__(self, processor, scheduler=None):
         self.processor = processor
+        self.scheduler = scheduler
+        self.nonce = secrets.token_hex(4)  # versions restart with the process, the ETags of an earlier run never match
+        self.cache = ResponseCache(Settings().cache_entries(), Settings().cache_max_body_bytes())
+        self.compression_min_bytes = Settings().compression_min_bytes()
+        self.compression_level = Settings().compression_level()
+        self.readers = ThreadPoolExecutor(Settings().webserver_read_threads(), thread_name_prefix='web_reader',
+                                          initializer=reader_thread)
+        self.broadcaster = EventBroadcaster(Settings().events_queue_size(), Settings().events_heartbeat_seconds())
+        self.processor.data_holder.add_listener(self.broadcaster.publish)
+        self.register_gauges()
+
+    def handle_get(self, path: str, headers) -> Response:
+        """Response to a GET request of path, with headers the request headers"""
+        with instrumentation.stage('http.response'):  # until the response is ready, streamed bodies are produced later
+            response = self.route(path, headers)
+        instrumentation.count('http.responses', status=response.status)
+        return response
+
+    def route(self, path: str, headers) -> Response:
+        parsed = parse.urlsplit(path)
+        if parsed.path in self.URL_DATA_VIEWS:
+            logging.debug(f"GET request is in URL_DATA_VIEWS")
+            return self.respond(self.URL_DATA_VIEWS[parsed.path], parsed.query, headers.get("If-None-Match"),
+                                headers.get("Accept-Encoding"), headers.get("Accept"))
+        if parsed.path in self.URL_BROWSER_VIEWS:
+            logging.debug(f"GET request is in URL_BROWSER_VIEWS")
+            view = getattr(self, self.URL_BROWSER_VIEWS[parsed.path])
+            return Response.html([b"<html><head><title>Power logger</title></head>",
+                                  b"<body><p>Erik Kouwenhoven, 2023</p>",
+                                  b"<p>You accessed path: %b</p>" % path.encode()] +
+                                 [line + b"<br>" for line in view()] +
+                                 [b"</body></html>"])
+        logging.error(f"Invalid request {path}")
+        return Response.error(404, f"Invalid request {parsed.path}")
+
+    def respond(self, view_name: str, args: str, if_none_match: Optional[str] = None,
+                accept_encoding: Optional[str] = None, accept: Optional[str] = None) -> Response:
+        """
+        Response of a view, compressed with the encoding accepted by the client; /get_data is sent in the binary
+        columnar format if the client accepts it. Responses of the cached views carry an ETag of the data store
+        version, the query and the encoding; a request with a matching If-None-Match gets 304, a cached body is sent
+        without reading the data store.
+        """
+        encoding = negotiate(accept_encoding)
+        if view_name == "get_data" and accept and columnar.c_CONTENT_TYPE in accept and 'format=' not in args:
+            args += '&format=binary'
+        vary = "Accept, Accept-Encoding" if view_name == "get_data" else "Accept-Encoding"  # the format follows Accept
+        etag = self.etag(view_name, args, encoding)
+        if etag is not None:
+            if if_none_match is not None and self.matches(etag, if_none_match):
+                self.cache.not_modified += 1
+                return Response(status=304, headers={"ETag": etag, "Vary": vary})
+            if (response := self.cache.get(etag)) is None:
+                response = self.encoded_view_response(view_name, args, encoding)
+                if response.status == 200:
+                    response = self.cache.store(etag, response)
+            if response.status == 200:
+                response.headers.update({"ETag": etag, "Cache-Control": "no-cache", "Vary": vary})
+            return response
+        return self.encoded_view_response(view_name, args, encoding)
+
+    def encoded_view_response(self, view_name: str, args: str, encoding: Optional[str]) -> Response:
+        return compress(self.view_response(view_name, args), encoding, self.compression_min_bytes,
+                        self.compression_level)
+
+    def view_response(self, view_name: str, args: str) -> Response:
+        result = getattr(self, view_name)(args)
+        return result if isinstance(result, Response) else Response.json(result)
+
+    def etag(self, view_name: str, args: str, encoding: Optional[str] = None) -> Optional[str]:
+        """ETag of the response of a cached view at the current version, None if not cached"""
+        if view_name not in self.CACHED_VIEWS:
+            return None
+        data_holder = self.processor.data_holder
+        if view_name == "get_data":
+            if (data_store := data_holder.data_store(self.convert_args(args).get('data_store_name'))) is None:
+                return None
+            version = f"{data_store.name}:{data_store.data.version}"
+        else:
+            version = f"data_stores:{data_holder.data_stores_version}"
+        digest = hashlib.sha1(f"{view_name}?{args}".encode('utf-8')).hexdigest()[:12]
+        return f'"{self.nonce}-{version}-{digest}{"-" + encoding if encoding else ""}"'
+
+    @staticmethod
+    def matches(etag: str, if_none_match: str) -> bool:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or any(tag.removeprefix('W/') == etag for tag in tags)
+
+    def get_cache_stats(self, *args):
+        return self.cache.stats()
 
     def getStr(self):
         return self.processor.data_holder.data_store('real_time').data.str_last()
@@ -17,11 +154,191 @@ class RequestHandler:
     def getRealtimeDatadump(self):
         return self.processor.data_holder.data_store('real_time').data.dump()
 
-    def get_data(self, args):
+    def get_data(self, args) -> Response:
+        """
+        Timestamps and signals of a data store, optionally between from and to (seconds since the epoch or ISO
+        datetime) and downsampled to max_points points with agg avg, min, max, last (time buckets) or lttb.
+        Without max_points the columns are streamed column by column, bounding the memory for large linear data
+        stores; a circular buffer is read as rows before the first column, bounded by its length.
+        format=binary sends the columns in the binary columnar format, with the signals as dtype float64 or float32.
+        The response has a cursor <timestamp>_<count>: the timestamp of the newest item sent and the number of items
+        with that timestamp up to it, so items stored later with the same timestamp are not missed; without items
+        sent the cursor is the since given. Polling with since=<cursor> gets the items stored after the cursor only,
+        found by a binary search on the timestamps; since=<timestamp> gets the items after the timestamp. reset is
+        true when items after the cursor may have been overwritten in a circular buffer, the response then holds all
+        items from the oldest.
+        """
         dict_args = self.convert_args(args)
-        data_store = self.processor.data_holder.data_store(dict_args['data_store_name'])
-        signals = dict_args['signals'].split(',')
-        return data_store.data.serialize(signals)
+        if isinstance(query := self.parse_query(dict_args), Response):
+            return query
+        storage = query.data_store.data
+        trailer = {}
+        since = parse.unquote(dict_args['since']) if dict_args.get('since') else None
+        if query.since is not None:
+            if reset := not storage.retains(query.since, inclusive=query.since_count is not None):
+                query.since = query.since_count = None
+            trailer["reset"] = reset
+        if (data_format := dict_args.get('format', 'json')) not in ('json', 'binary'):
+            return Response.error(400, f"Unknown format {data_format}, use json or binary")
+        if (dtype := dict_args.get('dtype', 'float64')) not in columnar.c_TYPECODES:
+            return Response.error(400, f"Unknown dtype {dtype}, use one of {list(columnar.c_TYPECODES)}")
+        if (indexes := query.indexes()) is None:
+            columns = {c_TIMESTAMP: [], **{signal: [] for signal in query.signals}}
+            trailer["cursor"] = since  # unchanged, or None if no items were sent before
+            return self.columns_response(columns, 0, query.units(), trailer, data_format, dtype)
+        last_time, count = storage.cursor(indexes[1])
+        trailer["cursor"] = f"{last_time}_{count}"
+        if query.max_points is None:
+            columns, length = query.columns(*indexes, last_time)
+            if "reset" in trailer and length < sum(last - first + 1 for first, last in storage.index_ranges(*indexes)):
+                trailer["reset"] = True  # items were overwritten before they were read
+            return self.columns_response(columns, length, query.units(), trailer, data_format, dtype)
+        timestamps, values, source_points = query.read()
+        columns = {c_TIMESTAMP: [timestamps], **{signal: [values[signal]] for signal in query.signals}}
+        return self.columns_response(columns, len(timestamps), query.units(),
+                                     dict(trailer, agg=query.agg, source_points=source_points), data_format, dtype)
+
+    def parse_query(self, dict_args: Dict[str, str]) -> Union[DataQuery, Response]:
+        """The query of data_store_name, signals, from, to, max_points and agg, or the error response"""
+        if (data_store := self.processor.data_holder.data_store(dict_args.get('data_store_name'))) is None:
+            return Response.error(404, f"Unknown data store {dict_args.get('data_store_name')}")
+        signals = dict_args['signals'].split(',') if dict_args.get('signals') else []
+        if unknown := [signal for signal in signals if signal not in data_store.signals]:
+            return Response.error(400, f"Unknown signals {unknown} for data store {data_store.name}")
+        try:
+            from_time, to_time = self.parse_time(dict_args.get('from')), self.parse_time(dict_args.get('to'))
+            since, since_count = self.parse_cursor(dict_args.get('since'))
+            max_points = int(dict_args['max_points']) if dict_args.get('max_points') else None
+        except ValueError as err:
+            return Response.error(400, f"Invalid query: {err}")
+        if since is not None and from_time is not None:
+            return Response.error(400, "Give from or since, not both")
+        agg = dict_args.get('agg', 'avg')
+        if agg not in downsampling.c_AGGREGATES and agg != downsampling.c_LTTB:
+            return Response.error(400, f"Unknown agg {agg}, use one of {list(downsampling.c_AGGREGATES)} or lttb")
+        if max_points is not None and max_points < 2:
+            return Response.error(400, "max_points must be at least 2")
+        return DataQuery(data_store, signals, from_time, to_time, max_points, agg, since, since_count)
+
+    def get_batch(self, args) -> Response:
+        """
+        Several queries in one response, queries a JSON list of objects with data_store_name and optionally signals,
+        from, to, max_points and agg as in /get_data; the from, to, max_points and agg of the request are the
+        defaults. The queries run concurrently in the read pool.
+        With grid=<seconds> the queries share the timestamps of a time grid from the earliest to the latest time,
+        with step grid and aligned to a multiple of it; the values are aggregated per cell with agg, max_points is
+        not used.
+        """
+        dict_args = self.convert_args(args)
+        try:
+            query_specs = json.loads(parse.unquote(dict_args.get('queries', '')))
+            step = float(dict_args['grid']) if dict_args.get('grid') else None
+        except ValueError as err:
+            return Response.error(400, f"Invalid query: {err}")
+        if not isinstance(query_specs, list) or not all(isinstance(spec, dict) for spec in query_specs):
+            return Response.error(400, "queries must be a JSON list of objects")
+        if not 0 < len(query_specs) <= self.c_MAX_BATCH_QUERIES:
+            return Response.error(400, f"Give 1 to {self.c_MAX_BATCH_QUERIES} queries")
+        if step is not None and step <= 0:
+            return Response.error(400, "grid must be positive")
+        defaults = {key: dict_args[key] for key in ('from', 'to', 'max_points', 'agg') if key in dict_args}
+        queries = []
+        for spec in query_specs:
+            if unknown := set(spec) - {'data_store_name', 'signals', 'from', 'to', 'max_points', 'agg'}:
+                return Response.error(400, f"Unknown query keys {sorted(unknown)}")
+            spec_args = {key: ','.join(value) if isinstance(value, list) else str(value) for key, value in spec.items()}
+            if isinstance(query := self.parse_query(dict(defaults, **spec_args)), Response):
+                return query
+            if step is not None:
+                if query.agg not in downsampling.c_AGGREGATES:
+                    return Response.error(400, f"Use agg one of {list(downsampling.c_AGGREGATES)} with grid")
+                query.max_points = None
+            queries.append(query)
+        if step is not None:
+            start, num_points = self.grid(queries, step)  # checked before any data is read
+            if num_points > self.c_MAX_GRID_POINTS:
+                return Response.error(400, f"The grid has {num_points} points, more than {self.c_MAX_GRID_POINTS}")
+        with instrumentation.stage('http.batch'):
+            results = list(self.readers.map(DataQuery.read, queries))
+        if step is None:
+            return Response.json({"queries": [
+                dict({"data_store_name": query.data_store.name, c_TIMESTAMP: timestamps}, **values,
+                     units=query.units(), source_points=source_points, agg=query.agg)
+                for query, (timestamps, values, source_points) in zip(queries, results)]})
+        return self.aligned_response(queries, results, start, step, num_points)
+
+    @staticmethod
+    def grid(queries: List[DataQuery], step: float) -> Tuple[float, int]:
+        """
+        Start and number of points of the time grid with step over the time ranges of the queries; a range without
+        from or to extends to the oldest or newest item of the data store
+        """
+        bounds = []
+        for query in queries:
+            storage = query.data_store.data
+            time_range = storage.timestamp_range() if storage.length() > 0 else None
+            bounds.append(query.from_time if query.from_time is not None or not time_range else time_range[0])
+            bounds.append(query.to_time if query.to_time is not None or not time_range else time_range[1])
+        bounds = [bound for bound in bounds if bound is not None]
+        if not bounds:
+            return 0.0, 0
+        start = min(bounds) // step * step
+        return start, int((max(bounds) - start) // step) + 1
+
+    @staticmethod
+    def aligned_response(queries: List[DataQuery], results: list, start: float, step: float,
+                         num_points: int) -> Response:
+        """The results of the queries on the time grid"""
+        return Response.json({
+            "grid": {"start": start, "step": step},
+            c_TIMESTAMP: [start + k * step for k in range(num_points)],
+            "queries": [dict({"data_store_name": query.data_store.name},
+                             **downsampling.align(timestamps, values, start, step, num_points, query.agg),
+                             units=query.units(), source_points=source_points, agg=query.agg)
+                        for query, (timestamps, values, source_points) in zip(queries, results)]})
+
+    @staticmethod
+    def columns_response(columns: Dict[str, Iterable[list]], length: int, units: Dict[str, str],
+                         trailer: Dict[str, Any], data_format: str, dtype: str) -> Response:
+        if data_format == 'binary':
+            dtypes = {name: 'float64' if name == c_TIMESTAMP else dtype for name in columns}
+            chunks = columnar.binary_columns(columns, length, dtypes, dict(units, timestamp='s'), trailer)
+            return Response(content_type=columnar.c_CONTENT_TYPE, chunks=chunks)
+        return Response(chunks=json_columns(columns, dict({"units": units}, **trailer)))
+
+    @staticmethod
+    def parse_cursor(value: Optional[str]) -> Tuple[Optional[float], Optional[int]]:
+        """Timestamp and count of a cursor <timestamp>_<count>, or the timestamp and None of a time"""
+        if value is None:
+            return None, None
+        timestamp, separator, count = parse.unquote(value).partition('_')
+        return RequestHandler.parse_time(timestamp), int(count) if separator else None
+
+    @staticmethod
+    def parse_time(value: Optional[str]) -> Optional[float]:
+        """Seconds since the epoch, from seconds or an ISO datetime"""
+        if value is None:
+            return None
+        value = parse.unquote(value)
+        try:
+            return float(value)
+        except ValueError:
+            return datetime.fromisoformat(value).timestamp()
+
+    def get_events(self, args) -> Response:
+        """Server-Sent Events of the items stored in a data store, with the requested signals"""
+        dict_args = self.convert_args(args)
+        if (data_store := self.processor.data_holder.data_store(dict_args.get('data_store_name'))) is None:
+            return Response.error(404, f"Unknown data store {dict_args.get('data_store_name')}")
+        signals = dict_args['signals'].split(',') if dict_args.get('signals') else data_store.signals
+        if unknown := [signal for signal in signals if signal not in data_store.signals]:
+            return Response.error(400, f"Unknown signals {unknown} for data store {data_store.name}")
+        subscription = self.broadcaster.subscribe(data_store.name, signals)
+        return Response(content_type="text/event-stream", chunks=self.broadcaster.stream(subscription),
+                        headers={"Cache-Control": "no-cache"})
+
+    def get_events_stats(self, *args):
+        return self.broadcaster.stats()
 
     def get_data_stores(self, *args):
         return {"data_stores": self.processor.data_holder.get_data_stores()}
@@ -36,6 +353,40 @@ class RequestHandler:
     def get_system_info(self, *args):
         return SystemInfo(self.processor).get_info()
 
+    def get_energy(self, args):
+        """kWh per tariff and signal of the day given as day=yyyy-mm-dd, default today"""
+        day = self.convert_args(args).get('day') if args else None
+        if day is None:
+            day = datetime.now().strftime("%Y-%m-%d")
+        return {"day": day, "unit": "kWh", "tariffs": self.processor.data_holder.energy_store.get_day(day)}
+
+    def get_job_metrics(self, *args):
+        return self.scheduler.get_metrics() if self.scheduler else {}
+
+    @staticmethod
+    def get_instrumentation(*args):
+        return instrumentation.snapshot()
+
+    @staticmethod
+    def get_metrics(*args) -> Response:
+        """The metrics in the Prometheus text format"""
+        return Response(content_type="text/plain; version=0.0.4; charset=utf-8",
+                        body=instrumentation.exposition().encode('utf-8'))
+
+    def register_gauges(self):
+        process = psutil.Process()
+        instrumentation.register_gauge('process.resident_memory_bytes', lambda: {'': process.memory_info().rss})
+        instrumentation.register_counter('process.cpu_seconds', lambda: {'': sum(process.cpu_times()[:2])})
+        instrumentation.register_gauge('process.threads', lambda: {'': process.num_threads()})
+        instrumentation.register_gauge('http.event_clients', lambda: {
+            labels(store=name): clients for name, clients in self.broadcaster.stats()["clients"].items()})
+        instrumentation.register_gauge('http.cache_bytes', lambda: {'': self.cache.stats()["bytes"]})
+
+    def get_zwave_stats(self, *args):
+        if self.processor.zwave_interface is None:
+            return {}
+        return self.processor.zwave_interface.stats()
+
     @staticmethod
     def convert_args(args: str) -> Dict[str, str]:
         res = {}
@@ -0,0 +1,72 @@
+"""
+    Responses of the views, independent of the server that sends them. A response has either a complete body or
+    an iterator of chunks that is streamed with chunked transfer encoding.
+"""
+
+from __future__ import annotations
+import json
+from typing import Dict, Iterator, Optional, Iterable, Any, List
+
+
+class Response:
+
+    def __init__(self, status: int = 200, content_type: str = "application/json", body: bytes = None,
+                 chunks: Iterator[bytes] = None, headers: Dict[str, str] = None):
+        assert body is None or chunks is None
+        self.status = status
+        self.content_type = content_type
+        self.body = body if body is not None or chunks is not None else b""
+        self.chunks = chunks
+        self.headers = headers if headers else {}
+
+    @property
+    def streamed(self) -> bool:
+        return self.chunks is not None
+
+    @classmethod
+    def json(cls, obj: Any, status: int = 200) -> Response:
+        return cls(status=status, body=json.dumps(obj).encode('utf-8'))
+
+    @classmethod
+    def error(cls, status: int, message: str) -> Response:
+        return cls.json({"error": message}, status=status)
+
+    @classmethod
+    def html(cls, lines: Iterable[bytes]) -> Response:
+        return cls(content_type="text/html", body=b"".join(lines))
+
+    def iter_body(self) -> Iterator[bytes]:
+        if self.streamed:
+            yield from self.chunks
+        elif self.body:
+            yield self.body
+
+
+def json_columns(columns: Dict[str, Iterable[list]], trailer: Dict[str, Any] = None,
+                 min_chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """
+    JSON object of lists produced column by column, from blocks of values, as chunks of at least min_chunk_size
+    bytes. The output equals json.dumps of the complete dict {name: column, ..., **trailer}.
+    """
+    buffer: List[str] = []
+    size = 0
+    buffer.append("{")
+    for num, (name, blocks) in enumerate(columns.items()):
+        buffer.append(f"{', ' if num else ''}{json.dumps(name)}: [")
+        first = True
+        for block in blocks:
+            if not block:
+                continue
+            text = json.dumps(block)[1:-1]
+            buffer.append(text if first else ", " + text)
+            first = False
+            size += len(text)
+            if size >= min_chunk_size:
+                yield "".join(buffer).encode('utf-8')
+                buffer.clear()
+                size = 0
+        buffer.append("]")
+    for num, (name, value) in enumerate((trailer if trailer else {}).items()):
+        buffer.append(f"{', ' if columns or num else ''}{json.dumps(name)}: {json.dumps(value)}")
+    buffer.append("}")
+    yield "".join(buffer).encode('utf-8')
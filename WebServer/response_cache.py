@@ -0,0 +1,71 @@
+import threading
+from collections import OrderedDict
+from typing import Optional, Iterator, Tuple, Dict
+import typing
+from WebServer.response import Response
+
+
+class ResponseCache:
+    """
+    LRU cache of the encoded bodies of responses, by ETag; compressed bodies are cached by the ETag of their
+    encoding. Streamed bodies are collected while they are sent and cached when complete; a body larger than
+    max_body_bytes is not cached.
+    """
+
+    def __init__(self, max_entries: int, max_body_bytes: int):
+        self.max_entries = max_entries
+        self.max_body_bytes = max_body_bytes
+        # etag: content type, headers, body
+        self.entries: typing.OrderedDict[str, Tuple[str, Dict[str, str], bytes]] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, etag: str) -> Optional[Response]:
+        with self.lock:
+            entry = self.entries.get(etag)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(etag)
+            self.hits += 1
+        content_type, headers, body = entry
+        return Response(content_type=content_type, body=body, headers=dict(headers))
+
+    def put(self, etag: str, content_type: str, headers: Dict[str, str], body: bytes):
+        if len(body) > self.max_body_bytes or self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[etag] = (content_type, dict(headers), body)
+            self.entries.move_to_end(etag)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def store(self, etag: str, response: Response) -> Response:
+        """The response, caching its body once it is complete"""
+        if not response.streamed:
+            self.put(etag, response.content_type, response.headers, response.body)
+            return response
+        return Response(response.status, response.content_type, headers=response.headers,
+                        chunks=self.collect(etag, response.content_type, dict(response.headers), response.chunks))
+
+    def collect(self, etag: str, content_type: str, headers: Dict[str, str],
+                chunks: Iterator[bytes]) -> Iterator[bytes]:
+        collected = []
+        size = 0
+        for chunk in chunks:
+            if collected is not None:
+                size += len(chunk)
+                if size <= self.max_body_bytes:
+                    collected.append(chunk)
+                else:
+                    collected = None
+            yield chunk
+        if collected is not None:
+            self.put(etag, content_type, headers, b"".join(collected))
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": sum(len(body) for _, _, body in self.entries.values()),
+                    "hits": self.hits, "misses": self.misses, "not_modified": self.not_modified}
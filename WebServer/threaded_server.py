@@ -1,16 +1,16 @@
 import logging
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
-from urllib import parse
-import json
 import threading
 from Utils.settings import Settings
 from WebServer.request_handler import RequestHandler
+from WebServer.response import Response
+from Utils.instrumentation import instrumentation
 
 
 class ThreadedServer:
 
-    def __init__(self, processor):
-        self.request_handler = RequestHandler(processor)
+    def __init__(self, processor, scheduler=None):
+        self.request_handler = RequestHandler(processor, scheduler)
         self.runServer()
 
     def runServer(self):
@@ -32,20 +32,9 @@ def MakeHandlerClass(init_args):
 
     class Handler(BaseHTTPRequestHandler):
 
-        URL_BROWSER_VIEWS = {
-            "/raw": "getRaw",
-            "/dumpdata": "getRealtimeDatadump",
-            "/": "getStr",
-        }
-
-        URL_DATA_VIEWS = {
-            "/data_stores": "get_data_stores",
-            "/data_store_info": "get_data_store_info",
-            "/get_data": "get_data",
-            "/shift_info": "get_shift_info",
-            "/system_info": "get_system_info",
-            "/terminate": "terminate",
-        }
+        protocol_version = "HTTP/1.1"  # keep-alive; every response has a Content-Length or is chunked
+        disable_nagle_algorithm = True  # small chunks and the last chunk are not held back for the ACK of the client
+        timeout = Settings().webserver_keep_alive_seconds()  # an idle or stalled connection is closed after this
 
         def __init__(self, *args, **kwargs):
             super(Handler, self).__init__(*args, **kwargs)
@@ -53,37 +42,43 @@ def MakeHandlerClass(init_args):
         def do_HEAD(self):
             self.send_response(200)
             self.send_header("Content-type", "text/html")
+            self.send_header("Content-Length", "0")
             self.end_headers()
 
         def do_GET(self):
             """Respond to a GET request."""
             logging.debug(f"GET request: {self.path}")
-            parsed = parse.urlsplit(self.path)
-            self.send_response(200)
-            request_handler = self.init_args
-            if parsed.path in self.URL_DATA_VIEWS:
-                logging.debug(f"GET request is in URL_DATA_VIEWS")
-                self.send_header("Accept", "application/json")
+            self.send(self.init_args.handle_get(self.path, self.headers))
+            logging.debug(f"GET request completed")
+
+        def send(self, response: Response):
+            self.send_response(response.status)
+            self.send_header("Content-type", response.content_type)
+            for key, value in response.headers.items():
+                self.send_header(key, value)
+            if response.status == 304:  # no body, and no Content-Length of the empty body
                 self.end_headers()
-                view = getattr(request_handler, self.URL_DATA_VIEWS[parsed.path])
-                result = view(parsed.query)
-                logging.debug(f"result from do_GET {parsed.query}: {result}")
-                self.wfile.write(json.dumps(result).encode('utf-8'))
-            elif parsed.path in self.URL_BROWSER_VIEWS:
-                logging.debug(f"GET request is in URL_BROWSER_VIEWS")
-                self.send_header("Content-type", "text/html")
+            elif response.streamed:
+                self.send_header("Transfer-Encoding", "chunked")
                 self.end_headers()
-                self.wfile.write(b"<html><head><title>Power logger</title></head>")
-                self.wfile.write(b"<body><p>Erik Kouwenhoven, 2023</p>")
-                self.wfile.write(b"<p>You accessed path: %b</p>" % self.path.encode())
-                view = getattr(request_handler, self.URL_BROWSER_VIEWS[parsed.path])
-                result = view()
-                for line in result:
-                    self.wfile.write(line + b"<br>")
-                self.wfile.write(b"</body></html>")
+                chunks = response.iter_body()
+                try:
+                    for chunk in chunks:
+                        if chunk:
+                            self.wfile.write(b"%x\r\n%b\r\n" % (len(chunk), chunk))
+                            self.wfile.flush()
+                            instrumentation.count('http.body_bytes_sent', len(chunk))
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError, TimeoutError):
+                    logging.debug(f"Client disconnected during {self.path}")
+                    self.close_connection = True
+                finally:
+                    chunks.close()
             else:
-                logging.error(f"Invalid request {self.path}")
-            logging.debug(f"GET request completed")
+                self.send_header("Content-Length", str(len(response.body)))
+                self.end_headers()
+                self.wfile.write(response.body)
+                instrumentation.count('http.body_bytes_sent', len(response.body))
 
     Handler.init_args = init_args
     return Handler
@@ -0,0 +1,64 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Tuple, Any
+
+
+@dataclass
+class CoalescerCounters:
+    received: int = 0
+    forwarded: int = 0
+    suppressed: int = 0
+
+
+class ZWaveCoalescer:
+    """
+    Filters the stream of Z-Wave values per (node, value label). OpenZWave reports a reading both as value and as
+    value changed, and nodes repeat readings in bursts; only meaningful changes are forwarded:
+    - a value differing more than the deadband of its signal from the last forwarded value is forwarded at once
+    - an unchanged value (within the deadband) is forwarded at most once per window, so flat signals stay visible
+    Values that are not numeric are compared for equality.
+    """
+
+    def __init__(self, window_seconds: float, deadbands: Dict[str, float] = None):
+        self.window_seconds = window_seconds
+        self.deadbands = deadbands if deadbands else {}
+        self.last_forwarded: Dict[Tuple[int, str], Tuple[float, Any]] = {}  # (node, label): (monotonic time, value)
+        self.counters: Dict[Tuple[int, str], CoalescerCounters] = {}
+        self._lock = threading.Lock()
+
+    def accept(self, node_id: int, label: str, signal: str, value) -> bool:
+        """True when the value is to be forwarded"""
+        key = (node_id, label)
+        now = time.monotonic()
+        with self._lock:
+            if (counters := self.counters.get(key)) is None:
+                counters = self.counters[key] = CoalescerCounters()
+            counters.received += 1
+            if (last := self.last_forwarded.get(key)) is not None:
+                last_time, last_value = last
+                if now - last_time < self.window_seconds and not self.changed(signal, last_value, value):
+                    counters.suppressed += 1
+                    return False
+            self.last_forwarded[key] = (now, value)
+            counters.forwarded += 1
+            return True
+
+    def changed(self, signal: str, last_value, value) -> bool:
+        if isinstance(value, (int, float)) and isinstance(last_value, (int, float)) and \
+                not isinstance(value, bool) and not isinstance(last_value, bool):
+            return abs(value - last_value) > self.deadbands.get(signal, 0.0)
+        return value != last_value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            per_value = {f"{node_id}:{label}": counters.__dict__.copy()
+                         for (node_id, label), counters in self.counters.items()}
+        return {
+            "window_seconds": self.window_seconds,
+            "deadbands": self.deadbands,
+            "received": sum(counters["received"] for counters in per_value.values()),
+            "forwarded": sum(counters["forwarded"] for counters in per_value.values()),
+            "suppressed": sum(counters["suppressed"] for counters in per_value.values()),
+            "values": per_value,
+        }
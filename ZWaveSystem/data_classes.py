@@ -1,6 +1,6 @@
 from __future__ import annotations
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Any
 from openzwave.node import ZWaveNode
 from openzwave.value import ZWaveValue
 from enum import Enum, auto
@@ -55,9 +55,10 @@ class SampleZWave:
     """
         Contains one sample, i.e. a dict of Values
     """
-    def __init__(self, node_id: int, datatypes: List[DataTypeZWave]):
+    def __init__(self, node_id: int, datatypes: List[DataTypeZWave], data_store: str = None):
         self.timestamp = datetime.timestamp(datetime.now())
         self.node_id = node_id
+        self.data_store = data_store  # destination of the sample
         self.data: Dict[DataTypeZWave, ValueZWave] = {datatype: None for datatype in datatypes}
 
     def setValue(self, value: ValueZWave):
@@ -92,14 +93,30 @@ class SampleZWave:
         return res
 
     @classmethod
-    def from_zwave_data(cls, z_wave_node: ZWaveNode, z_wave_value: ZWaveValue):
+    def from_zwave_data(cls, z_wave_node: ZWaveNode, z_wave_value: ZWaveValue, data_store: str = None):
         data_type = DataTypeZWave.from_value_label(z_wave_value.label)
-        sample = cls(z_wave_node.node_id, [data_type])
+        sample = cls(z_wave_node.node_id, [data_type], data_store)
         value = ValueZWave(data_type)
         value.setValue(z_wave_value.data, z_wave_value.units)
         sample.setValue(value)
         return sample
 
+    def to_json(self) -> Dict[str, Any]:
+        return {"timestamp": self.timestamp, "node_id": self.node_id, "data_store": self.data_store,
+                "values": {data_type.name: [value.value, value.unit] if value else None
+                           for data_type, value in self.data.items()}}
+
+    @classmethod
+    def from_json(cls, obj: Dict[str, Any]) -> SampleZWave:
+        sample = cls(obj["node_id"], [DataTypeZWave[name] for name in obj["values"]], obj["data_store"])
+        sample.timestamp = obj["timestamp"]
+        for name, value_unit in obj["values"].items():
+            if value_unit is not None:
+                value = ValueZWave(DataTypeZWave[name])
+                value.setValue(*value_unit)
+                sample.setValue(value)
+        return sample
+
     def to_data_item_spec(self) -> DataItemSpec:
         result = self.get_data_types_units()
         return DataItemSpec(result)
@@ -1,10 +1,10 @@
 import logging
 import os
-import datetime
 from openzwave.network import ZWaveNetwork, ZWaveException
 from openzwave.option import ZWaveOption
 from pydispatch import dispatcher
 from Utils.settings import Settings
+from ZWaveSystem.value_journal import ValueJournal
 
 
 class NetworkInterface:
@@ -19,6 +19,11 @@ class NetworkInterface:
         valueReceivedCB(node, value) functie wordt aangeroepen als waarde binnenkomt
         """
         self.value_received_CB = value_received_cb
+        self.journal = ValueJournal(Settings().get_zwave_journal_file(),
+                                    max_bytes=Settings().get_zwave_journal_max_bytes(),
+                                    backup_count=Settings().get_zwave_journal_backup_count(),
+                                    queue_size=Settings().get_zwave_journal_queue_size(),
+                                    flush_seconds=Settings().get_zwave_journal_flush_seconds())
         self.network = self.init_network()
         if self.network:
             self.connect_dispatcher()
@@ -75,6 +80,4 @@ class NetworkInterface:
         print("Hello from node event : {}.".format( kwargs ))
 
     def show_result(self, node, value):
-        S = f'{datetime.datetime.now()}: {node.node_id} {value.label} ({value.value_id}) {value.data} {value.units}'
-        with open('output.txt', 'at') as file:
-            file.write(S + '\n')
+        self.journal.put(node.node_id, value.label, value.value_id, value.data, value.units)
@@ -0,0 +1,71 @@
+from __future__ import annotations
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Callable
+from Utils.settings import Settings
+from ZWaveSystem.data_classes import DataTypeZWave
+
+
+@dataclass(frozen=True)
+class ZWaveRoute:
+    """Destination of a subscribed (node, value label)"""
+    data_store: str
+    signal: str
+
+
+class ZWaveRoutingTable:
+    """
+    Maps (node_id, value label) on the data store and signal to write to. The table is built once from the
+    configuration; dispatch of an event is a single dict lookup.
+    A subscribed value without a configured route --a newly discovered node, or a node subscribed with the wildcard
+    node '*'-- gets a route to a new data store on its first event; new_route_CB is called to create that store.
+    Values that are not subscribed are remembered as such, so these cost a single lookup as well.
+    """
+
+    c_WILDCARD = '*'
+
+    def __init__(self, routes: Dict[Tuple[int, str], ZWaveRoute], subscriptions: Dict[object, List[str]],
+                 new_route_CB: Callable[[ZWaveRoute], None] = None):
+        self.routes: Dict[Tuple[int, str], Optional[ZWaveRoute]] = dict(routes)
+        self.subscriptions = subscriptions
+        self.new_route_CB = new_route_CB
+
+    @classmethod
+    def from_settings(cls, new_route_CB: Callable[[ZWaveRoute], None] = None) -> ZWaveRoutingTable:
+        routes = {}
+        for (node_id, label), data_store_id in Settings().get_zwave_routes().items():
+            routes[(node_id, label)] = ZWaveRoute(Settings().get_data_store_name(data_store_id),
+                                                  cls.signal_from_label(label))
+        return cls(routes, Settings().get_zwave_subscriptions(), new_route_CB)
+
+    @staticmethod
+    def signal_from_label(label: str) -> Optional[str]:
+        if (data_type := DataTypeZWave.from_value_label(label)) is not None:
+            return data_type.name
+
+    @staticmethod
+    def data_store_name(node_id: int, signal: str) -> str:
+        return f"zwave_node{node_id}_{signal.lower()}"
+
+    def lookup(self, node_id: int, label: str) -> Optional[ZWaveRoute]:
+        try:
+            return self.routes[(node_id, label)]
+        except KeyError:
+            return self.add_route(node_id, label)
+
+    def add_route(self, node_id: int, label: str) -> Optional[ZWaveRoute]:
+        route = None
+        if self.is_subscribed(node_id, label):
+            if (signal := self.signal_from_label(label)) is not None:
+                route = ZWaveRoute(self.data_store_name(node_id, signal), signal)
+                logging.info(f"New Z-Wave route: node {node_id} {label} -> {route.data_store}")
+                if self.new_route_CB:
+                    self.new_route_CB(route)
+            else:
+                logging.error(f"Z-Wave value label {label} of node {node_id} is not supported")
+        self.routes[(node_id, label)] = route
+        return route
+
+    def is_subscribed(self, node_id: int, label: str) -> bool:
+        return (label in self.subscriptions.get(node_id, []) or
+                label in self.subscriptions.get(self.c_WILDCARD, []))
@@ -0,0 +1,92 @@
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Optional, TextIO
+
+
+class ValueJournal:
+    """
+    Journal of received Z-Wave values, written by a background thread.
+    - the caller only puts an entry on a bounded queue; when the queue is full the entry is dropped and counted
+    - entries are written in batches, the file is flushed at most every flush interval
+    - the file is rotated when it exceeds the maximum size: output.txt -> output.txt.1 -> output.txt.2 ...
+    """
+
+    def __init__(self, filename: str, max_bytes: int, backup_count: int, queue_size: int, flush_seconds: float,
+                 batch_size: int = 100):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.num_written = 0
+        self.num_dropped = 0
+        self._file: Optional[TextIO] = None
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(name='zwave_journal', target=self.run, daemon=True)
+        self._thread.start()
+
+    def put(self, node_id: int, label: str, value_id: int, data, units: str):
+        """Called on the callback thread of the library, does not block"""
+        try:
+            self.queue.put_nowait((time.time(), node_id, label, value_id, data, units))
+        except queue.Full:
+            self.num_dropped += 1
+
+    @staticmethod
+    def format(entry: tuple) -> str:
+        timestamp, node_id, label, value_id, data, units = entry
+        return f'{datetime.fromtimestamp(timestamp)}: {node_id} {label} ({value_id}) {data} {units}\n'
+
+    def run(self):
+        last_flush = time.monotonic()
+        while not self._stop_event.is_set() or not self.queue.empty():
+            lines = []
+            try:
+                lines.append(self.format(self.queue.get(timeout=self.flush_seconds)))
+                while len(lines) < self.batch_size:
+                    lines.append(self.format(self.queue.get_nowait()))
+            except queue.Empty:
+                pass
+            try:
+                if lines:
+                    self.write(lines)
+                if self._file and (time.monotonic() - last_flush >= self.flush_seconds or self._stop_event.is_set()):
+                    self._file.flush()
+                    last_flush = time.monotonic()
+            except OSError as err:
+                logging.error(f"Z-Wave journal {self.filename}: {err}")
+                self.close_file()
+        self.close_file()
+
+    def write(self, lines):
+        if self._file is None:
+            self._file = open(self.filename, 'at')
+        self._file.write(''.join(lines))
+        self.num_written += len(lines)
+        if self._file.tell() >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        self.close_file()
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f"{self.filename}.{i}"):
+                os.replace(f"{self.filename}.{i}", f"{self.filename}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.filename, f"{self.filename}.1")
+        else:
+            os.remove(self.filename)
+
+    def close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stop(self):
+        """Writes the remaining entries and stops the thread"""
+        self._stop_event.set()
+        self._thread.join()
@@ -1,38 +1,136 @@
 from __future__ import annotations
+import json
 import logging
+import os
+import queue
+import threading
+import time
+from Utils.settings import Settings
+from Utils.instrumentation import instrumentation
 from ZWaveSystem.network_interface import NetworkInterface
 from ZWaveSystem.data_classes import SampleZWave
-from typing import Dict, List, Optional
+from ZWaveSystem.routing_table import ZWaveRoutingTable, ZWaveRoute
+from ZWaveSystem.coalescer import ZWaveCoalescer
+from typing import Optional, List, Dict, Any, Union
 
 
 class ZWaveInterface:
+    """
+    Values arrive on the notification thread of the OpenZWave library. That thread only routes and filters a value
+    and puts the sample on a queue; a worker thread takes the samples off the queue in batches, in order of arrival,
+    and hands them to the processor for storage. New routes travel through the same queue, so the data store of a
+    route exists before its first sample is stored.
+    When storing fails, the items not yet processed are retried, up to max_attempts in all; then the samples are
+    written to the pending file, and put on the queue again, before any new value, on the next start. A retried
+    group of samples may be stored partly twice, rather than lost.
+    """
 
     def __init__(self):
-        self.post_sample_CB = None
+        self.post_samples_CB = None
+        self.new_route_CB = None
+        self.routing_table: Optional[ZWaveRoutingTable] = None  # routes of the node-values that are called back
+        self.coalescer = ZWaveCoalescer(Settings().get_zwave_coalesce_window_seconds(), Settings().get_zwave_deadbands())
+        self.batch_size = Settings().get_zwave_worker_batch_size()
+        self.max_attempts = Settings().get_zwave_worker_max_attempts()
+        self.retry_seconds = Settings().get_zwave_worker_retry_seconds()
+        self.pending_file = Settings().get_zwave_pending_file()
+        self.queue: queue.Queue = queue.Queue()  # unbounded, no sample is dropped
+        self.num_processed = 0
+        self.worker = threading.Thread(name='zwave_worker', target=self.run, daemon=True)
         self.network_interface = NetworkInterface(self.value_received_CB)
-        self.sample: Optional[SampleZWave] = None
-        self.subscriptions: Optional[Dict[int, List[str]]] = None  # registered node-valueIDs that are called back
 
-    def register(self, subscriptions: Optional[Dict[int, List[str]]], post_sample_CB=None):
-        self.post_sample_CB = post_sample_CB
-        self.subscriptions = subscriptions
+    def register(self, routing_table: ZWaveRoutingTable, post_samples_CB=None, new_route_CB=None):
+        for item in self.load_pending():
+            self.queue.put(item)
+        self.post_samples_CB = post_samples_CB
+        self.new_route_CB = new_route_CB
+        self.routing_table = routing_table
+        self.routing_table.new_route_CB = self.queue.put
+        if not self.worker.is_alive():
+            self.worker.start()
 
     def value_received_CB(self, zWaveNode, zWaveValue):
-        logging.info(f'valueReceived callback from network: node={zWaveNode.node_id}, parent_id {zWaveValue.parent_id}, value={zWaveValue.data} {zWaveValue.units} ({zWaveValue.label}, {zWaveValue.value_id})')
-        if self.post_sample_CB:
-            if zWaveNode.node_id in self.subscriptions:
-                if zWaveValue.label in self.subscriptions[zWaveNode.node_id]:
-                    self.sample = SampleZWave.from_zwave_data(zWaveNode, zWaveValue)
-                    self.post_sample_CB()
-                else:
-                    logging.debug(f'Niet geregistreerd: value {zWaveValue.label} zit niet in {self.subscriptions[zWaveNode.node_id]}')
+        logging.debug(f'valueReceived callback from network: node={zWaveNode.node_id}, parent_id {zWaveValue.parent_id}, value={zWaveValue.data} {zWaveValue.units} ({zWaveValue.label}, {zWaveValue.value_id})')
+        if self.post_samples_CB:
+            if route := self.routing_table.lookup(zWaveNode.node_id, zWaveValue.label):
+                if self.coalescer.accept(zWaveNode.node_id, zWaveValue.label, route.signal, zWaveValue.data):
+                    self.queue.put(SampleZWave.from_zwave_data(zWaveNode, zWaveValue, data_store=route.data_store))
             else:
-                logging.debug(f'Niet geregistreerd: node {zWaveNode.node_id} zit niet in {self.subscriptions}')
+                logging.debug(f'Niet geregistreerd: node {zWaveNode.node_id} value {zWaveValue.label}')
         else:
-            logging.debug('Geen post_sample_CB')
+            logging.debug('Geen post_samples_CB')
+
+    def run(self):
+        items = []
+        attempts = 0
+        while True:
+            if not items:
+                items = [self.queue.get()]
+                attempts = 0
+                while len(items) < self.batch_size:
+                    try:
+                        items.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+            try:
+                with instrumentation.stage('zwave.batch'):
+                    self.process(items)
+            except Exception as err:
+                attempts += 1
+                if attempts < self.max_attempts:
+                    logging.warning(f"Z-Wave worker: {len(items)} items not processed, attempt {attempts}: {err}")
+                    instrumentation.count('zwave.batch_retries')
+                    time.sleep(self.retry_seconds)
+                else:
+                    logging.error(f"Z-Wave worker: {len(items)} items not processed after {attempts} attempts: {err}")
+                    self.save_pending(items)
+                    items = []
 
-    def getSample(self) -> SampleZWave:
-        return self.sample
+    def process(self, items: List[Union[SampleZWave, ZWaveRoute]]):
+        """
+        Hands the items to the processor in order: the samples up to the next route at once, the routes one by one.
+        Processed items are removed from the front of items, so after an error items holds the unprocessed ones.
+        """
+        while items:
+            if isinstance(items[0], ZWaveRoute):
+                if self.new_route_CB:
+                    self.new_route_CB(items[0])
+                end = 1
+            else:
+                end = next((idx for idx, item in enumerate(items) if isinstance(item, ZWaveRoute)), len(items))
+                self.post_samples_CB(items[:end])
+            del items[:end]
+            self.num_processed += end
 
+    def save_pending(self, items: List[Union[SampleZWave, ZWaveRoute]]):
+        """Appends the samples to the pending file, the routes are made again from the samples when loaded"""
+        samples = [item for item in items if isinstance(item, SampleZWave)]
+        try:
+            with open(self.pending_file, 'at') as f:
+                f.writelines(json.dumps(sample.to_json()) + '\n' for sample in samples)
+            instrumentation.count('zwave.samples_pending', len(samples))
+        except (OSError, TypeError, ValueError):
+            logging.exception(f"Z-Wave worker: {len(samples)} samples discarded, not written to {self.pending_file}")
+            instrumentation.count('zwave.items_discarded', len(samples))
 
+    def load_pending(self) -> List[Union[SampleZWave, ZWaveRoute]]:
+        """The samples of the pending file, each data store preceded by its route; the file is removed"""
+        try:
+            with open(self.pending_file) as f:
+                samples = [SampleZWave.from_json(json.loads(line)) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+        os.remove(self.pending_file)
+        logging.info(f"Z-Wave: {len(samples)} pending samples from {self.pending_file} queued")
+        items = []
+        routes = set()
+        for sample in samples:
+            for signal in sample.get_data_types():
+                if (route := ZWaveRoute(sample.data_store, signal)) not in routes:
+                    routes.add(route)
+                    items.append(route)
+            items.append(sample)
+        return items
 
+    def stats(self) -> Dict[str, Any]:
+        return {"queue_size": self.queue.qsize(), "processed": self.num_processed, **self.coalescer.stats()}
@@ -0,0 +1,53 @@
+import json
+from types import SimpleNamespace
+import pytest
+from DataHolder.buffer_attrs import Persistency, LifeSpan
+from DataHolder.data_item import DataItem
+from DataHolder.data_store import DataStore
+from DataHolder.storage import CircularMemStorage
+
+
+class MemDataHolder:
+    """Data stores in memory, with the part of the DataHolder interface the request handler uses"""
+
+    def __init__(self, buf_len: int):
+        self.data_stores_version = 0
+        self.stores = {}
+        for name in ('real_time', 'solar'):
+            data_store = DataStore(name, Persistency.Volatile, LifeSpan.Circular, ['VALUE'], buf_len=buf_len)
+            data_store.data = CircularMemStorage(buf_len, data_store.signals)
+            self.stores[name] = data_store
+
+    def data_store(self, name):
+        return self.stores.get(name)
+
+    def add_listener(self, listener):
+        pass
+
+    def add(self, name: str, timestamp: float, value: float):
+        storage = self.stores[name].data
+        data_item = DataItem(storage.data_item_spec, timestamp=timestamp)
+        data_item.set_value('VALUE', value)
+        storage.add_data_item(data_item)
+
+
+@pytest.fixture
+def data_holder():
+    return MemDataHolder(buf_len=10)
+
+
+@pytest.fixture
+def handler(data_holder):
+    pytest.importorskip('openzwave')  # imported by the processor the request handler refers to
+    from WebServer.request_handler import RequestHandler
+    return RequestHandler(SimpleNamespace(data_holder=data_holder, zwave_interface=None))
+
+
+@pytest.fixture
+def get(handler):
+    def get(path: str, **headers):
+        """Response to the GET request, with the body read and decoded as json if it is a 200"""
+        response = handler.handle_get(path, {name.replace('_', '-'): value for name, value in headers.items()})
+        body = b"".join(response.iter_body())
+        return response, json.loads(body) if response.status == 200 else body
+    return get
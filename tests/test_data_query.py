@@ -0,0 +1,26 @@
+from types import SimpleNamespace
+from DataHolder.data_item import DataItem
+from DataHolder.storage import CircularMemStorage, c_TIMESTAMP
+from WebServer.data_query import DataQuery
+
+
+def add(storage, timestamp: float):
+    data_item = DataItem(storage.data_item_spec, timestamp=timestamp)
+    data_item.set_value('VALUE', timestamp * 10)
+    storage.add_data_item(data_item)
+
+
+def test_columns_leave_out_items_written_after_the_range_was_fixed():
+    storage = CircularMemStorage(10, ['VALUE'])
+    for timestamp in range(15):
+        add(storage, float(timestamp))
+    query = DataQuery(SimpleNamespace(data=storage), ['VALUE'])
+    indexes = query.indexes()
+    last_time, _ = storage.cursor(indexes[1])
+    for timestamp in range(15, 18):  # overwrites the 3 oldest items of the range
+        add(storage, float(timestamp))
+    columns, length = query.columns(*indexes, last_time)
+    timestamps = [value for block in columns[c_TIMESTAMP] for value in block]
+    values = [value for block in columns['VALUE'] for value in block]
+    assert timestamps == [float(timestamp) for timestamp in range(8, 15)] and length == len(timestamps)
+    assert values == [timestamp * 10 for timestamp in timestamps]
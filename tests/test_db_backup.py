@@ -0,0 +1,54 @@
+import os
+import sqlite3
+import pytest
+from DataHolder.db_backup import DatabaseBackup, BackupError
+
+
+@pytest.fixture
+def backup(tmp_path):
+    db_file_name = str(tmp_path / 'power.db')
+    con = sqlite3.connect(db_file_name)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("CREATE TABLE real_time (timestamp int, SOLAR real)")
+    con.executemany("INSERT INTO real_time VALUES (?, ?)", [(t, t * 0.5) for t in range(5000)])
+    con.commit()
+    yield DatabaseBackup(db_file_name, str(tmp_path / 'backup'), keep=2, pages_per_step=8, step_pause_seconds=0)
+    con.close()
+
+
+def test_backup_copies_the_database(backup):
+    name = backup.run()
+    assert sorted(os.listdir(backup.backup_dir)) == [os.path.basename(name), os.path.basename(name) + '.sha256']
+    con = sqlite3.connect(name)
+    assert con.execute("SELECT COUNT(*), SUM(SOLAR) FROM real_time").fetchone() == (5000, sum(range(5000)) * 0.5)
+    con.close()
+
+
+def test_checksum_is_verified(backup):
+    name = backup.run()
+    backup.verify(name)
+    with open(name, 'r+b') as f:
+        f.seek(-1, os.SEEK_END)
+        f.write(b'\x01')
+    with pytest.raises(BackupError):
+        backup.verify(name)
+
+
+def test_rotation_keeps_the_newest(backup):
+    os.makedirs(backup.backup_dir)
+    old = [os.path.join(backup.backup_dir, f"power-2020010{day}-031500.db") for day in (1, 2)]
+    for name in old:
+        for file_name in (name, name + '.sha256'):
+            open(file_name, 'w').close()
+    name = backup.run()
+    assert backup.backups() == [old[1], name]
+    assert not os.path.exists(old[0] + '.sha256')
+
+
+def test_failed_integrity_check_leaves_no_backup(backup, monkeypatch):
+    def fail(file_name):
+        raise BackupError(f"Integrity check of {file_name} failed")
+    monkeypatch.setattr(DatabaseBackup, 'check_integrity', staticmethod(fail))
+    with pytest.raises(BackupError):
+        backup.run()
+    assert os.listdir(backup.backup_dir) == []
@@ -0,0 +1,39 @@
+from datetime import datetime
+import pytest
+from Application.energy import EnergyIntegrator
+from DataHolder.data_item import DataItem, DataItemSpec
+from DataHolder.energy_store import EnergyStore
+
+c_START = datetime(2026, 3, 2, 12, 0).timestamp()
+c_DAY = '2026-03-02'
+
+
+def integrate(gap_rule: str, samples) -> float:
+    store = EnergyStore(':memory:')
+    integrator = EnergyIntegrator(store, ['SOLAR'], max_gap_seconds=60, gap_rule=gap_rule, flush_seconds=3600)
+    for seconds, watts in samples:
+        data_item = DataItem(DataItemSpec({'SOLAR': 'W'}), timestamp=c_START + seconds)
+        data_item.set_value('SOLAR', watts)
+        integrator.add(data_item, tariff=1)
+    return store.get_day(c_DAY)['1']['SOLAR']
+
+
+@pytest.mark.parametrize('gap_rule, gap_energy', [('skip', 0.0), ('hold', 2.0 * 600), ('linear', 2.5 * 600)])
+def test_gap_rules(gap_rule, gap_energy):
+    # 10 s at 1 to 2 kW, then a gap of 600 s from 2 to 3 kW
+    energy = integrate(gap_rule, [(0, 1000.0), (10, 2000.0), (610, 3000.0)])
+    assert energy == pytest.approx((1.5 * 10 + gap_energy) / 3600)
+
+
+def test_interval_up_to_max_gap_is_not_a_gap():
+    assert integrate('skip', [(0, 1000.0), (60, 3000.0)]) == pytest.approx(2.0 * 60 / 3600)
+
+
+def test_sample_not_later_than_the_previous_is_ignored():
+    assert integrate('linear', [(0, 1000.0), (10, 1000.0), (10, 5000.0), (5, 5000.0), (20, 1000.0)]) == \
+        pytest.approx(1.0 * 20 / 3600)
+
+
+def test_unknown_gap_rule():
+    with pytest.raises(ValueError):
+        EnergyIntegrator(EnergyStore(':memory:'), ['SOLAR'], max_gap_seconds=60, gap_rule='zero', flush_seconds=1)
@@ -0,0 +1,17 @@
+def test_etag_gets_304_until_the_data_store_changes(data_holder, get):
+    data_holder.add('real_time', 1.0, 10)
+    path = "/get_data?data_store_name=real_time&signals=VALUE"
+    response, _ = get(path)
+    etag = response.headers["ETag"]
+    response, _ = get(path, If_None_Match=etag)
+    assert response.status == 304 and response.headers["ETag"] == etag
+    data_holder.add('real_time', 2.0, 20)
+    response, body = get(path, If_None_Match=etag)
+    assert response.status == 200 and response.headers["ETag"] != etag and body["VALUE"] == [10, 20]
+
+
+def test_etag_differs_per_query(data_holder, get):
+    data_holder.add('real_time', 1.0, 10)
+    response, _ = get("/get_data?data_store_name=real_time&signals=VALUE")
+    other, _ = get("/get_data?data_store_name=real_time&signals=VALUE&from=1")
+    assert response.headers["ETag"] != other.headers["ETag"]
@@ -0,0 +1,44 @@
+import json
+from urllib import parse
+
+
+def batch_path(queries, **args) -> str:
+    return "/get_batch?" + "&".join([f"queries={parse.quote(json.dumps(queries))}"] +
+                                    [f"{name}={value}" for name, value in args.items()])
+
+
+def test_grid_aligns_the_queries(data_holder, get):
+    for timestamp, value in ((0.0, 1.0), (4.0, 3.0), (12.0, 5.0)):
+        data_holder.add('real_time', timestamp, value)
+    data_holder.add('solar', 6.0, 100.0)
+    queries = [{"data_store_name": "real_time", "signals": ["VALUE"]}, {"data_store_name": "solar"}]
+    response, body = get(batch_path(queries, grid=5))
+    assert response.status == 200
+    assert body["grid"] == {"start": 0.0, "step": 5.0} and body["timestamp"] == [0.0, 5.0, 10.0]
+    assert body["queries"][0]["VALUE"] == [2.0, None, 5.0]
+
+
+def test_grid_size_is_limited_before_the_data_is_read(handler, data_holder, get, monkeypatch):
+    from WebServer.data_query import DataQuery
+
+    def read(query):
+        raise AssertionError("data read for a grid over the limit")
+
+    monkeypatch.setattr(DataQuery, 'read', read)
+    data_holder.add('real_time', 0.0, 1.0)
+    step = 10.0
+    to_time = step * handler.c_MAX_GRID_POINTS  # one point more than the limit
+    response, body = get(batch_path([{"data_store_name": "real_time", "to": to_time}], grid=step))
+    assert response.status == 400 and b"more than" in body
+
+
+def test_grid_at_the_limit(handler, data_holder, get):
+    data_holder.add('real_time', 0.0, 1.0)
+    to_time = handler.c_MAX_GRID_POINTS - 1.0
+    response, body = get(batch_path([{"data_store_name": "real_time", "to": to_time}], grid=1))
+    assert response.status == 200 and len(body["timestamp"]) == handler.c_MAX_GRID_POINTS
+
+
+def test_number_of_queries_is_limited(handler, get):
+    response, _ = get(batch_path([{"data_store_name": "real_time"}] * (handler.c_MAX_BATCH_QUERIES + 1)))
+    assert response.status == 400
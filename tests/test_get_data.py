@@ -0,0 +1,31 @@
+def get_data(get, query: str):
+    response, body = get(f"/get_data?data_store_name=real_time&signals=VALUE&{query}")
+    assert response.status == 200
+    return body
+
+
+def test_since_cursor_delivers_items_with_an_equal_timestamp(data_holder, get):
+    for timestamp, value in ((1.0, 10), (2.0, 20), (2.0, 21)):
+        data_holder.add('real_time', timestamp, value)
+    body = get_data(get, "since=1")
+    assert body["VALUE"] == [20, 21] and body["cursor"] == "2.0_2" and body["reset"] is False
+    data_holder.add('real_time', 2.0, 22)  # stored later with the timestamp of the cursor
+    data_holder.add('real_time', 3.0, 30)
+    body = get_data(get, f"since={body['cursor']}")
+    assert body["VALUE"] == [22, 30] and body["cursor"] == "3.0_1"
+
+
+def test_since_cursor_without_new_items_is_unchanged(data_holder, get):
+    data_holder.add('real_time', 1.0, 10)
+    body = get_data(get, "since=1.0_1")
+    assert body["timestamp"] == [] and body["cursor"] == "1.0_1" and body["reset"] is False
+
+
+def test_reset_when_items_after_the_cursor_were_overwritten(data_holder, get):
+    for timestamp in range(1, 6):
+        data_holder.add('real_time', float(timestamp), timestamp)
+    cursor = get_data(get, "since=0")["cursor"]
+    for timestamp in range(6, 20):  # the buffer holds 10 items
+        data_holder.add('real_time', float(timestamp), timestamp)
+    body = get_data(get, f"since={cursor}")
+    assert body["reset"] is True and body["timestamp"] == [float(timestamp) for timestamp in range(10, 20)]
@@ -0,0 +1,42 @@
+from Application.pipeline import Diff, Resample, Pipeline
+
+
+def run(operator, samples):
+    return [out for timestamp, value in samples for out in operator.process(timestamp, value)]
+
+
+def test_diff_timestamped_at_end():
+    assert run(Diff(), [(10.0, 1.0), (20.0, 4.0), (30.0, 4.5)]) == [(20.0, 3.0), (30.0, 0.5)]
+
+
+def test_diff_timestamped_at_start():
+    assert run(Diff(timestamp='start'), [(10.0, 1.0), (20.0, 4.0), (30.0, 4.5)]) == [(10.0, 3.0), (20.0, 0.5)]
+
+
+def test_resample_emits_a_period_when_a_later_period_starts():
+    operator = Resample(60.0)
+    assert run(operator, [(0.0, 1.0), (30.0, 3.0)]) == []
+    assert operator.process(60.0, 10.0) == [(0.0, 2.0)]
+
+
+def test_resample_leaves_out_empty_periods():
+    assert run(Resample(60.0, how='max'), [(10.0, 1.0), (20.0, 5.0), (200.0, 2.0), (250.0, 0.0)]) == \
+        [(0.0, 5.0), (180.0, 2.0)]
+
+
+def test_resample_aggregates():
+    samples = [(0.0, 2.0), (10.0, -1.0), (20.0, 4.0), (60.0, 0.0)]
+    assert run(Resample(60.0, how='sum'), samples) == [(0.0, 5.0)]
+    assert run(Resample(60.0, how='min'), samples) == [(0.0, -1.0)]
+    assert run(Resample(60.0, how='last'), samples) == [(0.0, 4.0)]
+
+
+def test_pipeline_feeds_stages_in_order():
+    pipeline = Pipeline('test', 'real_time', 'CUMULATIVE_GAS')
+    pipeline.add_stage('diff', Diff(), Pipeline.c_SOURCE)
+    pipeline.add_stage('hourly', Resample(3600.0, how='sum'), 'diff')
+    output = []
+    pipeline.add_sink('hourly', lambda timestamp, value: output.append((timestamp, value)))
+    for timestamp, value in [(0.0, 100.0), (1800.0, 101.0), (3000.0, 101.5), (3700.0, 102.0), (7300.0, 103.0)]:
+        pipeline.push(timestamp, value)
+    assert output == [(0.0, 1.5), (3600.0, 0.5)]